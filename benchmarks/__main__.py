@@ -0,0 +1,138 @@
+"""
+Run the benchmarks and write JSON results that can be compared across commits:
+
+    python -m benchmarks run --scale 1000 --scale 100000 --output results.json
+    python -m benchmarks compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from os.path import dirname, join
+
+ROOT_DIR = dirname(dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [1000, 10000]
+# result keys that identify a measurement, the rest are measured values
+PARAMETER_KEYS = ("mode", "lookups", "batch_size", "change_ratio", "update_engine")
+
+
+def _setup_django():
+    sys.path[:0] = [
+        ROOT_DIR,
+        join(ROOT_DIR, "src"),
+        join(ROOT_DIR, "tests", "django_project"),
+    ]
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+    import django
+
+    django.setup()
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    _setup_django()
+
+    import django
+    from django.conf import settings
+    from django.db import connections
+
+    from .cases import BENCHMARKS
+    from .datasets import create_dataset, is_available, setup_database
+
+    results = []
+    for using in args.database or list(settings.DATABASES):
+        if not is_available(using):
+            print(f"Skipping unavailable database {using}", file=sys.stderr)
+            continue
+
+        for scale in args.scale or DEFAULT_SCALES:
+            print(f"Creating {scale} rows on {using}", file=sys.stderr)
+            setup_database(using)
+            create_dataset(scale, using)
+
+            for name in args.benchmark or list(BENCHMARKS):
+                print(f"Running {name} at {scale} on {using}", file=sys.stderr)
+                for result in BENCHMARKS[name](scale, using, args.repeat):
+                    results.append(
+                        dict(
+                            benchmark=name,
+                            database=connections[using].vendor,
+                            scale=scale,
+                            **result,
+                        )
+                    )
+
+    output = {
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+def _key(result):
+    return (result["benchmark"], result["database"], result["scale"]) + tuple(
+        result.get(key) for key in PARAMETER_KEYS
+    )
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = {_key(result): result for result in json.load(f)["results"]}
+    with open(args.after) as f:
+        after = json.load(f)["results"]
+
+    for result in after:
+        previous = before.get(_key(result))
+        if not (previous and previous.get("seconds") and result.get("seconds")):
+            continue
+
+        ratio = result["seconds"] / previous["seconds"]
+        name = " ".join(str(part) for part in _key(result) if part is not None)
+        queries = ""
+        if result.get("num_queries") != previous.get("num_queries"):
+            queries = f" queries {previous['num_queries']} -> {result['num_queries']}"
+        print(f"{name}: {ratio:.2f}x{queries}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--scale", type=int, action="append")
+    run_parser.add_argument("--database", action="append")
+    run_parser.add_argument("--benchmark", action="append")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--output")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import time
+from itertools import product
+
+from django.db import DatabaseError, transaction
+
+from app.models import Profile, Restaurant
+from django_orm_plus._fetch_recorder import count_queries
+from django_orm_plus._fetch_related import fetch_related
+
+MAX_ACCESS_OBJECTS = 10000
+MAX_FETCH_OBJECTS = 1000
+MAX_UPSERT_OBJECTS = 5000
+PLAN_BUILD_ITERATIONS = 200
+MANAGER_ACCESS_ITERATIONS = 100000
+
+FETCH_RELATED_LOOKUPS = {
+    "foreign_key": ["location"],
+    "many_to_many": ["pizzas"],
+    "nested": ["location", "pizzas__toppings", "best_pizza__toppings"],
+}
+UPSERT_BATCH_SIZES = [100, 1000]
+UPSERT_CHANGE_RATIOS = [0.0, 0.1, 1.0]
+UPSERT_UPDATE_ENGINES = ["values", "bulk_update"]
+
+
+def best_of(repeat, func):
+    """
+    :return: The fastest of `repeat` runs of `func` in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _access_attributes(getattr_, restaurants):
+    for restaurant in restaurants:
+        getattr_(restaurant, "location_id")
+        getattr_(restaurant, "created_at")
+        getattr_(restaurant, "location")
+        getattr_(restaurant, "pizzas").all()
+
+
+def bench_attribute_access(scale, using, repeat):
+    """
+    Attribute access on loaded objects, where plain Django is
+    `object.__getattribute__` since models don't override it
+    """
+    qs = (
+        Restaurant.objects.using(using)
+        .select_related("location")
+        .prefetch_related("pizzas")
+        .order_by("pk")[:MAX_ACCESS_OBJECTS]
+    )
+    modes = {
+        "django": (object.__getattribute__, list(qs)),
+        "orm_plus": (getattr, list(qs)),
+        "strict": (getattr, list(qs.strict())),
+    }
+
+    for mode, (getattr_, restaurants) in modes.items():
+        yield {
+            "mode": mode,
+            "num_objects": len(restaurants),
+            "seconds": best_of(
+                repeat, lambda: _access_attributes(getattr_, restaurants)
+            ),
+        }
+
+
+def _access_manager_attributes(manager):
+    for _ in range(MANAGER_ACCESS_ITERATIONS):
+        manager.model
+        manager.db
+        manager.get_queryset
+
+
+def bench_manager_access(scale, using, repeat):
+    """
+    Attribute access on managers, where `Profile` has a plain Django manager
+    """
+    restaurant = Restaurant.objects.using(using).strict().first()
+    modes = {
+        "django": Profile.objects.db_manager(using),
+        "orm_plus": Restaurant.objects.db_manager(using),
+        "strict_related": restaurant.pizzas,
+    }
+
+    for mode, manager in modes.items():
+        yield {
+            "mode": mode,
+            "num_accesses": MANAGER_ACCESS_ITERATIONS,
+            "seconds": best_of(repeat, lambda: _access_manager_attributes(manager)),
+        }
+
+
+def bench_fetch_related(scale, using, repeat):
+    for name, lookups in FETCH_RELATED_LOOKUPS.items():
+        qs = Restaurant.objects.using(using).order_by("pk")
+
+        plan_seconds = best_of(
+            repeat,
+            lambda: [fetch_related(qs, lookups) for _ in range(PLAN_BUILD_ITERATIONS)],
+        )
+
+        def evaluate():
+            list(fetch_related(qs, lookups)[:MAX_FETCH_OBJECTS])
+
+        with count_queries(using) as counter:
+            evaluate()
+
+        yield {
+            "lookups": name,
+            "num_objects": min(scale, MAX_FETCH_OBJECTS),
+            "plan_build_seconds": plan_seconds / PLAN_BUILD_ITERATIONS,
+            "num_queries": counter.count,
+            "seconds": best_of(repeat, evaluate),
+        }
+
+
+def _upsert_objects(using, change_ratio):
+    restaurants = list(
+        Restaurant.objects.using(using)
+        .order_by("pk")
+        .values_list("location_id", "best_pizza_id")[:MAX_UPSERT_OBJECTS]
+    )
+    pizza_ids = [pizza_id for _, pizza_id in restaurants]
+    num_changed = int(len(restaurants) * change_ratio)
+
+    return [
+        Restaurant(
+            location_id=location_id,
+            best_pizza_id=pizza_ids[i - 1] if i < num_changed else pizza_id,
+        )
+        for i, (location_id, pizza_id) in enumerate(restaurants)
+    ]
+
+
+def bench_bulk_update_or_create(scale, using, repeat):
+    for change_ratio in UPSERT_CHANGE_RATIOS:
+        objs = _upsert_objects(using, change_ratio)
+
+        for batch_size, update_engine in product(
+            UPSERT_BATCH_SIZES, UPSERT_UPDATE_ENGINES
+        ):
+
+            def upsert():
+                with transaction.atomic(using=using):
+                    Restaurant.objects.using(using).bulk_update_or_create(
+                        objs,
+                        lookup_fields=["location_id"],
+                        update_fields=["best_pizza_id"],
+                        batch_size=batch_size,
+                        update_engine=update_engine,
+                    )
+                    transaction.set_rollback(True, using=using)
+
+            result = {
+                "batch_size": batch_size,
+                "change_ratio": change_ratio,
+                "update_engine": update_engine,
+                "num_objects": len(objs),
+            }
+            try:
+                with count_queries(using) as counter:
+                    upsert()
+            except DatabaseError as e:
+                # eg. the lookup query being too large for the backend
+                yield dict(result, error=str(e))
+                continue
+
+            seconds = best_of(repeat, upsert)
+            yield dict(
+                result,
+                num_queries=counter.count,
+                seconds=seconds,
+                rows_per_second=len(objs) / seconds if seconds else None,
+            )
+
+
+BENCHMARKS = {
+    "attribute_access": bench_attribute_access,
+    "manager_access": bench_manager_access,
+    "fetch_related": bench_fetch_related,
+    "bulk_update_or_create": bench_bulk_update_or_create,
+}
@@ -0,0 +1,84 @@
+from django.core.management import call_command
+from django.db import connections
+
+from app.models import Location, Pizza, Restaurant, Topping
+from tests.factories import LocationFactory, ToppingFactory
+
+INSERT_BATCH_SIZE = 5000
+PIZZAS_PER_RESTAURANT = 3
+TOPPINGS_PER_PIZZA = 3
+
+
+def setup_database(using):
+    call_command("migrate", database=using, run_syncdb=True, verbosity=0)
+    call_command("flush", database=using, interactive=False, verbosity=0)
+
+
+def is_available(using):
+    try:
+        connections[using].ensure_connection()
+    except Exception:
+        return False
+    return True
+
+
+def _bulk_create(model, objs, using):
+    return model.objects.using(using).bulk_create(objs, batch_size=INSERT_BATCH_SIZE)
+
+
+def _ids(model, using):
+    return list(model.objects.using(using).order_by("pk").values_list("pk", flat=True))
+
+
+def _pick(ids, start, count):
+    return [ids[(start + i) % len(ids)] for i in range(count)]
+
+
+def create_dataset(scale, using):
+    """
+    Create `scale` restaurants, each with its own location and three pizzas
+    out of `scale` pizzas which have three toppings each
+    """
+    num_toppings = max(scale // 10, TOPPINGS_PER_PIZZA)
+
+    toppings = ToppingFactory.build_batch(num_toppings)
+    for topping in toppings:
+        topping.name = topping.name[: Topping._meta.get_field("name").max_length]
+    _bulk_create(Topping, toppings, using)
+    _bulk_create(Location, LocationFactory.build_batch(scale), using)
+    _bulk_create(Pizza, [Pizza(name=f"Pizza {i}") for i in range(scale)], using)
+
+    topping_ids = _ids(Topping, using)
+    location_ids = _ids(Location, using)
+    pizza_ids = _ids(Pizza, using)
+
+    _bulk_create(
+        Pizza.toppings.through,
+        [
+            Pizza.toppings.through(pizza_id=pizza_id, topping_id=topping_id)
+            for i, pizza_id in enumerate(pizza_ids)
+            for topping_id in _pick(
+                topping_ids, i * TOPPINGS_PER_PIZZA, TOPPINGS_PER_PIZZA
+            )
+        ],
+        using,
+    )
+    _bulk_create(
+        Restaurant,
+        [
+            Restaurant(location_id=location_id, best_pizza_id=pizza_id)
+            for location_id, pizza_id in zip(location_ids, pizza_ids)
+        ],
+        using,
+    )
+    _bulk_create(
+        Restaurant.pizzas.through,
+        [
+            Restaurant.pizzas.through(restaurant_id=restaurant_id, pizza_id=pizza_id)
+            for i, restaurant_id in enumerate(_ids(Restaurant, using))
+            for pizza_id in _pick(
+                pizza_ids, i * PIZZAS_PER_RESTAURANT, PIZZAS_PER_RESTAURANT
+            )
+        ],
+        using,
+    )
@@ -0,0 +1,22 @@
+import os
+
+from tests.django_project.settings import *  # noqa: F401,F403
+from tests.django_project.settings import DATABASES
+
+# PostgreSQL is benchmarked when psycopg2 is installed and the database
+# can be connected to. The database is flushed before every scale.
+try:
+    import psycopg2  # noqa: F401
+except ImportError:
+    pass
+else:
+    DATABASES["postgres"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("BENCHMARK_POSTGRES_DB", "django_orm_plus_benchmark"),
+        "USER": os.environ.get("PGUSER", ""),
+        "PASSWORD": os.environ.get("PGPASSWORD", ""),
+        "HOST": os.environ.get("PGHOST", "localhost"),
+        "PORT": os.environ.get("PGPORT", ""),
+    }
+
+DEBUG = False
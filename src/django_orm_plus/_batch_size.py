@@ -0,0 +1,111 @@
+import time
+
+from django.db import connections
+
+from ._config import config
+
+
+BATCH_SIZE_AUTO = "auto"
+# Django only knows the parameter limits of SQLite and Oracle
+MAX_QUERY_PARAMS = {"postgresql": 65535, "mysql": 65535}
+DEFAULT_MAX_QUERY_PARAMS = 999
+# rows used to estimate the size of a statement
+SAMPLE_SIZE = 100
+# keys per lookup statement, as the parameter limits of PostgreSQL and MySQL
+# allow lookups that take longer to compile and plan than to run
+MAX_LOOKUP_SIZE = 1000
+
+
+class AutoBatchSize:
+    """
+    Batch sizes that keep each statement within the backend's limits, and
+    each batch near `BULK_AUTO_BATCH_TARGET_SECONDS`
+
+    :param size: Objects per batch
+    :param insert_size: Objects per insert statement
+    :param update_size: Objects per update statement
+    :param lookup_size: Keys per lookup statement, None for one per batch
+    """
+
+    def __init__(
+        self, size, insert_size, update_size, target_seconds=None, lookup_size=None
+    ):
+        self.max_size = size
+        self.size = size
+        self.insert_size = insert_size
+        self.update_size = update_size
+        self.lookup_size = lookup_size
+        self.target_seconds = target_seconds
+
+    def record(self, num_objects, seconds):
+        if self.target_seconds is None or num_objects < self.size:
+            return
+
+        if seconds > self.target_seconds:
+            self.size = max(self.size // 2, 1)
+        elif seconds < self.target_seconds / 2:
+            self.size = min(self.size * 2, self.max_size)
+
+
+def _get_max_query_params(connection):
+    return connection.features.max_query_params or MAX_QUERY_PARAMS.get(
+        connection.vendor, DEFAULT_MAX_QUERY_PARAMS
+    )
+
+
+def get_auto_batch_size(qs, lookup_fields, update_fields, sample):
+    """
+    :param lookup_fields: Attnames of the lookup fields
+    :param update_fields: Attnames of the update fields
+    :param sample: The values of the first rows, to estimate their size
+    """
+    connection = connections[qs.db]
+    meta = qs.model._meta
+    max_params = _get_max_query_params(connection)
+    lookup_fields = [meta.get_field(field_name) for field_name in lookup_fields]
+    num_update_fields = len(update_fields) + sum(
+        1 for field in meta.concrete_fields if getattr(field, "auto_now", False)
+    )
+
+    size = max(max_params // len(lookup_fields), 1)
+    # backends can limit more than the parameters, eg. SQLite limits the
+    # depth of the lookup's ORs
+    lookup_size = min(size, MAX_LOOKUP_SIZE)
+    lookup_size = min(
+        lookup_size, connection.ops.bulk_batch_size(lookup_fields, range(lookup_size))
+    )
+
+    target_bytes = config.bulk_auto_batch_target_bytes
+    if target_bytes and sample:
+        num_bytes = sum(len(str(value)) for row in sample for value in row)
+        row_bytes = max(num_bytes / len(sample), 1)
+        size = min(size, int(target_bytes // row_bytes))
+
+    return AutoBatchSize(
+        max(size, 1),
+        insert_size=max(max_params // len(meta.local_concrete_fields), 1),
+        # bulk_update takes a pk and value per field, and the pk again
+        update_size=max(max_params // (2 * num_update_fields + 1), 1),
+        target_seconds=config.bulk_auto_batch_target_seconds,
+        lookup_size=max(lookup_size, 1),
+    )
+
+
+def iter_batches(objects, batch_size):
+    """
+    :param batch_size: Objects per batch, or an `AutoBatchSize` to adapt to
+        the time each batch takes
+    """
+    if not isinstance(batch_size, AutoBatchSize):
+        for i in range(0, len(objects), batch_size):
+            yield objects[i : i + batch_size]  # noqa
+        return
+
+    i = 0
+    while i < len(objects):
+        batch = objects[i : i + batch_size.size]  # noqa
+        start = time.perf_counter()
+        # the batch is processed before the next one is asked for
+        yield batch
+        batch_size.record(len(batch), time.perf_counter() - start)
+        i += len(batch)
@@ -1,113 +1,709 @@
-from django.db import transaction
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, router, transaction
 from django.db.models import Q
 from django.utils import timezone
 
+from ._bulk_plan import get_bulk_model_plan
+from ._batch_size import BATCH_SIZE_AUTO, SAMPLE_SIZE, get_auto_batch_size, iter_batches
+from ._instrumentation import PhaseTimer
+from ._key_cache import get_key_cache, invalidate_key_cache
+from ._relation_cache import invalidate_cached_objects
+from ._sync import delete_missing as delete_missing_
+from .signals import bulk_update_or_create_batch
+from ._update_engines import UPDATE_ENGINE_AUTO, get_update_function
+from ._update_expressions import bind_incoming
+from ._util import get_fields_map_for_model
+
 
 DEFAULT_BATCH_SIZE = 1000
 
+DUPLICATES_LAST_WINS = "last_wins"
+DUPLICATES_FIRST_WINS = "first_wins"
+DUPLICATES_RAISE = "raise"
+
+PARTITION_BY_ROUTER = "router"
+
+CHILD_SPEC_KEYS = {
+    "objects",
+    "lookup_fields",
+    "update_fields",
+    "update_expressions",
+    "batch_size",
+    "update_engine",
+    "on_duplicate",
+    "children",
+}
+
+
+class BulkReport:
+    """
+    What a `bulk_update_or_create` call did, and where its time went
+
+    :ivar timings: Seconds spent per phase, over every batch
+    :ivar num_queries: Queries per phase, over every batch
+    :ivar batch_sizes: Objects in each batch
+    :ivar children: Reports of the upserted children, by relation name
+    :ivar partitions: Reports of each database, with `partition_by`
+    """
+
+    def __init__(self):
+        self.updated = []
+        self.created = []
+        self.num_unchanged = 0
+        self.num_deleted = None
+        self.timings = {}
+        self.num_queries = {}
+        self.batch_sizes = []
+        self.children = {}
+        self.partitions = {}
+        self.duration = 0
+        self._start = time.perf_counter()
+
+    @property
+    def num_updated(self):
+        return len(self.updated)
+
+    @property
+    def num_created(self):
+        return len(self.created)
+
+    def add_timings(self, timer):
+        for name, duration in timer.timings.items():
+            self.timings[name] = self.timings.get(name, 0) + duration
+        for name, num_queries in timer.num_queries.items():
+            self.num_queries[name] = self.num_queries.get(name, 0) + num_queries
+
+    def add_batch(self, num_objects, num_unchanged, timer):
+        self.batch_sizes.append(num_objects)
+        self.num_unchanged += num_unchanged
+        self.add_timings(timer)
+
+    def add_partition(self, db, report):
+        self.partitions[db] = report
+        self.updated += report.updated
+        self.created += report.created
+        self.num_unchanged += report.num_unchanged
+        self.batch_sizes += report.batch_sizes
+        self.add_timings(report)
+
+    def __str__(self):
+        phases = ", ".join(
+            f"{name} {duration * 1000:.1f}ms ({self.num_queries[name]} queries)"
+            for name, duration in self.timings.items()
+        )
+        deleted = "" if self.num_deleted is None else f", deleted {self.num_deleted}"
+        return (
+            f"Updated {self.num_updated}, created {self.num_created}{deleted} and "
+            f"left {self.num_unchanged} unchanged records in "
+            f"{len(self.batch_sizes)} batches in {self.duration * 1000:.1f}ms"
+            + (f": {phases}" if phases else "")
+        )
+
+
+def get_result(report, objects_updated, objects_created, num_deleted=None):
+    """
+    :return: The `report` if there is one, otherwise the updated and created
+        records, followed by the number of deleted records if there is one
+    """
+    if report is not None:
+        report.updated = objects_updated
+        report.created = objects_created
+        report.num_deleted = num_deleted
+        report.duration = time.perf_counter() - report._start
+        return report
+    if num_deleted is not None:
+        return objects_updated, objects_created, num_deleted
+    return objects_updated, objects_created
+
+
+def delete_missing_with_report(qs, seen_pks, sync_scope, soft_delete_field, report):
+    timer = PhaseTimer(
+        bulk_update_or_create_batch, qs.model, qs.db, enabled=report is not None
+    )
+    with timer.phase("delete"):
+        num_deleted = delete_missing_(qs, seen_pks, sync_scope, soft_delete_field)
+    invalidate_key_cache(qs.model, qs.db)
+    if report is not None:
+        report.add_timings(timer)
+    return num_deleted
+
+
+def record_batch(qs, timer, report, num_objects, num_created, num_updated):
+    """
+    Add a batch to the `report` and send `bulk_update_or_create_batch`
+    """
+    if report is not None:
+        report.add_batch(num_objects, num_objects - num_created - num_updated, timer)
+    if bulk_update_or_create_batch.has_listeners(qs.model):
+        bulk_update_or_create_batch.send(
+            sender=qs.model,
+            num_objects=num_objects,
+            num_created=num_created,
+            num_updated=num_updated,
+            timings=timer.timings,
+            num_queries=timer.num_queries,
+        )
+
+
+def upsert_batches(items, batch_size, upsert_batch, keep_seen):
+    """
+    :param upsert_batch: Function taking a batch and returning its updated and
+        created records, and what it saw of every record by key
+    :param keep_seen: Collect what was seen of every record, otherwise it is
+        dropped after each batch
+    :return: The updated and created records, and what was seen of every
+        record by key, over every batch
+    """
+    objects_updated = []
+    objects_created = []
+    seen = {}
+    for batch in iter_batches(items, batch_size):
+        objects_updated_batch, objects_created_batch, seen_batch = upsert_batch(batch)
+        objects_updated += objects_updated_batch
+        objects_created += objects_created_batch
+        if keep_seen:
+            seen.update(seen_batch)
+    return objects_updated, objects_created, seen
+
+
+def build_lookup_filter(lookup_fields, keys):
+    """
+    :param keys: Tuples of values of the lookup fields
+    :return: An `IN` lookup for a single field, otherwise an OR of the keys
+    """
+    if not keys:
+        return Q(pk__in=[])
+
+    if len(lookup_fields) == 1:
+        (lookup_field,) = lookup_fields
+        values = [value for (value,) in keys if value is not None]
+        lookup_filter = Q(**{f"{lookup_field}__in": values})
+        # IN never matches NULL
+        if len(values) < len(keys):
+            lookup_filter |= Q(**{f"{lookup_field}__isnull": True})
+        return lookup_filter
+
+    return Q(*[Q(**dict(zip(lookup_fields, key))) for key in keys], _connector=Q.OR)
+
+
+def iter_lookups(qs, lookup_fields, keys, lookup_batch_size=None):
+    """
+    :param keys: Tuples of values of the lookup fields
+    :param lookup_batch_size: Keys per lookup statement, None for a single one
+    :return: A queryset of the records of each chunk of `keys`
+    """
+    lookup_batch_size = lookup_batch_size or max(len(keys), 1)
+    for i in range(0, len(keys), lookup_batch_size):
+        yield qs.filter(
+            build_lookup_filter(lookup_fields, keys[i : i + lookup_batch_size])  # noqa
+        )
+
+
+def _set_update_values(record, obj, plan, now, update_expressions):
+    """
+    Set the update fields of `obj` on `record`, if any of them changed
+
+    :return: Whether `record` needs to be updated
+    """
+    # expressions are computed by the database, so always run
+    if not update_expressions and all(
+        getattr(obj, update_field) == getattr(record, update_field)
+        for update_field in plan.update_fields
+    ):
+        return False
+
+    for auto_now_field in plan.auto_now_fields:
+        setattr(record, auto_now_field, now)
+    for update_field in plan.update_fields:
+        setattr(record, update_field, getattr(obj, update_field))
+    for field_name, expression in update_expressions.items():
+        setattr(record, field_name, bind_incoming(expression, obj))
+    return True
+
 
-def _bulk_update_or_create_batch(qs, objects_batch, lookup_fields, update_fields):
+def _update_records(qs, records, plan, update_engine, update_batch_size, fields):
+    """
+    :return: The number of rows matched, or None if it isn't known
+    """
+    update = get_update_function(
+        qs, records, fields, update_engine, plan.supports_values_update
+    )
+    num_matched = update(qs, records, fields, update_batch_size)
+    invalidate_cached_objects(qs.model, [record.pk for record in records], qs.db)
+    return num_matched
+
+
+def _bulk_update_or_create_batch(
+    qs,
+    objects_batch,
+    plan,
+    update_engine,
+    insert_batch_size=None,
+    update_batch_size=None,
+    report=None,
+    update_expressions=None,
+    key_cache=None,
+    lookup_batch_size=None,
+):
     def make_key(obj):
         return tuple(getattr(obj, lookup_field) for lookup_field in lookup_fields)
 
     def lookup_objs(objs):
-        lookup_filter = Q(pk__in=[])
-
-        for obj in objs:
-            lookup_query = {
-                lookup_field: getattr(obj, lookup_field)
-                for lookup_field in lookup_fields
-            }
-            lookup_filter |= Q(**lookup_query)
-        return qs.filter(lookup_filter)
+        return iter_lookups(
+            qs, lookup_fields, [make_key(obj) for obj in objs], lookup_batch_size
+        )
 
+    timer = PhaseTimer(
+        bulk_update_or_create_batch, qs.model, qs.db, enabled=report is not None
+    )
+    lookup_fields = plan.lookup_fields
     objs_to_create = []
     objs_to_update = []
-    auto_now_fields = [
-        field.name
-        for field in qs.model._meta.get_fields()
-        if getattr(field, "auto_now", False)
-    ]
     now = timezone.now()
+    update_expressions = update_expressions or {}
+    expression_fields = list(update_expressions)
+    fields = plan.update_model_fields + [
+        qs.model._meta.get_field(field_name) for field_name in expression_fields
+    ]
+    objs_to_lookup = objects_batch
+    cached_records_by_key = {}
+    records_updated_by_pk = []
+    updated_pks_by_key = {}
 
-    obj_mapping = {
-        make_key(obj): obj for obj in lookup_objs(objects_batch).select_for_update()
-    }
+    # objects whose keys were seen recently skip the lookup, and are either
+    # left as is or updated by their primary key
+    if key_cache is not None and not update_expressions:
+        cached_values = key_cache.get_many(
+            qs.db, lookup_fields, [make_key(obj) for obj in objects_batch]
+        )
+        attnames = list(plan.converters)
+        objs_to_lookup = []
+        objs_to_update_by_pk = []
+        for obj in objects_batch:
+            key = make_key(obj)
+            if key not in cached_values:
+                objs_to_lookup.append(obj)
+                continue
 
-    for obj in objects_batch:
-        key = make_key(obj)
+            record = qs.model.from_db(qs.db, attnames, cached_values[key])
+            cached_records_by_key[key] = record
+            if _set_update_values(record, obj, plan, now, update_expressions):
+                objs_to_update_by_pk.append(obj)
+                records_updated_by_pk.append(record)
 
-        if key in obj_mapping:
-            existing_obj = obj_mapping[key]
-            if any(
-                getattr(obj, update_field) != getattr(existing_obj, update_field)
-                for update_field in update_fields
-            ):
-                for auto_now_field in auto_now_fields:
-                    setattr(existing_obj, auto_now_field, now)
-                for update_field in update_fields:
-                    target_value = getattr(obj, update_field)
-                    setattr(existing_obj, update_field, target_value)
-                objs_to_update.append(existing_obj)
-        else:
+        if records_updated_by_pk:
+            with timer.phase("update"):
+                num_matched = _update_records(
+                    qs,
+                    records_updated_by_pk,
+                    plan,
+                    update_engine,
+                    update_batch_size,
+                    fields,
+                )
+            # records deleted, or not known to be updated, are looked up
+            if num_matched != len(records_updated_by_pk):
+                for obj, record in zip(objs_to_update_by_pk, records_updated_by_pk):
+                    key = make_key(obj)
+                    del cached_records_by_key[key]
+                    updated_pks_by_key[key] = record.pk
+                    objs_to_lookup.append(obj)
+                records_updated_by_pk = []
+
+    with timer.phase("lookup"):
+        obj_mapping = {
+            make_key(obj): obj
+            for lookup_qs in lookup_objs(objs_to_lookup)
+            for obj in lookup_qs.select_for_update()
+        }
+
+    for obj in objs_to_lookup:
+        key = make_key(obj)
+        existing_obj = obj_mapping.get(key)
+        if existing_obj is None:
             objs_to_create.append(obj)
+        elif existing_obj.pk == updated_pks_by_key.get(key):
+            # already updated by its primary key
+            records_updated_by_pk.append(existing_obj)
+        elif _set_update_values(existing_obj, obj, plan, now, update_expressions):
+            objs_to_update.append(existing_obj)
 
     if objs_to_create:
-        qs.bulk_create(objs_to_create)
+        with timer.phase("create"):
+            qs.bulk_create(objs_to_create, batch_size=insert_batch_size)
     if objs_to_update:
-        qs.bulk_update(
-            objs_to_update,
-            fields=update_fields + auto_now_fields,
+        with timer.phase("update"):
+            _update_records(
+                qs, objs_to_update, plan, update_engine, update_batch_size, fields
+            )
+
+    objects_updated = records_updated_by_pk + objs_to_update
+    objects_created = objs_to_create
+    with timer.phase("refetch"):
+        # backends that don't return the primary keys of bulk inserts need a
+        # refetch
+        if objs_to_create and not plan.can_return_rows_from_bulk_insert:
+            objects_created = [
+                obj for lookup_qs in lookup_objs(objs_to_create) for obj in lookup_qs
+            ]
+        if expression_fields and objs_to_update:
+            _refresh_fields(qs, objs_to_update, expression_fields)
+
+    record_batch(
+        qs,
+        timer,
+        report,
+        len(objects_batch),
+        len(objects_created),
+        len(objects_updated),
+    )
+
+    records_by_key = obj_mapping
+    records_by_key.update((make_key(obj), obj) for obj in objects_created)
+    records_by_key.update(cached_records_by_key)
+    if key_cache is not None:
+        if update_expressions:
+            key_cache.delete_many(qs.db, lookup_fields, list(records_by_key))
+        else:
+            key_cache.set_many(qs.db, lookup_fields, records_by_key, plan.converters)
+    return objects_updated, objects_created, records_by_key
+
+
+def _refresh_fields(qs, objs, field_names):
+    """
+    Replace the expressions written to `field_names` with their results
+    """
+    objs_by_pk = {obj.pk: obj for obj in objs}
+    for pk, *values in qs.filter(pk__in=list(objs_by_pk)).values_list(
+        "pk", *field_names
+    ):
+        for field_name, value in zip(field_names, values):
+            setattr(objs_by_pk[pk], field_name, value)
+
+
+def _coalesce_duplicates(objects, make_key, on_duplicate):
+    """
+    Keep one object per key, in the position the key was first seen
+
+    :param on_duplicate: "last_wins", "first_wins", "raise" to raise a
+        `ValueError`, or a function taking the kept and the duplicate object
+        and returning the object to keep
+    """
+    if on_duplicate == DUPLICATES_LAST_WINS:
+
+        def merge(kept, duplicate):
+            return duplicate
+
+    elif on_duplicate == DUPLICATES_FIRST_WINS:
+
+        def merge(kept, duplicate):
+            return kept
+
+    elif on_duplicate == DUPLICATES_RAISE:
+        merge = None
+    elif callable(on_duplicate):
+        merge = on_duplicate
+    else:
+        raise ValueError(f"Unknown duplicate policy: {on_duplicate}")
+
+    objects_by_key = {}
+    for obj in objects:
+        key = make_key(obj)
+        if key in objects_by_key:
+            if merge is None:
+                raise ValueError(
+                    f"Several objects have the lookup key {key}, pass an "
+                    f"on_duplicate function to merge them"
+                )
+            obj = merge(objects_by_key[key], obj)
+        objects_by_key[key] = obj
+    return tuple(objects_by_key.values())
+
+
+def get_batch_size(qs, batch_size, lookup_fields, update_fields, sample):
+    if batch_size is None:
+        return DEFAULT_BATCH_SIZE
+    if batch_size == BATCH_SIZE_AUTO:
+        return get_auto_batch_size(qs, lookup_fields, update_fields, sample)
+    return batch_size
+
+
+def get_phase_batch_sizes(batch_size):
+    """
+    :return: Objects per insert and update statement, None for the backend's
+        default, and keys per lookup statement, None for one per batch
+    """
+    return (
+        getattr(batch_size, "insert_size", None),
+        getattr(batch_size, "update_size", None),
+        getattr(batch_size, "lookup_size", None),
+    )
+
+
+def _get_child_relation(model, name):
+    relation = get_fields_map_for_model(model._meta).get(name)
+    if not (
+        relation is not None
+        and relation.one_to_many
+        and relation.auto_created
+        and not relation.concrete
+    ):
+        raise ValueError(f"{name} is not a reverse foreign key of {model.__name__}")
+    return relation
+
+
+def _resolve_parents(objects, fk_field, lookup_fields, records_by_key):
+    """
+    Point the foreign key of each object at the upserted record of its
+    parent, found by the parent's lookup key
+    """
+    for obj in objects:
+        parent = fk_field.get_cached_value(obj, default=None)
+        if parent is None:
+            if getattr(obj, fk_field.attname) is None:
+                raise ValueError(f"{obj!r} has no {fk_field.name}")
+            continue
+
+        key = tuple(getattr(parent, lookup_field) for lookup_field in lookup_fields)
+        record = records_by_key.get(key, parent)
+        if record.pk is None:
+            raise ValueError(
+                f"The {fk_field.name} of {obj!r} is neither saved nor upserted"
+            )
+        setattr(obj, fk_field.name, record)
+
+
+def _upsert_children(qs, children, lookup_fields, records_by_key, report):
+    for name, spec in children.items():
+        relation = _get_child_relation(qs.model, name)
+        unknown_keys = set(spec) - CHILD_SPEC_KEYS
+        if unknown_keys:
+            raise ValueError(f"Unknown keys for {name}: {sorted(unknown_keys)}")
+
+        spec = dict(spec)
+        objects = tuple(spec.pop("objects"))
+        _resolve_parents(objects, relation.field, lookup_fields, records_by_key)
+        child_report = bulk_update_or_create(
+            relation.related_model._base_manager.using(qs.db),
+            objects,
+            report=report is not None,
+            **spec,
         )
+        if report is not None:
+            report.children[name] = child_report
 
-    objects_updated = objs_to_update
-    # need to re-fetch because not all db engines support returning PKs
-    # on bulk_create
-    objects_created = list(lookup_objs(objs_to_create))
-    return objects_updated, objects_created
 
+def _partition(qs, objects, partition_by):
+    if partition_by == PARTITION_BY_ROUTER:
+
+        def partition_by(obj):
+            return router.db_for_write(qs.model, instance=obj)
+
+    partitions = {}
+    for obj in objects:
+        # None leaves the object in the queryset's database
+        partitions.setdefault(partition_by(obj) or qs.db, []).append(obj)
+    return partitions
 
-def _get_validated_fields(qs, fields):
-    fields = [qs.model._meta.get_field(field) for field in fields]
-    if any(not f.concrete or f.many_to_many for f in fields):
-        raise ValueError("Only concrete fields are allowed")
 
-    # we don't want to trigger any related object lookups
-    # eg. instead of obj.related we use obj.related_id
-    return [field.attname for field in fields]
+def _upsert_in_thread(upsert, db, objects):
+    try:
+        return upsert(db, objects)
+    finally:
+        connections[db].close()
+
+
+def _upsert_partitions(qs, objects, partition_by, max_workers, upsert):
+    """
+    :param upsert: Function taking a database and its objects, and returning
+        a `BulkReport`
+    :return: A `BulkReport` of every database
+
+    Threads have connections of their own, so when the caller is in a
+    transaction on any of the databases they are upserted one after another
+    in it instead
+    """
+    partitions = _partition(qs, objects, partition_by)
+    report = BulkReport()
+    in_transaction = any(connections[db].in_atomic_block for db in partitions)
+
+    if max_workers and max_workers > 1 and len(partitions) > 1 and not in_transaction:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                db: executor.submit(_upsert_in_thread, upsert, db, objects)
+                for db, objects in partitions.items()
+            }
+            partition_reports = {db: future.result() for db, future in futures.items()}
+    else:
+        partition_reports = {
+            db: upsert(db, objects) for db, objects in partitions.items()
+        }
+
+    for db, partition_report in partition_reports.items():
+        report.add_partition(db, partition_report)
+    return report
 
 
 def bulk_update_or_create(
-    qs, objects, lookup_fields, update_fields, batch_size=DEFAULT_BATCH_SIZE
+    qs,
+    objects,
+    lookup_fields,
+    update_fields,
+    batch_size=DEFAULT_BATCH_SIZE,
+    update_engine=UPDATE_ENGINE_AUTO,
+    delete_missing=False,
+    sync_scope=None,
+    soft_delete_field=None,
+    on_duplicate=DUPLICATES_LAST_WINS,
+    report=False,
+    children=None,
+    update_expressions=None,
+    partition_by=None,
+    max_workers=None,
 ):
     """
     :param objects: List of objects to update or create
     :param lookup_fields: List of field names that uniquely identify a record
     :param update_fields: List of field names that need to be updated
-    :param return_records: If the affected records should be returned
-    :return:
+    :param update_expressions: Dict of expressions to update fields with, by
+        field name. `Incoming(field_name)` stands for the value of the object
+        being upserted, eg. `{"views": F("views") + Incoming("views")}`
+    :param batch_size: Objects per batch, or "auto" to size batches from the
+        backend's limits and adapt them to the time each batch takes
+    :param update_engine: How existing records are updated, see
+        `get_update_function`
+    :param delete_missing: Delete the records in `sync_scope` (by default all
+        records of the queryset) that aren't in `objects`
+    :param sync_scope: Q object limiting the records that `delete_missing` applies to
+    :param soft_delete_field: Field that marks records as deleted, see
+        `delete_missing`
+    :param on_duplicate: Which object to keep when several share a lookup key,
+        see `_coalesce_duplicates`. With `update_expressions` only a function
+        is used, and duplicates raise otherwise
+    :param report: Return a `BulkReport` instead
+    :param children: Children to upsert after `objects`, by the name of their
+        reverse foreign key. Each is a dict of the `objects`, `lookup_fields`
+        and `update_fields`, and optionally `batch_size`, `update_engine`,
+        `on_duplicate` and nested `children`. The foreign keys of the children
+        are set to the upserted records of their parent objects
+    :param partition_by: "router" to upsert each object in the database that
+        the routers' `db_for_write` picks, or a function returning the database
+        of an object, or None for the queryset's. Each database's objects are
+        upserted in a transaction of their own, and `delete_missing` only
+        applies to those databases
+    :param max_workers: Upsert this many databases at a time with
+        `partition_by`, unless called in a transaction on one of them
+    :return: The updated and created records, followed by the number of deleted
+        records if `delete_missing` is set
     """
     objects = tuple(objects)
 
-    if not objects:
-        return [], []
+    if partition_by is not None:
+        if children:
+            raise ValueError("children can't be upserted with partition_by")
 
-    if batch_size is None:
-        batch_size = DEFAULT_BATCH_SIZE
+        def upsert(db, objects_partition):
+            return bulk_update_or_create(
+                qs.using(db),
+                objects_partition,
+                lookup_fields,
+                update_fields,
+                batch_size=batch_size,
+                update_engine=update_engine,
+                delete_missing=delete_missing,
+                sync_scope=sync_scope,
+                soft_delete_field=soft_delete_field,
+                on_duplicate=on_duplicate,
+                report=True,
+                update_expressions=update_expressions,
+            )
 
-    objects_updated = []
-    objects_created = []
+        partitioned_report = _upsert_partitions(
+            qs, objects, partition_by, max_workers, upsert
+        )
+        num_deleted = None
+        if delete_missing:
+            num_deleted = sum(
+                partition_report.num_deleted
+                for partition_report in partitioned_report.partitions.values()
+            )
+        return get_result(
+            partitioned_report if report else None,
+            partitioned_report.updated,
+            partitioned_report.created,
+            num_deleted,
+        )
 
-    update_fields = _get_validated_fields(qs, update_fields)
-    lookup_fields = _get_validated_fields(qs, lookup_fields)
+    report = BulkReport() if report else None
+
+    if not objects and not delete_missing and not children:
+        return get_result(report, [], [])
+
+    plan = get_bulk_model_plan(qs.model, qs.db, lookup_fields, update_fields)
+    update_fields = plan.update_fields
+    lookup_fields = plan.lookup_fields
+    update_expressions = update_expressions or {}
+    if update_expressions:
+        update_expressions = dict(
+            zip(
+                plan.get_attnames(list(update_expressions)),
+                update_expressions.values(),
+            )
+        )
+    if set(update_expressions) & set(update_fields):
+        raise ValueError("Fields can't be in both update_fields and update_expressions")
+    if update_expressions and not callable(on_duplicate):
+        # keeping one of the objects would drop what the others add
+        on_duplicate = DUPLICATES_RAISE
+    objects = _coalesce_duplicates(
+        objects,
+        lambda obj: tuple(getattr(obj, field) for field in lookup_fields),
+        on_duplicate,
+    )
+    batch_size = get_batch_size(
+        qs,
+        batch_size,
+        lookup_fields,
+        update_fields,
+        [
+            [getattr(obj, field) for field in lookup_fields + update_fields]
+            for obj in objects[:SAMPLE_SIZE]
+        ],
+    )
+    insert_batch_size, update_batch_size, lookup_batch_size = get_phase_batch_sizes(
+        batch_size
+    )
+    key_cache = get_key_cache(qs.model)
+
+    def upsert_batch(objects_batch):
+        return _bulk_update_or_create_batch(
+            qs,
+            objects_batch,
+            plan,
+            update_engine,
+            insert_batch_size,
+            update_batch_size,
+            report,
+            update_expressions,
+            key_cache,
+            lookup_batch_size,
+        )
 
     with transaction.atomic(using=qs.db, savepoint=False):
-        for i in range(0, len(objects), batch_size):
-            objects_batch = objects[i : i + batch_size]  # noqa
-            objects_updated_batch, objects_created_batch = _bulk_update_or_create_batch(
-                qs, objects_batch, lookup_fields, update_fields
+        objects_updated, objects_created, records_by_key = upsert_batches(
+            objects, batch_size, upsert_batch, delete_missing or children
+        )
+
+        if children:
+            _upsert_children(qs, children, lookup_fields, records_by_key, report)
+
+        num_deleted = None
+        if delete_missing:
+            seen_pks = {record.pk for record in records_by_key.values()}
+            num_deleted = delete_missing_with_report(
+                qs, seen_pks, sync_scope, soft_delete_field, report
             )
-            objects_updated += objects_updated_batch
-            objects_created += objects_created_batch
 
-    return objects_updated, objects_created
+    return get_result(report, objects_updated, objects_created, num_deleted)
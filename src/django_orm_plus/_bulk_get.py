@@ -0,0 +1,91 @@
+from django.db import transaction
+
+from ._batch_size import SAMPLE_SIZE, iter_batches
+from ._bulk import (
+    DEFAULT_BATCH_SIZE,
+    DUPLICATES_FIRST_WINS,
+    _bulk_update_or_create_batch,
+    _coalesce_duplicates,
+    get_batch_size,
+    get_phase_batch_sizes,
+    iter_lookups,
+)
+from ._bulk_plan import get_bulk_model_plan
+from ._update_engines import UPDATE_ENGINE_AUTO
+
+
+def in_bulk_by(qs, lookup_fields, keys, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Like `in_bulk`, for any number of fields
+
+    :param keys: Tuples of values of the lookup fields
+    :return: Dict of the records that were found, by their tuple of values of
+        the lookup fields
+    """
+    plan = get_bulk_model_plan(qs.model, qs.db, lookup_fields, [])
+    lookup_fields = plan.lookup_fields
+    converters = [plan.converters[lookup_field] for lookup_field in lookup_fields]
+
+    unique_keys = {}
+    for key in keys:
+        if len(key) != len(lookup_fields):
+            raise ValueError(
+                f"Expected {len(lookup_fields)} values per key, got {len(key)}"
+            )
+        key = tuple(to_python(value) for to_python, value in zip(converters, key))
+        unique_keys[key] = None
+    keys = tuple(unique_keys)
+
+    batch_size = get_batch_size(qs, batch_size, lookup_fields, [], keys[:SAMPLE_SIZE])
+    records_by_key = {}
+    _, _, lookup_batch_size = get_phase_batch_sizes(batch_size)
+    for keys_batch in iter_batches(keys, batch_size):
+        for lookup_qs in iter_lookups(qs, lookup_fields, keys_batch, lookup_batch_size):
+            for record in lookup_qs:
+                key = tuple(
+                    getattr(record, lookup_field) for lookup_field in lookup_fields
+                )
+                records_by_key[key] = record
+    return records_by_key
+
+
+def bulk_get_or_create(qs, objects, lookup_fields, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Get the record of every object by its lookup fields, and create the
+    objects that don't have one
+
+    :return: Dict of the record of every object, by its tuple of values of the
+        lookup fields
+    """
+    plan = get_bulk_model_plan(qs.model, qs.db, lookup_fields, [])
+    lookup_fields = plan.lookup_fields
+    objects = _coalesce_duplicates(
+        objects,
+        lambda obj: tuple(getattr(obj, field) for field in lookup_fields),
+        DUPLICATES_FIRST_WINS,
+    )
+    batch_size = get_batch_size(
+        qs,
+        batch_size,
+        lookup_fields,
+        [],
+        [
+            [getattr(obj, field) for field in lookup_fields]
+            for obj in objects[:SAMPLE_SIZE]
+        ],
+    )
+    insert_batch_size, _, lookup_batch_size = get_phase_batch_sizes(batch_size)
+
+    records_by_key = {}
+    with transaction.atomic(using=qs.db, savepoint=False):
+        for objects_batch in iter_batches(objects, batch_size):
+            _, _, records_by_key_batch = _bulk_update_or_create_batch(
+                qs,
+                objects_batch,
+                plan,
+                UPDATE_ENGINE_AUTO,
+                insert_batch_size,
+                lookup_batch_size=lookup_batch_size,
+            )
+            records_by_key.update(records_by_key_batch)
+    return records_by_key
@@ -0,0 +1,95 @@
+from django.db import connections, models, transaction
+
+from ._batch_size import _get_max_query_params, iter_batches
+from ._bulk import DEFAULT_BATCH_SIZE
+
+
+def _get_m2m_field(model, field_name):
+    field = model._meta.get_field(field_name)
+    if not isinstance(field, models.ManyToManyField):
+        raise ValueError(
+            f"{field_name} is not a many-to-many field of {model.__name__}"
+        )
+    if field.remote_field.symmetrical:
+        # each membership is stored twice, once in each direction
+        raise ValueError(
+            f"{field_name} of {model.__name__} is symmetrical, which isn't supported"
+        )
+    return field
+
+
+def _get_value(fk, value):
+    if isinstance(value, models.Model):
+        value = getattr(value, fk.target_field.attname)
+    return fk.target_field.to_python(value)
+
+
+def bulk_sync_m2m(
+    qs, field_name, memberships, batch_size=DEFAULT_BATCH_SIZE, through_defaults=None
+):
+    """
+    Set the related objects of many parents like `.set()` does, without the
+    queries per parent
+
+    :param field_name: Name of a many-to-many field of the model
+    :param memberships: Dict of the related objects, or their primary keys, by
+        the primary key of each parent. Parents that aren't in it are left as is
+    :param through_defaults: Values for the other fields of added through rows
+    :return: The number of added and removed through rows
+    """
+    if batch_size is None:
+        batch_size = DEFAULT_BATCH_SIZE
+
+    field = _get_m2m_field(qs.model, field_name)
+    through = field.remote_field.through
+    source_fk = through._meta.get_field(field.m2m_field_name())
+    target_fk = through._meta.get_field(field.m2m_reverse_field_name())
+    through_qs = through._base_manager.using(qs.db)
+    through_defaults = through_defaults or {}
+    max_params = _get_max_query_params(connections[qs.db])
+
+    desired = {
+        _get_value(source_fk, parent_pk): {
+            _get_value(target_fk, child) for child in children
+        }
+        for parent_pk, children in memberships.items()
+    }
+    parent_pks = tuple(desired)
+    num_added = 0
+    num_removed = 0
+
+    with transaction.atomic(using=qs.db, savepoint=False):
+        for parent_pks_batch in iter_batches(parent_pks, batch_size):
+            existing = {}
+            for pk, parent_pk, child_pk in through_qs.filter(
+                **{f"{source_fk.attname}__in": parent_pks_batch}
+            ).values_list("pk", source_fk.attname, target_fk.attname):
+                existing[parent_pk, child_pk] = pk
+
+            pairs = {
+                (parent_pk, child_pk)
+                for parent_pk in parent_pks_batch
+                for child_pk in desired[parent_pk]
+            }
+            pks_to_remove = [pk for pair, pk in existing.items() if pair not in pairs]
+            pairs_to_add = [pair for pair in pairs if pair not in existing]
+
+            # parents can have far more rows to remove than fit in a query
+            for pks_to_remove_batch in iter_batches(pks_to_remove, max_params):
+                _, num_removed_by_model = through_qs.filter(
+                    pk__in=pks_to_remove_batch
+                ).delete()
+                num_removed += num_removed_by_model.get(through._meta.label, 0)
+            if pairs_to_add:
+                through_qs.bulk_create(
+                    [
+                        through(
+                            **through_defaults,
+                            **{source_fk.attname: parent_pk, target_fk.attname: child},
+                        )
+                        for parent_pk, child in pairs_to_add
+                    ]
+                )
+                num_added += len(pairs_to_add)
+
+    return num_added, num_removed
@@ -0,0 +1,115 @@
+from django.db import connections
+
+from ._update_engines import supports_values_update
+
+
+_bulk_model_plans = {}
+
+
+def get_validated_fields(model, fields):
+    fields = [model._meta.get_field(field) for field in fields]
+    if any(not f.concrete or f.many_to_many for f in fields):
+        raise ValueError("Only concrete fields are allowed")
+
+    # we don't want to trigger any related object lookups
+    # eg. instead of obj.related we use obj.related_id
+    return [field.attname for field in fields]
+
+
+class BulkModelPlan:
+    """
+    What the bulk operations need to know about a model and database for a
+    set of lookup and update fields, worked out once
+
+    :ivar lookup_fields: Attnames of the lookup fields
+    :ivar update_fields: Attnames of the update fields
+    :ivar auto_now_fields: Attnames of the fields set to now on every update
+    :ivar auto_now_add_fields: Attnames of the fields set to now on create
+    :ivar update_model_fields: The update fields followed by the auto_now
+        fields, as written by the update engines
+    :ivar converters: `to_python` of every concrete field, by attname
+    :ivar preparers: `get_prep_value` of every concrete field, by attname, to
+        compare values as the database would
+    :ivar supports_values_update: Whether the database supports the values
+        update engine
+    :ivar can_return_rows_from_bulk_insert: Whether inserts set the primary
+        keys of the created objects, so that they needn't be refetched
+    """
+
+    def __init__(self, model, db, lookup_fields, update_fields):
+        meta = model._meta
+        connection = connections[db]
+
+        self.model = model
+        self.db = db
+        self.lookup_fields = get_validated_fields(model, lookup_fields)
+        self.update_fields = get_validated_fields(model, update_fields)
+        self.auto_now_fields = [
+            field.attname
+            for field in meta.concrete_fields
+            if getattr(field, "auto_now", False)
+        ]
+        self.auto_now_add_fields = [
+            field.attname
+            for field in meta.concrete_fields
+            if getattr(field, "auto_now_add", False)
+        ]
+        self.update_model_fields = [
+            meta.get_field(field_name)
+            for field_name in self.update_fields + self.auto_now_fields
+        ]
+        self.converters = {
+            field.attname: field.to_python for field in meta.concrete_fields
+        }
+        self.preparers = {
+            field.attname: field.get_prep_value for field in meta.concrete_fields
+        }
+        self.supports_values_update = supports_values_update(connection)
+        self.can_return_rows_from_bulk_insert = (
+            connection.features.can_return_rows_from_bulk_insert
+        )
+        self._attnames = {}
+        self._insert_fields = {}
+
+    def get_attnames(self, fields):
+        """
+        :return: The validated attnames of `fields`
+        """
+        fields = tuple(fields)
+        if fields not in self._attnames:
+            self._attnames[fields] = get_validated_fields(self.model, fields)
+        return self._attnames[fields]
+
+    def get_insert_fields(self, attnames):
+        """
+        :param attnames: The fields that values are given for
+        :return: The fields to insert, and those of them that take their
+            default
+        """
+        attnames = tuple(attnames)
+        if attnames not in self._insert_fields:
+            meta = self.model._meta
+            insert_fields = [
+                field
+                for field in meta.local_concrete_fields
+                if field is not meta.auto_field or field.attname in attnames
+            ]
+            default_fields = [
+                field
+                for field in insert_fields
+                if field.attname not in attnames
+                and field.attname not in self.auto_now_fields
+                and field.attname not in self.auto_now_add_fields
+            ]
+            self._insert_fields[attnames] = (insert_fields, default_fields)
+        return self._insert_fields[attnames]
+
+
+def get_bulk_model_plan(model, db, lookup_fields, update_fields):
+    key = (model, db, tuple(lookup_fields), tuple(update_fields))
+    plan = _bulk_model_plans.get(key)
+    if plan is None:
+        plan = _bulk_model_plans[key] = BulkModelPlan(
+            model, db, lookup_fields, update_fields
+        )
+    return plan
@@ -0,0 +1,319 @@
+from collections.abc import Mapping
+
+from django.db import connections, transaction
+from django.db.models import FileField
+from django.utils import timezone
+
+from ._batch_size import SAMPLE_SIZE
+from ._bulk_plan import get_bulk_model_plan
+from ._bulk import (
+    DEFAULT_BATCH_SIZE,
+    DUPLICATES_LAST_WINS,
+    BulkReport,
+    _coalesce_duplicates,
+    iter_lookups,
+    delete_missing_with_report,
+    get_batch_size,
+    get_phase_batch_sizes,
+    get_result,
+    record_batch,
+    upsert_batches,
+)
+from ._instrumentation import PhaseTimer
+from ._key_cache import invalidate_key_cache
+from ._relation_cache import invalidate_cached_objects
+from .signals import bulk_update_or_create_batch
+from ._update_engines import (
+    UPDATE_ENGINE_AUTO,
+    get_update_function,
+    update_with_bulk_update,
+)
+
+
+class _Row:
+    """
+    Attribute access to the values of a row, which is all the insert compiler
+    and the values update engine need from an object
+    """
+
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+
+def _get_rows(rows, fields, converters):
+    """
+    :return: A dict of python values by attname for each row
+    """
+    for row in rows:
+        if isinstance(row, Mapping):
+            values = [row[field] for field in fields]
+        else:
+            values = row
+            if len(values) != len(fields):
+                raise ValueError(
+                    f"Expected {len(fields)} values per row, got {len(values)}"
+                )
+        yield {
+            attname: to_python(value)
+            for (attname, to_python), value in zip(converters, values)
+        }
+
+
+def _insert(qs, rows, insert_fields, default_fields, batch_size=None):
+    objs = []
+    for row in rows:
+        obj = _Row(row)
+        for field in default_fields:
+            setattr(obj, field.attname, field.get_default())
+        objs.append(obj)
+
+    connection = connections[qs.db]
+    max_batch_size = max(connection.ops.bulk_batch_size(insert_fields, objs), 1)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    for i in range(0, len(objs), batch_size):
+        qs._insert(
+            objs[i : i + batch_size], fields=insert_fields, using=qs.db  # noqa
+        )
+
+
+def _update(qs, rows, fields, update_engine, supports_values, batch_size=None):
+    update = get_update_function(qs, rows, fields, update_engine, supports_values)
+    if update is update_with_bulk_update:
+        # bulk_update validates the related fields of model instances
+        # from_db expects the values in the order of the model's fields
+        attnames = [
+            field.attname
+            for field in qs.model._meta.concrete_fields
+            if field.attname in rows[0].__dict__
+        ]
+        rows = [
+            qs.model.from_db(qs.db, attnames, [getattr(row, f) for f in attnames])
+            for row in rows
+        ]
+    update(qs, rows, fields, batch_size)
+
+
+def _bulk_update_or_create_values_batch(
+    qs,
+    rows_batch,
+    plan,
+    insert_fields,
+    default_fields,
+    update_engine,
+    return_records,
+    insert_batch_size=None,
+    update_batch_size=None,
+    report=None,
+    lookup_batch_size=None,
+):
+    lookup_fields = plan.lookup_fields
+    update_fields = plan.update_fields
+    lookup_preparers = [plan.preparers[field] for field in lookup_fields]
+    update_preparers = [plan.preparers[field] for field in update_fields]
+
+    def make_key(row):
+        return tuple(row[lookup_field] for lookup_field in lookup_fields)
+
+    def prepare_key(values):
+        # naive datetimes, strings of numbers etc. compare equal to what the
+        # database returns once they are prepared
+        return tuple(prepare(value) for prepare, value in zip(lookup_preparers, values))
+
+    def lookup_rows(rows):
+        return iter_lookups(
+            qs, lookup_fields, [make_key(row) for row in rows], lookup_batch_size
+        )
+
+    timer = PhaseTimer(
+        bulk_update_or_create_batch, qs.model, qs.db, enabled=report is not None
+    )
+    meta = qs.model._meta
+    pk_attname = meta.pk.attname
+    num_lookup_fields = len(lookup_fields)
+    auto_now_fields = plan.auto_now_fields
+    now = timezone.now()
+
+    with timer.phase("lookup"):
+        existing = {
+            prepare_key(values[1 : num_lookup_fields + 1]): (  # noqa
+                values[0],
+                values[num_lookup_fields + 1 :],  # noqa
+            )
+            for lookup_qs in lookup_rows(rows_batch)
+            for values in lookup_qs.select_for_update().values_list(
+                "pk", *lookup_fields, *update_fields
+            )
+        }
+
+    rows_to_create = []
+    rows_to_update = []
+    for row in rows_batch:
+        match = existing.get(prepare_key(make_key(row)))
+        if match is None:
+            rows_to_create.append(row)
+            continue
+
+        pk, current_values = match
+        if any(
+            prepare(row[update_field]) != prepare(current_value)
+            for update_field, prepare, current_value in zip(
+                update_fields, update_preparers, current_values
+            )
+        ):
+            values = {update_field: row[update_field] for update_field in update_fields}
+            values.update({auto_now_field: now for auto_now_field in auto_now_fields})
+            values[pk_attname] = pk
+            rows_to_update.append(_Row(values))
+
+    if rows_to_create:
+        with timer.phase("create"):
+            _insert(
+                qs, rows_to_create, insert_fields, default_fields, insert_batch_size
+            )
+    updated_pks = [getattr(row, pk_attname) for row in rows_to_update]
+    if rows_to_update:
+        with timer.phase("update"):
+            _update(
+                qs,
+                rows_to_update,
+                plan.update_model_fields,
+                update_engine,
+                plan.supports_values_update,
+                update_batch_size,
+            )
+        invalidate_cached_objects(qs.model, updated_pks, qs.db)
+
+    with timer.phase("refetch"):
+        if return_records:
+            objects_updated = list(qs.filter(pk__in=updated_pks))
+            objects_created = [
+                obj for lookup_qs in lookup_rows(rows_to_create) for obj in lookup_qs
+            ]
+            created_pks = [obj.pk for obj in objects_created]
+        else:
+            objects_updated = updated_pks
+            created_pks = [
+                pk
+                for lookup_qs in lookup_rows(rows_to_create)
+                for pk in lookup_qs.values_list("pk", flat=True)
+            ]
+            objects_created = created_pks
+
+    record_batch(
+        qs,
+        timer,
+        report,
+        len(rows_batch),
+        len(objects_created),
+        len(objects_updated),
+    )
+
+    seen_pks = {pk: pk for pk, _ in existing.values()}
+    seen_pks.update((pk, pk) for pk in created_pks)
+    return objects_updated, objects_created, seen_pks
+
+
+def bulk_update_or_create_values(
+    qs,
+    rows,
+    fields,
+    lookup_fields,
+    update_fields,
+    batch_size=DEFAULT_BATCH_SIZE,
+    update_engine=UPDATE_ENGINE_AUTO,
+    return_records=False,
+    delete_missing=False,
+    sync_scope=None,
+    soft_delete_field=None,
+    on_duplicate=DUPLICATES_LAST_WINS,
+    report=False,
+):
+    """
+    Like `bulk_update_or_create`, for rows of values instead of model objects.
+    Model objects are only created when `return_records` is set
+
+    :param rows: Dicts keyed by the names in `fields`, or sequences of values
+        in the order of `fields`
+    :param fields: List of field names given for each row, these must include
+        `lookup_fields` and `update_fields`. The other fields are only used when
+        creating records
+    :param return_records: Return the updated and created records instead of
+        their primary keys
+    :param on_duplicate: Which row to keep when several share a lookup key,
+        merge functions take and return dicts of values by attname
+    :param report: Return a `BulkReport` instead
+    :return: The primary keys, or records, of the updated and created records,
+        followed by the number of deleted records if `delete_missing` is set
+    """
+    report = BulkReport() if report else None
+    meta = qs.model._meta
+    if meta.parents:
+        raise ValueError("Multi-table inherited models are not supported")
+
+    plan = get_bulk_model_plan(qs.model, qs.db, lookup_fields, update_fields)
+    attnames = plan.get_attnames(fields)
+    lookup_fields = plan.lookup_fields
+    update_fields = plan.update_fields
+    if not set(lookup_fields + update_fields).issubset(attnames):
+        raise ValueError("fields must include lookup_fields and update_fields")
+
+    file_fields = [
+        field for field in fields if isinstance(meta.get_field(field), FileField)
+    ]
+    if file_fields:
+        # the insert compiler would save the files of model objects
+        raise ValueError(
+            f"File fields need model objects, use bulk_update_or_create for "
+            f"{', '.join(file_fields)}"
+        )
+
+    converters = [(attname, plan.converters[attname]) for attname in attnames]
+    rows = _coalesce_duplicates(
+        _get_rows(rows, fields, converters),
+        lambda row: tuple(row[field] for field in lookup_fields),
+        on_duplicate,
+    )
+    if not rows and not delete_missing:
+        return get_result(report, [], [])
+
+    insert_fields, default_fields = plan.get_insert_fields(attnames)
+    batch_size = get_batch_size(
+        qs,
+        batch_size,
+        lookup_fields,
+        update_fields,
+        [row.values() for row in rows[:SAMPLE_SIZE]],
+    )
+    insert_batch_size, update_batch_size, lookup_batch_size = get_phase_batch_sizes(
+        batch_size
+    )
+
+    def upsert_batch(rows_batch):
+        return _bulk_update_or_create_values_batch(
+            qs,
+            rows_batch,
+            plan,
+            insert_fields,
+            default_fields,
+            update_engine,
+            return_records,
+            insert_batch_size,
+            update_batch_size,
+            report,
+            lookup_batch_size,
+        )
+
+    with transaction.atomic(using=qs.db, savepoint=False):
+        # rows aren't written through the key cache
+        invalidate_key_cache(qs.model, qs.db)
+        objects_updated, objects_created, seen_pks = upsert_batches(
+            rows, batch_size, upsert_batch, delete_missing
+        )
+
+        num_deleted = None
+        if delete_missing:
+            num_deleted = delete_missing_with_report(
+                qs, list(seen_pks), sync_scope, soft_delete_field, report
+            )
+
+    return get_result(report, objects_updated, objects_created, num_deleted)
@@ -3,7 +3,17 @@ from django.conf import settings
 
 DEFAULT_CONFIG = {
     "AUTO_ADD_MODEL_MIXIN": False,
+    "AUTO_ADD_MODEL_MIXIN_INCLUDE": None,
+    "AUTO_ADD_MODEL_MIXIN_EXCLUDE": [],
     "STRICT_MODE_GLOBAL_OVERRIDE": None,
+    "STRICT_MODE_RECORD": None,
+    "CACHED_RELATIONS": {},
+    "SAMPLED_DETECTION_RATE": 0.0,
+    "SAMPLED_DETECTION_SINK": "logging",
+    "SAMPLED_DETECTION_STATSD": {},
+    "BULK_AUTO_BATCH_TARGET_BYTES": None,
+    "BULK_AUTO_BATCH_TARGET_SECONDS": 1.0,
+    "BULK_KEY_CACHES": {},
 }
 
 
@@ -15,10 +25,50 @@ class Config:
     def auto_add_model_mixin(self):
         return self.get_setting("AUTO_ADD_MODEL_MIXIN")
 
+    @property
+    def auto_add_model_mixin_include(self):
+        return self.get_setting("AUTO_ADD_MODEL_MIXIN_INCLUDE")
+
+    @property
+    def auto_add_model_mixin_exclude(self):
+        return self.get_setting("AUTO_ADD_MODEL_MIXIN_EXCLUDE")
+
     @property
     def strict_mode_global_override(self):
         return self.get_setting("STRICT_MODE_GLOBAL_OVERRIDE")
 
+    @property
+    def strict_mode_record(self):
+        return self.get_setting("STRICT_MODE_RECORD")
+
+    @property
+    def cached_relations(self):
+        return self.get_setting("CACHED_RELATIONS")
+
+    @property
+    def sampled_detection_rate(self):
+        return self.get_setting("SAMPLED_DETECTION_RATE")
+
+    @property
+    def sampled_detection_sink(self):
+        return self.get_setting("SAMPLED_DETECTION_SINK")
+
+    @property
+    def sampled_detection_statsd(self):
+        return self.get_setting("SAMPLED_DETECTION_STATSD")
+
+    @property
+    def bulk_auto_batch_target_bytes(self):
+        return self.get_setting("BULK_AUTO_BATCH_TARGET_BYTES")
+
+    @property
+    def bulk_auto_batch_target_seconds(self):
+        return self.get_setting("BULK_AUTO_BATCH_TARGET_SECONDS")
+
+    @property
+    def bulk_key_caches(self):
+        return self.get_setting("BULK_KEY_CACHES")
+
     @property
     def _user_config(self):
         return getattr(settings, "DJANGO_ORM_PLUS", {})
@@ -0,0 +1,124 @@
+import logging
+import re
+import socket
+import threading
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.utils.module_loading import import_string
+
+from ._config import config
+
+
+logger = logging.getLogger("django_orm_plus")
+
+MODIFIED_AFTER_FETCH = "modified_after_fetch"
+
+_local = Local()
+_lock = threading.Lock()
+# number of sampled requests in flight, so that unsampled requests don't
+# have to look up the request local collector
+_active_count = 0
+
+
+class DetectionCollector:
+    """
+    Counts the strict mode violations of one sampled request
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, kind, relation):
+        key = (kind, relation)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+
+def get_active_collector():
+    if not _active_count:
+        return None
+    return getattr(_local, "collector", None)
+
+
+@contextmanager
+def detection_scope():
+    """
+    Make every strict mode container created in this block count its
+    violations in a collector instead of raising
+    """
+    global _active_count
+
+    collector = DetectionCollector()
+    previous = getattr(_local, "collector", None)
+    _local.collector = collector
+    with _lock:
+        _active_count += 1
+    try:
+        yield collector
+    finally:
+        with _lock:
+            _active_count -= 1
+        _local.collector = previous
+
+
+class LoggingSink:
+    def __call__(self, view_name, counts, sample_rate):
+        logger.warning(
+            "Strict mode violations in %s: %s",
+            view_name,
+            ", ".join(
+                f"{relation} {kind} x{count}"
+                for (kind, relation), count in sorted(counts.items())
+            ),
+        )
+
+
+class StatsdSink:
+    """
+    Sends a statsd counter per view, kind and relation in one UDP packet
+    """
+
+    _invalid_chars = re.compile(r"[^A-Za-z0-9_.\-]")
+
+    def __init__(self, host="localhost", port=8125, prefix="django_orm_plus"):
+        self._address = (host, port)
+        self._prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _clean(self, name):
+        return self._invalid_chars.sub("_", name)
+
+    def __call__(self, view_name, counts, sample_rate):
+        lines = [
+            "{}.{}.{}.{}:{}|c|@{}".format(
+                self._prefix,
+                kind,
+                self._clean(view_name),
+                self._clean(relation),
+                count,
+                sample_rate,
+            )
+            for (kind, relation), count in sorted(counts.items())
+        ]
+        try:
+            self._socket.sendto("\n".join(lines).encode(), self._address)
+        except OSError:
+            logger.exception("Could not send strict mode violations to statsd")
+
+
+_sinks = {}
+
+
+def get_sink():
+    sink = config.sampled_detection_sink
+    if callable(sink):
+        return sink
+
+    if sink not in _sinks:
+        if sink == "logging":
+            _sinks[sink] = LoggingSink()
+        elif sink == "statsd":
+            _sinks[sink] = StatsdSink(**config.sampled_detection_statsd)
+        else:
+            _sinks[sink] = import_string(sink)
+    return _sinks[sink]
@@ -0,0 +1,133 @@
+from django.db.models.constants import LOOKUP_SEP
+
+from ._fetch_related import AutoFetch, AutoFetchList
+from ._util import get_fields_map_for_model
+
+
+_fetch_plan_cache = {}
+
+
+class FetchPlan:
+    """
+    The relations to fetch for a field declaration, and the fields to load
+    for the objects of each relation
+    """
+
+    def __init__(self):
+        self.lookups = AutoFetchList()
+        self.only = {}
+
+    def add_lookup(self, lookup):
+        self.lookups.add_autofetch(AutoFetch(lookup))
+
+    def add_only(self, lookup, field_name):
+        self.only.setdefault(lookup, set()).add(field_name)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__} {list(self.lookups)} {self.only}"
+
+
+def _is_serializer(declaration):
+    return hasattr(getattr(declaration, "Meta", None), "model")
+
+
+def _get_source(name, declared_field):
+    source = getattr(declared_field, "source", None)
+    if source is None:
+        source = getattr(declared_field, "_kwargs", {}).get("source")
+    return source or name
+
+
+def _nest_source(source, declaration):
+    *path, name = source.split(".")
+    nested = {name: declaration}
+    for part in reversed(path):
+        nested = {part: nested}
+    return nested
+
+
+def _iter_serializer_fields(serializer, model):
+    meta = serializer.Meta
+    declared_fields = getattr(serializer, "_declared_fields", {})
+    fields = getattr(meta, "fields", None)
+
+    if fields is None or fields == "__all__":
+        fields = [
+            field.name
+            for field in model._meta.get_fields()
+            if field.concrete or field.many_to_many and not field.auto_created
+        ]
+        fields += [name for name in declared_fields if name not in fields]
+    fields = [name for name in fields if name not in getattr(meta, "exclude", ())]
+
+    for name in fields:
+        if name not in declared_fields:
+            yield name, None
+            continue
+
+        declared_field = declared_fields[name]
+        source = _get_source(name, declared_field)
+        if source == "*":
+            # eg. a SerializerMethodField, which can't be introspected
+            continue
+
+        nested = getattr(declared_field, "child", declared_field)
+        if not _is_serializer(nested):
+            nested = None
+        yield from _iter_declaration(_nest_source(source, nested), model)
+
+
+def _iter_declaration(declaration, model):
+    if _is_serializer(declaration):
+        yield from _iter_serializer_fields(declaration, model)
+    elif isinstance(declaration, dict):
+        for name, nested in declaration.items():
+            yield name, None if nested is True else nested
+    else:
+        for name in declaration:
+            yield name, None
+
+
+def _walk(plan, model, declaration, lookup):
+    fields_map = get_fields_map_for_model(model._meta)
+    plan.add_only(lookup, model._meta.pk.name)
+
+    for name, nested in _iter_declaration(declaration, model):
+        field = fields_map.get(name)
+        if field is None:
+            # not a model field, eg. a property
+            continue
+
+        is_column = field.concrete and not field.many_to_many
+        if is_column:
+            plan.add_only(lookup, field.name)
+        if not field.is_relation or (is_column and nested is None):
+            # the foreign key column is enough to serialize the primary key
+            continue
+
+        related_lookup = LOOKUP_SEP.join([lookup, name]) if lookup else name
+        plan.add_lookup(related_lookup)
+        if not field.concrete and not field.many_to_many:
+            # reverse relations are matched up using the remote foreign key
+            plan.add_only(related_lookup, field.field.name)
+        _walk(plan, field.related_model, nested or (), related_lookup)
+
+
+def build_fetch_plan(model, declaration) -> FetchPlan:
+    """
+    Build the minimal fetch plan needed to access the fields in `declaration`
+
+    :param declaration: A nested dict of field names (a value of None or True
+        means the field is not followed any further), a list of field names,
+        or a DRF-style serializer class. Plans for serializer classes are cached
+    """
+    cacheable = isinstance(declaration, type)
+    if cacheable and (model, declaration) in _fetch_plan_cache:
+        return _fetch_plan_cache[(model, declaration)]
+
+    plan = FetchPlan()
+    _walk(plan, model, declaration, "")
+
+    if cacheable:
+        _fetch_plan_cache[(model, declaration)] = plan
+    return plan
@@ -0,0 +1,190 @@
+import contextlib
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from os.path import dirname
+
+import django
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.constants import LOOKUP_SEP
+
+
+logger = logging.getLogger("django_orm_plus")
+
+MISSING_RELATION = "relation"
+MISSING_DEFERRED_FIELD = "deferred_field"
+
+# with a trailing separator, so that eg. django_filters isn't skipped too
+_LIBRARY_PATHS = (
+    dirname(django.__file__) + os.sep,
+    dirname(__file__) + os.sep,
+    contextlib.__file__,
+)
+
+
+def get_call_site():
+    """
+    :return: The innermost frame outside of Django and this library
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_LIBRARY_PATHS):
+        frame = frame.f_back
+
+    if frame is None:
+        return "<unknown>"
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries(using):
+    counter = QueryCounter()
+    with connections[using or DEFAULT_DB_ALIAS].execute_wrapper(counter):
+        yield counter
+
+
+class MissingFetch:
+    """
+    Aggregated lazy loads of one relation (or deferred field) path
+    """
+
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.count = 0
+        self.num_queries = 0
+        self.call_sites = set()
+
+    @property
+    def lookup(self):
+        return LOOKUP_SEP.join(self.path)
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "lookup": self.lookup,
+            "count": self.count,
+            "num_queries": self.num_queries,
+            "call_sites": sorted(self.call_sites),
+        }
+
+
+class FetchRecorder:
+    """
+    Collects the lazy loads allowed by strict mode's record mode, grouped by
+    the model and call site of the root queryset they were loaded from
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._missing_fetches = {}
+
+    def record(self, root, kind, path, call_site, num_queries):
+        root = root or ("<unknown>", "<unknown>")
+        logger.warning(
+            "Missing fetch of %s from %s queried at %s, accessed at %s (%d queries)",
+            LOOKUP_SEP.join(path),
+            *root,
+            call_site,
+            num_queries,
+        )
+
+        with self._lock:
+            missing_fetches = self._missing_fetches.setdefault(root, {})
+            missing_fetch = missing_fetches.get((kind, path))
+            if missing_fetch is None:
+                missing_fetch = missing_fetches[(kind, path)] = MissingFetch(kind, path)
+
+            missing_fetch.count += 1
+            missing_fetch.num_queries += num_queries
+            missing_fetch.call_sites.add(call_site)
+
+    def clear(self):
+        with self._lock:
+            self._missing_fetches.clear()
+
+    def get_report(self):
+        """
+        :return: For each root queryset, the suggested `fetch_related`
+            arguments and the missing fetches they were derived from
+        """
+        report = []
+
+        with self._lock:
+            items = sorted(self._missing_fetches.items())
+
+        for (model_label, call_site), missing_fetches in items:
+            missing_fetches = sorted(
+                missing_fetches.values(), key=lambda m: (m.kind, m.path)
+            )
+            lookups = [m.lookup for m in missing_fetches if m.kind == MISSING_RELATION]
+            report.append(
+                {
+                    "model": model_label,
+                    "call_site": call_site,
+                    "fetch_related": [
+                        lookup
+                        for lookup in lookups
+                        if not any(
+                            other.startswith(lookup + LOOKUP_SEP) for other in lookups
+                        )
+                    ],
+                    "deferred_fields": [
+                        m.lookup
+                        for m in missing_fetches
+                        if m.kind == MISSING_DEFERRED_FIELD
+                    ],
+                    "missing_fetches": [m.as_dict() for m in missing_fetches],
+                }
+            )
+        return report
+
+    def format_report(self):
+        lines = []
+
+        for entry in self.get_report():
+            lines.append(f"{entry['model']} queried at {entry['call_site']}")
+            if entry["fetch_related"]:
+                args = ", ".join(f'"{lookup}"' for lookup in entry["fetch_related"])
+                lines.append(f"    suggested: .fetch_related({args})")
+            if entry["deferred_fields"]:
+                fields = ", ".join(entry["deferred_fields"])
+                lines.append(f"    deferred fields loaded lazily: {fields}")
+            for missing_fetch in entry["missing_fetches"]:
+                lines.append(
+                    "    {lookup}: {count} lazy loads, {num_queries} queries".format(
+                        **missing_fetch
+                    )
+                )
+        return "\n".join(lines)
+
+
+fetch_recorder = FetchRecorder()
+
+
+@contextmanager
+def record_missing_fetch(strict_mode, kind, path, using, relation):
+    """
+    Allow a lazy load and record it along with the queries it causes
+
+    Sampled requests only count it under `relation` (eg. "Pizza.toppings")
+    """
+    if strict_mode.collector is not None:
+        strict_mode.collector.add(kind, relation)
+        yield
+        return
+
+    call_site = get_call_site()
+    with count_queries(using) as counter:
+        yield
+    fetch_recorder.record(strict_mode.root, kind, path, call_site, counter.count)
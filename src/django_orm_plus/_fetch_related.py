@@ -5,6 +5,7 @@ from django.db import models
 from django.db.models.constants import LOOKUP_SEP
 
 from .exceptions import InvalidLookupError
+from ._relation_cache import is_cacheable_relation
 from ._util import cmp, get_fields_map_for_model
 
 
@@ -63,6 +64,15 @@ class AutoFetchList:
         for i in sorted(self._autofetches.keys()):
             yield from self._autofetches[i]
 
+    def is_leaf(self, autofetch: AutoFetch):
+        """
+        True if no other lookup goes through `autofetch`
+        """
+        return not any(
+            other.lookup_split[: len(autofetch.lookup_split)] == autofetch.lookup_split
+            for other in self._autofetches.get(autofetch.depth + 1, [])
+        )
+
     def __repr__(self):
         return f"{self.__class__.__name__} {self._autofetches}"
 
@@ -97,10 +107,12 @@ def get_field_for_lookup(lookup: AutoFetch, base_model_meta):
 
 
 class QuerySetFetchBuilder:
-    def __init__(self, qs):
+    def __init__(self, qs, to_attr_suffix=None):
         self._prefetch_map = {}
+        self._cached_lookups = set()
         self._qs = qs
         self._model_meta = qs.model._meta
+        self._to_attr_suffix = to_attr_suffix
 
     def _get_prefetch_map_info(self, lookup: AutoFetch):
         lookup_parts = lookup.lookup_split[:-1]
@@ -114,10 +126,21 @@ class QuerySetFetchBuilder:
                 return prefetch_through, prefetch_to
         return None, lookup_full_path
 
-    def _add_fetch_for_field(self, lookup: AutoFetch, field: models.Field, descriptor):
+    def _add_fetch_for_field(
+        self, lookup: AutoFetch, field: models.Field, descriptor, is_leaf=False
+    ):
         prefetch_through, prefetch_to = self._get_prefetch_map_info(lookup)
 
         def add_fetch_to_qs(qs):
+            if (
+                is_leaf
+                and hasattr(qs, "fetch_from_relation_cache")
+                and is_cacheable_relation(field)
+                # cached many to many hops are stored behind the manager
+                and not (field.many_to_many and self._to_attr_suffix)
+            ):
+                self._cached_lookups.add(lookup.lookup)
+                return qs.fetch_from_relation_cache(prefetch_to)
             if field.one_to_one or field.many_to_one:
                 return qs.select_related(prefetch_to)
             if field.one_to_many or field.many_to_many:
@@ -126,7 +149,12 @@ class QuerySetFetchBuilder:
                 else:
                     prefetch_qs = descriptor.rel.model.objects.all()
 
-                prefetch = models.Prefetch(prefetch_to, queryset=prefetch_qs)
+                to_attr = None
+                if self._to_attr_suffix:
+                    to_attr = lookup.lookup_split[-1] + self._to_attr_suffix
+                prefetch = models.Prefetch(
+                    prefetch_to, queryset=prefetch_qs, to_attr=to_attr
+                )
                 self._prefetch_map[lookup.lookup] = prefetch
                 return qs.prefetch_related(prefetch)
             return qs
@@ -142,23 +170,68 @@ class QuerySetFetchBuilder:
                 prefetch.queryset,
             )
 
-    def add_lookup(self, lookup: AutoFetch):
+    def add_lookup(self, lookup: AutoFetch, is_leaf=False):
         field, descriptor = get_field_for_lookup(lookup, self._model_meta)
-        self._add_fetch_for_field(lookup, field, descriptor)
+        self._add_fetch_for_field(lookup, field, descriptor, is_leaf)
+
+    def apply_only(self, only):
+        """
+        :param only: Map of lookup ("" for the base model) to the field names
+            that should be loaded for the objects fetched by that lookup
+        """
+        only_by_prefetch = {}
+
+        for lookup, field_names in only.items():
+            if lookup in self._cached_lookups:
+                # cached relations always load every column
+                continue
+
+            lookup_parts = lookup.split(LOOKUP_SEP) if lookup else []
+            prefetch_through, prefetch_to = None, lookup
+            for i in reversed(range(0, len(lookup_parts))):
+                through = LOOKUP_SEP.join(lookup_parts[: i + 1])
+                if through in self._prefetch_map:
+                    prefetch_through = through
+                    prefetch_to = LOOKUP_SEP.join(lookup_parts[i + 1 :])  # noqa
+                    break
+
+            only_by_prefetch.setdefault(prefetch_through, []).extend(
+                LOOKUP_SEP.join([prefetch_to, field_name])
+                if prefetch_to
+                else field_name
+                for field_name in sorted(field_names)
+            )
+
+        for prefetch_through, field_names in only_by_prefetch.items():
+            if prefetch_through is None:
+                self._qs = self._qs.only(*field_names)
+            else:
+                prefetch = self._prefetch_map[prefetch_through]
+                prefetch.queryset = prefetch.queryset.only(*field_names)
 
     def get_qs(self):
         return self._qs
 
 
-def fetch_related(qs: models.QuerySet, attrs: List):
-    if not attrs:
-        return qs
-
-    lookups = normalize_lookups(attrs)
-    builder = QuerySetFetchBuilder(qs)
+def build_qs(
+    qs: models.QuerySet, lookups: AutoFetchList, only=None, to_attr_suffix=None
+):
+    """
+    :param to_attr_suffix: Store the objects of prefetched relations as lists
+        in an attribute named after the relation with this suffix, instead of
+        in a queryset per parent behind the related manager
+    """
+    builder = QuerySetFetchBuilder(qs, to_attr_suffix)
 
     for lookup in lookups:
-        builder.add_lookup(lookup)
+        builder.add_lookup(lookup, lookups.is_leaf(lookup))
+    if only:
+        builder.apply_only(only)
+    return builder.get_qs()
+
+
+def fetch_related(qs: models.QuerySet, attrs: List, to_attr_suffix=None):
+    if not attrs:
+        return qs
 
-    qs = builder.get_qs()
-    return qs
+    return build_qs(qs, normalize_lookups(attrs), to_attr_suffix=to_attr_suffix)
@@ -0,0 +1,237 @@
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.db import models
+
+
+_local = Local()
+
+
+class IdentityMap:
+    """
+    Maps (model, pk) to the one instance that represents that row
+    """
+
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, model, pk):
+        return self._objects.get(model, {}).get(pk)
+
+    def get_objects(self, model):
+        return self._objects.get(model, {}).values()
+
+    def __len__(self):
+        return sum(len(objs) for objs in self._objects.values())
+
+    def canonicalize(self, objs, to_attrs=()):
+        """
+        Replace every instance reachable from `objs` through the select_related
+        and prefetch caches with the first instance seen for its (model, pk)
+
+        :param to_attrs: Attributes that prefetches store lists of objects in,
+            see `get_prefetch_to_attrs`
+        """
+        seen = {}
+        canonical_objs = []
+        for obj in objs:
+            if isinstance(obj, models.Model):
+                obj = self._canonicalize(obj, seen, to_attrs)
+            canonical_objs.append(obj)
+        return canonical_objs
+
+    def _canonicalize_all(self, objs, seen, to_attrs):
+        return [self._canonicalize(obj, seen, to_attrs) for obj in objs]
+
+    def _canonicalize(self, obj, seen, to_attrs):
+        if id(obj) in seen:
+            return seen[id(obj)]
+        if obj.pk is None:
+            seen[id(obj)] = obj
+            return obj
+
+        objects = self._objects.setdefault(obj.__class__, {})
+        canonical = objects.setdefault(obj.pk, obj)
+        seen[id(obj)] = canonical
+        is_duplicate = canonical is not obj
+        if is_duplicate:
+            self._merge_fields(canonical, obj)
+
+        canonical_fields_cache = canonical._state.fields_cache
+        for name, value in list(obj._state.fields_cache.items()):
+            if is_duplicate and name in canonical_fields_cache:
+                continue
+            if isinstance(value, models.Model):
+                value = self._canonicalize(value, seen, to_attrs)
+            canonical_fields_cache[name] = value
+
+        prefetched = getattr(obj, "_prefetched_objects_cache", {})
+        if prefetched and is_duplicate:
+            if not hasattr(canonical, "_prefetched_objects_cache"):
+                canonical._prefetched_objects_cache = {}
+            canonical_prefetched = canonical._prefetched_objects_cache
+        else:
+            canonical_prefetched = prefetched
+
+        for name, qs in prefetched.items():
+            if is_duplicate and name in canonical_prefetched:
+                continue
+            if qs._result_cache is not None:
+                qs._result_cache = self._canonicalize_all(
+                    qs._result_cache, seen, to_attrs
+                )
+            canonical_prefetched[name] = qs
+
+        for to_attr in to_attrs:
+            related_objs = obj.__dict__.get(to_attr)
+            if not isinstance(related_objs, list) or (
+                is_duplicate and to_attr in canonical.__dict__
+            ):
+                continue
+            setattr(
+                canonical,
+                to_attr,
+                self._canonicalize_all(related_objs, seen, to_attrs),
+            )
+        return canonical
+
+    def _merge_fields(self, canonical, obj):
+        """
+        Fill in the fields the canonical instance has deferred from a duplicate
+        that loaded them, eg. when the first query used `only()`, and keep the
+        stricter of their strict modes
+        """
+        for attname in canonical.get_deferred_fields() - obj.get_deferred_fields():
+            canonical.__dict__[attname] = obj.__dict__[attname]
+
+        strict_mode = obj.__dict__.get("_strict_mode")
+        canonical_strict_mode = canonical.__dict__.get("_strict_mode")
+        if (
+            strict_mode is not None
+            and strict_mode.strict_mode
+            and (canonical_strict_mode is None or not canonical_strict_mode.strict_mode)
+        ):
+            canonical._strict_mode = strict_mode
+
+
+def get_prefetch_to_attrs(lookups):
+    """
+    :return: The `to_attr` of every `Prefetch` in `lookups`, and in the
+        lookups of their querysets
+    """
+    to_attrs = set()
+    for lookup in lookups:
+        if not isinstance(lookup, models.Prefetch):
+            continue
+        if lookup.to_attr:
+            to_attrs.add(lookup.to_attr)
+        if lookup.queryset is not None:
+            to_attrs |= get_prefetch_to_attrs(lookup.queryset._prefetch_related_lookups)
+    return to_attrs
+
+
+def get_active_identity_map():
+    """
+    The identity map of the queryset currently being evaluated, if any
+    """
+    return getattr(_local, "active", None)
+
+
+@contextmanager
+def identity_map_scope(identity_map=None):
+    """
+    Share one identity map between all the identity-mapped querysets
+    evaluated in this block, eg. for the duration of a request
+    """
+    previous = getattr(_local, "scope", None)
+    _local.scope = identity_map if identity_map is not None else IdentityMap()
+    try:
+        yield _local.scope
+    finally:
+        _local.scope = previous
+
+
+@contextmanager
+def evaluation_identity_map():
+    """
+    Activate the scoped identity map, or a fresh one, while a queryset and
+    its prefetches are evaluated
+    """
+    previous = get_active_identity_map()
+    identity_map = getattr(_local, "scope", None)
+    if identity_map is None:
+        identity_map = IdentityMap()
+    _local.active = identity_map
+    try:
+        yield identity_map
+    finally:
+        _local.active = previous
+
+
+def _has_select_related(obj, select_related):
+    for name, nested in select_related.items():
+        if name not in obj._state.fields_cache:
+            return False
+        related_obj = obj._state.fields_cache[name]
+        if related_obj is not None and not _has_select_related(related_obj, nested):
+            return False
+    return True
+
+
+def _can_reuse_loaded_objects(queryset):
+    query = queryset.query
+    return (
+        not query.where
+        and not query.annotations
+        and not query.extra
+        and not query.distinct
+        and not queryset.ordered
+        and query.low_mark == 0
+        and query.high_mark is None
+        and query.deferred_loading == (frozenset(), True)
+        and isinstance(query.select_related, (bool, dict))
+        and query.select_related is not True
+    )
+
+
+def get_prefetch_queryset_skipping_loaded(
+    manager, get_prefetch_queryset, identity_map, instances, queryset=None
+):
+    """
+    Wraps a reverse foreign key manager's `get_prefetch_queryset` so that
+    children already in the identity map are excluded from the query and
+    attached from memory instead
+
+    The rows of the prefetching queryset are registered before its prefetches
+    run, but the rows of its other prefetches only once it's been evaluated
+    """
+    field = getattr(manager, "field", None)
+
+    if (
+        queryset is None
+        or not isinstance(field, models.ForeignKey)
+        or len(field.foreign_related_fields) != 1
+        or not _can_reuse_loaded_objects(queryset)
+    ):
+        return get_prefetch_queryset(instances, queryset)
+
+    target_attname = field.foreign_related_fields[0].attname
+    instances_by_value = {getattr(inst, target_attname): inst for inst in instances}
+    select_related = queryset.query.select_related or {}
+    loaded = [
+        obj
+        for obj in identity_map.get_objects(manager.model)
+        if getattr(obj, field.attname) in instances_by_value
+        and not obj.get_deferred_fields()
+        and _has_select_related(obj, select_related)
+    ]
+    if not loaded:
+        return get_prefetch_queryset(instances, queryset)
+
+    queryset = queryset.exclude(pk__in=[obj.pk for obj in loaded])
+    rel_qs, *rest = get_prefetch_queryset(instances, queryset)
+
+    for obj in loaded:
+        field.set_cached_value(obj, instances_by_value[getattr(obj, field.attname)])
+    rel_qs._result_cache = list(rel_qs) + loaded
+    return (rel_qs, *rest)
@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+
+from ._fetch_recorder import count_queries
+from ._query_budget import query_budget
+from . import signals
+
+
+PREFETCH_SOURCE_PREFIX = "prefetch "
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+class PhaseTimer:
+    """
+    Times phases and counts their queries, only if anyone is listening to
+    `signal` from `sender` or `enabled` is set
+    """
+
+    def __init__(self, signal, sender, using, enabled=False):
+        self.enabled = enabled or signal.has_listeners(sender)
+        self.using = using
+        self.timings = {}
+        self.num_queries = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return _null_phase
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name):
+        start = time.perf_counter()
+        with count_queries(self.using) as counter:
+            yield
+        self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+        self.num_queries[name] = self.num_queries.get(name, 0) + counter.count
+
+
+def send_strict_mode_violation(kind, relation, raised):
+    if signals.strict_mode_violation.has_listeners():
+        signals.strict_mode_violation.send(
+            sender=None, kind=kind, relation=relation, raised=raised
+        )
+
+
+def should_instrument_fetch_related(qs):
+    if not qs._fetch_related_lookups:
+        return False
+    return signals.fetch_related_executed.has_listeners(qs.model)
+
+
+@contextmanager
+def instrument_fetch_related(qs):
+    start = time.perf_counter()
+    with query_budget(using=qs.db) as recorder:
+        yield
+    duration = time.perf_counter() - start
+
+    prefetches = {}
+    for statement in recorder.statements:
+        if statement.source.startswith(PREFETCH_SOURCE_PREFIX):
+            lookup = statement.source[len(PREFETCH_SOURCE_PREFIX) :]  # noqa
+            prefetch = prefetches.setdefault(
+                lookup, {"lookup": lookup, "num_queries": 0, "num_rows": 0}
+            )
+            prefetch["num_queries"] += 1
+            prefetch["num_rows"] += statement.rows
+
+    signals.fetch_related_executed.send(
+        sender=qs.model,
+        lookups=qs._fetch_related_lookups,
+        duration=duration,
+        num_queries=len(recorder.statements),
+        num_rows=recorder.num_rows,
+        prefetches=list(prefetches.values()),
+    )
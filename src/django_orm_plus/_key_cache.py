@@ -0,0 +1,99 @@
+from django.db import transaction
+
+from ._config import config
+from ._relation_cache import LocalRelationCache
+
+
+DEFAULT_MAX_SIZE = 10000
+# entries of writes that aren't seen, eg. in other processes, expire after this
+DEFAULT_TTL = 60
+
+_key_caches = {}
+
+
+class KeyCache:
+    """
+    In-process LRU cache of the values of recently upserted records, by their
+    lookup values
+
+    Entries are only written once the transaction that wrote the records
+    commits, so rolled back writes are never cached
+    """
+
+    def __init__(self, ttl=None, max_size=DEFAULT_MAX_SIZE):
+        self._entries = LocalRelationCache(ttl, max_size)
+
+    def get_many(self, db, lookup_fields, keys):
+        """
+        :return: The values of the concrete fields of the records of the
+            cached `keys`, by key
+        """
+        found = self._entries.get_many(
+            [(db, tuple(lookup_fields), key) for key in keys]
+        )
+        return {key: values for (_, _, key), values in found.items()}
+
+    def set_many(self, db, lookup_fields, records_by_key, converters):
+        """
+        :param converters: `to_python` of every concrete field, by attname,
+            so that values are cached as they are read from the database
+        """
+        entries = {
+            (db, tuple(lookup_fields), key): tuple(
+                to_python(getattr(record, attname))
+                for attname, to_python in converters.items()
+            )
+            for key, record in records_by_key.items()
+            # reading deferred fields would query them
+            if not record.get_deferred_fields()
+        }
+        transaction.on_commit(lambda: self._entries.set_many(entries), using=db)
+
+    def delete_many(self, db, lookup_fields, keys):
+        keys = [(db, tuple(lookup_fields), key) for key in keys]
+        self._entries.delete_many(keys)
+        transaction.on_commit(lambda: self._entries.delete_many(keys), using=db)
+
+    def clear(self, db):
+        self._entries.clear()
+        transaction.on_commit(self._entries.clear, using=db)
+
+
+def get_key_cache(model):
+    """
+    :return: The key cache for `model` if it is in `BULK_KEY_CACHES`, else
+        None
+    """
+    key_caches = config.bulk_key_caches
+    if not key_caches:
+        return None
+
+    label = model._meta.label
+    options = key_caches.get(label)
+    if options is None:
+        return None
+
+    if label not in _key_caches:
+        ttl = options.get("ttl", DEFAULT_TTL)
+        if ttl is None:
+            raise ValueError(f"The key cache of {label} needs a finite ttl")
+        _key_caches[label] = KeyCache(ttl, options.get("max_size", DEFAULT_MAX_SIZE))
+    return _key_caches[label]
+
+
+def invalidate_key_cache(model, db):
+    """
+    Forget the cached keys of `model`, after writes that don't keep them up
+    to date. Saves and deletes are connected to this in
+    `connect_invalidation_receivers`
+    """
+    key_cache = get_key_cache(model)
+    if key_cache is not None:
+        key_cache.clear(db)
+
+
+def reset_key_caches(**kwargs):
+    if kwargs.get("setting", "DJANGO_ORM_PLUS") != "DJANGO_ORM_PLUS":
+        return
+
+    _key_caches.clear()
@@ -0,0 +1,244 @@
+import logging
+import sys
+from contextlib import ContextDecorator, ExitStack
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import QuerySet
+from django.db.models.constants import LOOKUP_SEP
+
+from ._fetch_recorder import get_call_site
+from .exceptions import QueryBudgetExceeded
+
+
+logger = logging.getLogger("django_orm_plus")
+
+MAX_SOURCE_FRAMES = 64
+MAX_SQL_LENGTH = 200
+
+
+class Statement:
+    """
+    A query executed within a query budget
+    """
+
+    def __init__(self, sql, params, source, call_site):
+        self.sql = sql
+        self.params = params
+        self.source = source
+        self.call_site = call_site
+        self.rows = 0
+
+    def __repr__(self):
+        sql = self.sql
+        if len(sql) > MAX_SQL_LENGTH:
+            sql = sql[:MAX_SQL_LENGTH] + "..."
+        return f"{self.rows} rows, {self.source} at {self.call_site}: {sql}"
+
+
+def _describe_frame(frame):
+    """
+    :return: (is_specific, description) of what issued the query, if `frame`
+        can tell
+    """
+    code_name = frame.f_code.co_name
+    f_locals = frame.f_locals
+
+    if code_name == "prefetch_one_level" and "lookup" in f_locals:
+        lookup_parts = f_locals["lookup"].prefetch_through.split(LOOKUP_SEP)
+        level = f_locals.get("level", len(lookup_parts) - 1)
+        return True, "prefetch " + LOOKUP_SEP.join(lookup_parts[: level + 1])
+
+    if code_name == "refresh_from_db" and f_locals.get("fields"):
+        model_name = f_locals["self"].__class__.__name__
+        fields = ", ".join(f_locals["fields"])
+        return True, f"deferred field {model_name}.{fields}"
+
+    descriptor = f_locals.get("self")
+    instance = f_locals.get("instance")
+    if (
+        code_name == "__get__"
+        and instance is not None
+        and hasattr(descriptor, "get_prefetch_queryset")
+    ):
+        if hasattr(descriptor, "field"):
+            field_name = descriptor.field.name
+        else:  # reverse one to one
+            field_name = descriptor.related.get_accessor_name()
+        return True, f"lazy load {instance.__class__.__name__}.{field_name}"
+
+    qs = f_locals.get("self")
+    if code_name == "_fetch_all" and isinstance(qs, QuerySet):
+        strict_mode = getattr(qs, "_strict_mode", None)
+        if strict_mode is not None and strict_mode._parent_field_name:
+            return False, f"lazy load {strict_mode.relation}"
+
+        instance = qs._hints.get("instance")
+        if instance is not None:
+            return (
+                False,
+                f"lazy load {instance.__class__.__name__} -> {qs.model.__name__}",
+            )
+        return False, f"{qs.model.__name__} queryset"
+    return None
+
+
+def describe_source():
+    """
+    Describe which prefetch, lazy load or queryset issued the current query
+    by looking at the Django frames on the stack
+    """
+    frame = sys._getframe(2)
+    fallback = "query"
+
+    for _ in range(MAX_SOURCE_FRAMES):
+        if frame is None:
+            break
+
+        description = _describe_frame(frame)
+        if description is not None:
+            is_specific, source = description
+            if is_specific:
+                return source
+            if fallback == "query":
+                fallback = source
+        frame = frame.f_back
+    return fallback
+
+
+def _count_rows(cursor, statement):
+    fetchone = cursor.fetchone
+    fetchmany = cursor.fetchmany
+    fetchall = cursor.fetchall
+
+    def counting_fetchone():
+        row = fetchone()
+        if row is not None:
+            statement.rows += 1
+        return row
+
+    def counting_fetchmany(*args, **kwargs):
+        rows = fetchmany(*args, **kwargs)
+        statement.rows += len(rows)
+        return rows
+
+    def counting_fetchall():
+        rows = fetchall()
+        statement.rows += len(rows)
+        return rows
+
+    cursor.fetchone = counting_fetchone
+    cursor.fetchmany = counting_fetchmany
+    cursor.fetchall = counting_fetchall
+
+
+class _StatementRecorder:
+    """
+    Execute wrapper that records every statement of a query budget
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = Statement(sql, params, describe_source(), get_call_site())
+        self.statements.append(statement)
+        result = execute(sql, params, many, context)
+        _count_rows(context["cursor"], statement)
+        return result
+
+
+class query_budget(ContextDecorator):
+    """
+    Context manager and decorator that fails (or logs) when the queries run
+    inside of it exceed a budget
+
+    :param max_queries: Maximum number of queries
+    :param max_rows: Maximum number of rows fetched over all queries
+    :param max_duplicates: Maximum number of times the same query (with the
+        same parameters) may be repeated
+    :param raise_exception: Raise `QueryBudgetExceeded`, otherwise log a warning
+    :param using: Database alias, or list of aliases, to watch
+    """
+
+    def __init__(
+        self,
+        max_queries=None,
+        max_rows=None,
+        max_duplicates=None,
+        raise_exception=True,
+        using=DEFAULT_DB_ALIAS,
+    ):
+        self.max_queries = max_queries
+        self.max_rows = max_rows
+        self.max_duplicates = max_duplicates
+        self.raise_exception = raise_exception
+        self.using = [using] if isinstance(using, str) else list(using)
+        self.statements = []
+        self._exit_stack = None
+
+    def _recreate_cm(self):
+        return self.__class__(
+            self.max_queries,
+            self.max_rows,
+            self.max_duplicates,
+            self.raise_exception,
+            self.using,
+        )
+
+    def __enter__(self):
+        self.statements = []
+        recorder = _StatementRecorder(self.statements)
+        self._exit_stack = ExitStack()
+        for alias in self.using:
+            self._exit_stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._exit_stack.close()
+        if exc_type is None:
+            self.check()
+        return False
+
+    @property
+    def num_rows(self):
+        return sum(statement.rows for statement in self.statements)
+
+    def get_duplicates(self):
+        counts = {}
+        for statement in self.statements:
+            key = (statement.sql, repr(statement.params))
+            counts[key] = counts.get(key, 0) + 1
+        return {key: count for key, count in counts.items() if count > 1}
+
+    def get_violations(self):
+        violations = []
+
+        num_queries = len(self.statements)
+        if self.max_queries is not None and num_queries > self.max_queries:
+            violations.append(f"{num_queries} queries (max {self.max_queries})")
+        if self.max_rows is not None and self.num_rows > self.max_rows:
+            violations.append(f"{self.num_rows} rows (max {self.max_rows})")
+        if self.max_duplicates is not None:
+            for (sql, _), count in self.get_duplicates().items():
+                if count > self.max_duplicates:
+                    violations.append(
+                        f"{count} identical queries (max {self.max_duplicates}): "
+                        f"{sql[:MAX_SQL_LENGTH]}"
+                    )
+        return violations
+
+    def check(self):
+        violations = self.get_violations()
+        if not violations:
+            return
+
+        message = "\n".join(
+            ["Query budget exceeded: " + ", ".join(violations)]
+            + [
+                f"  {i}. {statement!r}"
+                for i, statement in enumerate(self.statements, start=1)
+            ]
+        )
+        if self.raise_exception:
+            raise QueryBudgetExceeded(message, self.statements)
+        logger.warning(message)
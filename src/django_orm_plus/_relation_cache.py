@@ -0,0 +1,342 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.signals import post_delete, post_save
+
+from ._config import config
+from ._util import get_fields_map_for_model
+
+
+DEFAULT_MAX_SIZE = 1024
+
+_relation_caches = {}
+# models whose saves and deletes invalidate their cached objects and keys
+_invalidated_models = set()
+
+
+class LocalRelationCache:
+    """
+    In-process LRU cache of row values, keyed by (database, pk)
+    """
+
+    def __init__(self, ttl=None, max_size=DEFAULT_MAX_SIZE):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+
+                expires_at, values = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = values
+        return found
+
+    def set_many(self, mapping):
+        expires_at = time.monotonic() + self._ttl if self._ttl is not None else None
+
+        with self._lock:
+            for key, values in mapping.items():
+                self._entries[key] = (expires_at, values)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoRelationCache:
+    """
+    Row values stored in one of Django's configured caches, so they are
+    shared (and invalidated) across processes
+
+    Django's caches can't list their keys, so keys include a generation that
+    `clear` replaces, orphaning the previous entries until they expire
+    """
+
+    def __init__(self, label, alias, ttl=None):
+        self._prefix = f"django_orm_plus:{label}"
+        self._generation_key = f"{self._prefix}:generation"
+        self._alias = alias
+        self._ttl = ttl
+
+    @property
+    def _cache(self):
+        return caches[self._alias]
+
+    def _get_generation(self):
+        # a random generation, so that an evicted one doesn't bring back
+        # entries that were cleared
+        return self._cache.get_or_set(
+            self._generation_key, lambda: uuid.uuid4().hex, timeout=None
+        )
+
+    def _make_key(self, generation, key):
+        return "{}:{}:{}:{}".format(self._prefix, generation, *key)
+
+    def get_many(self, keys):
+        generation = self._get_generation()
+        cache_keys = {self._make_key(generation, key): key for key in keys}
+        return {
+            cache_keys[cache_key]: values
+            for cache_key, values in self._cache.get_many(cache_keys).items()
+        }
+
+    def set_many(self, mapping):
+        generation = self._get_generation()
+        self._cache.set_many(
+            {
+                self._make_key(generation, key): values
+                for key, values in mapping.items()
+            },
+            timeout=self._ttl,
+        )
+
+    def delete_many(self, keys):
+        generation = self._get_generation()
+        self._cache.delete_many([self._make_key(generation, key) for key in keys])
+
+    def clear(self):
+        self._cache.set(self._generation_key, uuid.uuid4().hex, timeout=None)
+
+
+def get_relation_cache(model):
+    """
+    :return: The cache for `model` if it is in `CACHED_RELATIONS`, else None
+    """
+    cached_relations = config.cached_relations
+    if not cached_relations:
+        return None
+
+    label = model._meta.label
+    options = cached_relations.get(label)
+    if options is None:
+        return None
+
+    if label not in _relation_caches:
+        if "cache" in options:
+            relation_cache = DjangoRelationCache(
+                label, options["cache"], options.get("ttl")
+            )
+        else:
+            relation_cache = LocalRelationCache(
+                options.get("ttl"), options.get("max_size", DEFAULT_MAX_SIZE)
+            )
+        _relation_caches[label] = relation_cache
+    return _relation_caches[label]
+
+
+def reset_relation_caches(**kwargs):
+    if kwargs.get("setting", "DJANGO_ORM_PLUS") != "DJANGO_ORM_PLUS":
+        return
+
+    for relation_cache in _relation_caches.values():
+        relation_cache.clear()
+    _relation_caches.clear()
+    connect_invalidation_receivers()
+
+
+def invalidate_cached_objects(model, pks, using):
+    """
+    Forget the cached rows of `pks`, and again once the transaction commits,
+    as other connections can cache the rows they read until then
+    """
+    relation_cache = get_relation_cache(model)
+    if relation_cache is not None:
+        keys = [(using, pk) for pk in pks]
+        relation_cache.delete_many(keys)
+        transaction.on_commit(lambda: relation_cache.delete_many(keys), using=using)
+
+
+def invalidate_cached_instance(sender, instance, using, **kwargs):
+    from ._key_cache import invalidate_key_cache
+
+    invalidate_cached_objects(sender, [instance.pk], using)
+    # the key cache is keyed by lookup values, which the instance may have had
+    # other values of
+    invalidate_key_cache(sender, using)
+
+
+def connect_invalidation_receivers():
+    """
+    Only connect to the models with a relation or key cache, since a delete
+    receiver stops Django from deleting a model's rows without loading them
+    first
+    """
+    for model in _invalidated_models:
+        for signal in (post_save, post_delete):
+            signal.disconnect(sender=model, dispatch_uid="django_orm_plus_invalidate")
+    _invalidated_models.clear()
+
+    for label in set(config.cached_relations) | set(config.bulk_key_caches):
+        model = apps.get_model(label)
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_cached_instance,
+                sender=model,
+                dispatch_uid="django_orm_plus_invalidate",
+            )
+        _invalidated_models.add(model)
+
+
+def is_cacheable_relation(field):
+    if field.many_to_many:
+        if field.concrete:
+            through = field.remote_field.through
+        else:
+            through = field.through
+        return all(
+            f.target_field.primary_key
+            for f in through._meta.concrete_fields
+            if f.is_relation
+        ) and (get_relation_cache(field.related_model) is not None)
+
+    return (
+        (field.many_to_one or field.one_to_one)
+        and field.concrete
+        and field.target_field.primary_key
+        and get_relation_cache(field.related_model) is not None
+    )
+
+
+def _load_objects(model, pks, using):
+    relation_cache = get_relation_cache(model)
+    attnames = [field.attname for field in model._meta.concrete_fields]
+
+    found = relation_cache.get_many([(using, pk) for pk in pks])
+    missing = [pk for pk in pks if (using, pk) not in found]
+
+    if missing:
+        pk_index = attnames.index(model._meta.pk.attname)
+        fetched = {
+            (using, values[pk_index]): values
+            for values in model._base_manager.using(using)
+            .filter(pk__in=missing)
+            .values_list(*attnames)
+        }
+        relation_cache.set_many(fetched)
+        found.update(fetched)
+
+    return {
+        pk: model.from_db(using, attnames, values) for (_, pk), values in found.items()
+    }
+
+
+def _follow_path(objs, path):
+    for lookup_part in path:
+        if not objs:
+            break
+
+        field = get_fields_map_for_model(objs[0]._meta)[lookup_part]
+        related_objs = {}
+        for obj in objs:
+            related_obj = field.get_cached_value(obj, default=None)
+            if related_obj is not None:
+                related_objs[id(related_obj)] = related_obj
+        objs = list(related_objs.values())
+    return objs
+
+
+def _set_strict_mode(objs, strict_mode):
+    if strict_mode is None or not strict_mode.strict_mode:
+        return
+
+    for obj in objs:
+        if hasattr(obj, "_strict_mode"):
+            obj._strict_mode = strict_mode.clone(is_child=True)
+
+
+def _prefetch_many_to_many(parents, field, lookup_part, using, strict_mode):
+    if field.concrete:
+        through = field.remote_field.through
+        source_name = field.m2m_field_name()
+        target_name = field.m2m_reverse_field_name()
+    else:
+        through = field.through
+        source_name = field.field.m2m_reverse_field_name()
+        target_name = field.field.m2m_field_name()
+
+    source_attname = through._meta.get_field(source_name).attname
+    target_attname = through._meta.get_field(target_name).attname
+    memberships = list(
+        through._base_manager.using(using)
+        .filter(**{f"{source_attname}__in": [parent.pk for parent in parents]})
+        .values_list(source_attname, target_attname)
+    )
+    related_objs = _load_objects(
+        field.related_model, {target_pk for _, target_pk in memberships}, using
+    )
+    _set_strict_mode(related_objs.values(), strict_mode)
+
+    related_objs_by_parent = {}
+    for source_pk, target_pk in memberships:
+        if target_pk in related_objs:
+            related_objs_by_parent.setdefault(source_pk, []).append(
+                related_objs[target_pk]
+            )
+
+    for parent in parents:
+        manager = getattr(parent, lookup_part)
+        qs = manager.get_queryset()
+        qs._result_cache = related_objs_by_parent.get(parent.pk, [])
+        qs._prefetch_done = True
+        parent.__dict__.setdefault("_prefetched_objects_cache", {})
+        parent._prefetched_objects_cache[manager.prefetch_cache_name] = qs
+
+
+def _prefetch_many_to_one(parents, field, using, strict_mode):
+    pks = {getattr(parent, field.attname) for parent in parents} - {None}
+    related_objs = _load_objects(field.related_model, pks, using)
+    _set_strict_mode(related_objs.values(), strict_mode)
+
+    for parent in parents:
+        pk = getattr(parent, field.attname)
+        if pk is None or pk in related_objs:
+            field.set_cached_value(parent, related_objs.get(pk))
+
+
+def prefetch_cached_relations(objs, lookups, using, strict_mode=None):
+    """
+    Attach related objects for `lookups` to `objs`, serving the related rows
+    from their model's relation cache
+
+    Each lookup is a path of already select_related hops ending with a
+    foreign key, one to one or many to many hop onto a cached model
+    """
+    objs = [obj for obj in objs if isinstance(obj, models.Model)]
+
+    for lookup in lookups:
+        *path, lookup_part = lookup.split(LOOKUP_SEP)
+        parents = _follow_path(objs, path)
+        if not parents:
+            continue
+
+        field = get_fields_map_for_model(parents[0]._meta)[lookup_part]
+        if field.many_to_many:
+            _prefetch_many_to_many(parents, field, lookup_part, using, strict_mode)
+        else:
+            _prefetch_many_to_one(parents, field, using, strict_mode)
@@ -1,12 +1,20 @@
 from django.db import models
 
 from ._config import config
+from ._detection import MODIFIED_AFTER_FETCH, get_active_collector
+from ._fetch_recorder import (
+    MISSING_DEFERRED_FIELD,
+    MISSING_RELATION,
+    get_call_site,
+    record_missing_fetch,
+)
+from ._instrumentation import send_strict_mode_violation
 from .exceptions import (
     RelatedAttributeNeedsExplicitFetch,
     RelatedObjectNeedsExplicitFetch,
     QueryModifiedAfterFetch,
 )
-from ._util import get_fields_map_for_model
+from ._util import get_fields_map_for_model, hook_prefetch_queryset
 
 
 class StrictModeContainer:
@@ -17,46 +25,96 @@ class StrictModeContainer:
         self._parent_cls_name = None
         self._parent_field_name = None
 
+        # relation path from the root queryset, and the root queryset's
+        # (model label, call site) which are only tracked in record mode
+        self.path = ()
+        self.root = None
+
+        # set for the containers of sampled requests, which count violations
+        # instead of raising
+        self.collector = get_active_collector()
+
         self._strict_mode = False
-        self._strict_mode_override = config.strict_mode_global_override
+        self._record = False
+        if self.collector is None:
+            self._strict_mode_override = config.strict_mode_global_override
+            self._record_override = config.strict_mode_record
+        else:
+            self._strict_mode_override = True
+            self._record_override = True
 
     def clone(self, **kwargs):
         return self.clone_to(self.__class__(), **kwargs)
 
     def clone_to(
-        self, other, parent_cls_name=None, parent_field_name=None, is_child=None
+        self,
+        other,
+        parent_cls_name=None,
+        parent_field_name=None,
+        is_child=None,
+        path=None,
     ):
         other.strict_mode = self.strict_mode
+        other.record = self.record
         other._parent_cls_name = parent_cls_name or self._parent_cls_name
         other._parent_field_name = parent_field_name or self._parent_field_name
         other._is_child = is_child if is_child is not None else self._is_child
         other.is_for_prefetch = self.is_for_prefetch
+        other.path = path if path is not None else self.path
+        other.root = self.root
+        if self.collector is not None:
+            other.collector = self.collector
         return other
 
-    def enable_strict_mode(self):
+    def enable_strict_mode(self, record=False):
         self.strict_mode = True
+        self.record = self.record or record
+
+    def set_root(self, queryset):
+        if self.record and self.root is None and not self._is_child:
+            self.root = (queryset.model._meta.label, get_call_site())
 
     def verify_query_modification(self, queryset):
-        if not self.strict_mode:
+        if not self.strict_mode or self.is_for_prefetch:
+            # querysets used for prefetching are filtered by Django itself
             return
 
         if queryset._prefetch_done and self._is_child:
+            send_strict_mode_violation(
+                MODIFIED_AFTER_FETCH, self.relation, raised=self.collector is None
+            )
+            if self.collector is not None:
+                self.collector.add(MODIFIED_AFTER_FETCH, self.relation)
+                return
             raise QueryModifiedAfterFetch(
                 self._parent_cls_name, self._parent_field_name
             )
 
     def verify_prefetch(self, queryset):
+        """
+        :return: True if the queryset is a lazy load that should be recorded
+        """
         if not self.strict_mode:
-            return
+            return False
 
         if (
             queryset._result_cache is None
             and self._is_child
             and not self.is_for_prefetch
         ):
+            send_strict_mode_violation(
+                MISSING_RELATION, self.relation, raised=not self.record
+            )
+            if self.record:
+                return True
             raise RelatedObjectNeedsExplicitFetch(
                 self._parent_cls_name, self._parent_field_name
             )
+        return False
+
+    @property
+    def relation(self):
+        return f"{self._parent_cls_name}.{self._parent_field_name}"
 
     @property
     def strict_mode(self):
@@ -68,6 +126,16 @@ class StrictModeContainer:
     def strict_mode(self, val):
         self._strict_mode = val
 
+    @property
+    def record(self):
+        if self._record_override is not None:
+            return self._record_override
+        return self._record
+
+    @record.setter
+    def record(self, val):
+        self._record = val
+
 
 class StrictModeIterable(models.query.ModelIterable):
     def __iter__(self):
@@ -76,6 +144,7 @@ class StrictModeIterable(models.query.ModelIterable):
         for obj in super().__iter__():
             if qs_strict_mode and qs_strict_mode.strict_mode:
                 obj._strict_mode = qs_strict_mode.clone(is_child=True)
+                obj._strict_mode.is_for_prefetch = False
             yield obj
 
 
@@ -92,14 +161,25 @@ class StrictModeQuerySet(models.QuerySet):
         self._strict_mode.clone_to(qs._strict_mode)
         return qs
 
-    def strict(self):
+    def strict(self, record=False):
         qs = self._chain()
-        qs._strict_mode.enable_strict_mode()
+        qs._strict_mode.enable_strict_mode(record=record)
         return qs
 
     def _fetch_all(self):
-        self._strict_mode.verify_prefetch(self)
-        super()._fetch_all()
+        if not self._strict_mode.verify_prefetch(self):
+            if self._result_cache is None:
+                self._strict_mode.set_root(self)
+            return super()._fetch_all()
+
+        with record_missing_fetch(
+            self._strict_mode,
+            MISSING_RELATION,
+            self._strict_mode.path,
+            self.db,
+            self._strict_mode.relation,
+        ):
+            super()._fetch_all()
 
 
 class StrictModeManager(models.manager.BaseManager.from_queryset(StrictModeQuerySet)):
@@ -112,32 +192,157 @@ class StrictModeManager(models.manager.BaseManager.from_queryset(StrictModeQuery
         self._strict_mode.clone_to(qs._strict_mode)
         return qs
 
-    def __getattribute__(self, item):
-        """
-        I really would like to figure out an alternative to this, this is
-        essentially monkey-patching `get_prefetch_queryset` :(
-
-        I could not figure out another way to pass the _strict_mode parameter
-        to querysets that are provided via `Prefetch("x", queryset=...)`
-        """
-        ret = super().__getattribute__(item)
-
-        if item == "get_prefetch_queryset" and self._strict_mode.strict_mode:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # related managers are created by Django as subclasses of the related
+        # model's default manager
+        hook_prefetch_queryset(cls, _propagate_strict_mode)
+
+
+def _propagate_strict_mode(manager, get_prefetch_queryset, instances, queryset):
+    """
+    Pass the strict mode of the prefetched instances on to the queryset that
+    prefetches their relation, including ones from `Prefetch("x", queryset=...)`
+    """
+    if (
+        manager._strict_mode.strict_mode
+        and hasattr(queryset, "_strict_mode")
+        and hasattr(instances[0], "_strict_mode")
+    ):
+        instances[0]._strict_mode.clone_to(
+            queryset._strict_mode, path=manager._strict_mode.path
+        )
+        queryset._strict_mode.is_for_prefetch = True
+    return get_prefetch_queryset(instances, queryset)
+
+
+def _get_field_names(model):
+    field_names = model.__dict__.get("_strict_mode_field_names")
+    if field_names is None:
+        field_names = set(get_fields_map_for_model(model._meta).keys())
+        model._strict_mode_field_names = field_names
+    return field_names
+
+
+def _get_related_manager(obj, item, strict_mode, path, get_attribute):
+    """
+    Related managers are cached on the instance, sharing one strict mode
+    container, until its strict mode, pk or prefetch cache is replaced
+    """
+    related_managers = obj.__dict__.setdefault("_related_managers", {})
+    prefetch_cache = obj.__dict__.get("_prefetched_objects_cache")
+    pk = obj.pk
+
+    cached = related_managers.get(item)
+    if cached is not None:
+        cached_strict_mode, cached_pk, cached_prefetch_cache, manager = cached
+        if (
+            cached_strict_mode is strict_mode
+            and cached_pk == pk
+            and cached_prefetch_cache is prefetch_cache
+            and manager.instance is obj
+        ):
+            return manager
+
+    manager = get_attribute(item)
+    if hasattr(manager, "_strict_mode"):
+        manager._strict_mode = strict_mode.clone(
+            parent_cls_name=obj.__class__.__name__,
+            parent_field_name=item,
+            is_child=True,
+            path=path,
+        )
+    related_managers[item] = (strict_mode, pk, prefetch_cache, manager)
+    return manager
+
+
+def _get_attribute(obj, item, get_attribute):
+    """
+    Check the access of public attribute `item` against the strict mode of
+    `obj`
+
+    :param get_attribute: The model's own `__getattribute__`, bound to `obj`
+    """
+    if (
+        hasattr(obj, "_strict_mode")
+        and obj._strict_mode.strict_mode
+        and item in _get_field_names(obj.__class__)
+    ):
+        descriptor = getattr(obj.__class__, item)
+
+        if hasattr(descriptor, "field"):
+            field = descriptor.field
+        else:  # reverse one to one
+            field = descriptor.related.field
+
+        cls_name = obj.__class__.__name__
+        field_name = item
+        strict_mode = obj._strict_mode
+        # paths are only tracked in record mode
+        path = strict_mode.path
+        if strict_mode.record:
+            path += (field_name,)
+        relation = f"{cls_name}.{field_name}"
+
+        if isinstance(descriptor, models.query_utils.DeferredAttribute):
+            if field_name not in obj.__dict__ and not descriptor._check_parent_chain(
+                obj
+            ):
+                send_strict_mode_violation(
+                    MISSING_DEFERRED_FIELD, relation, raised=not strict_mode.record
+                )
+                if not strict_mode.record:
+                    raise RelatedAttributeNeedsExplicitFetch(
+                        cls_name,
+                        field_name,
+                    )
+                with record_missing_fetch(
+                    strict_mode,
+                    MISSING_DEFERRED_FIELD,
+                    path,
+                    obj._state.db,
+                    relation,
+                ):
+                    return get_attribute(item)
+            return get_attribute(item)
+
+        if hasattr(descriptor, "is_cached"):
+            if strict_mode.strict_mode:
+                if descriptor.is_cached(obj):
+                    ret = get_attribute(item)
+                elif strict_mode.record:
+                    send_strict_mode_violation(MISSING_RELATION, relation, raised=False)
+                    with record_missing_fetch(
+                        strict_mode,
+                        MISSING_RELATION,
+                        path,
+                        obj._state.db,
+                        relation,
+                    ):
+                        ret = get_attribute(item)
+                else:
+                    send_strict_mode_violation(MISSING_RELATION, relation, raised=True)
+                    raise RelatedObjectNeedsExplicitFetch(
+                        cls_name,
+                        field_name,
+                    )
 
-            def get_prefetch_queryset(instances, queryset=None):
-                if queryset is None:
-                    queryset = self.get_queryset()
+                if hasattr(ret, "_strict_mode"):
+                    ret._strict_mode = strict_mode.clone(
+                        parent_cls_name=cls_name,
+                        parent_field_name=field_name,
+                        is_child=True,
+                        path=path,
+                    )
+                return ret
+        elif field.many_to_one or field.many_to_many:
+            return _get_related_manager(obj, item, strict_mode, path, get_attribute)
+    return get_attribute(item)
 
-                if hasattr(queryset, "_strict_mode") and hasattr(
-                    instances[0], "_strict_mode"
-                ):
-                    instances[0]._strict_mode.clone_to(queryset._strict_mode)
-                    queryset._strict_mode.is_for_prefetch = True
-                    return ret(instances, queryset)
-                return ret(instances, queryset)
 
-            return get_prefetch_queryset
-        return ret
+def _drop_related_managers(state):
+    state.pop("_related_managers", None)
+    return state
 
 
 class StrictModeModelMixin(models.Model):
@@ -147,67 +352,39 @@ class StrictModeModelMixin(models.Model):
         super().__init__(*args, **kwargs)
         self._strict_mode = StrictModeContainer()
 
-    @classmethod
-    def __get_fields(cls):
-        if not hasattr(cls, "__get_fields_cache"):
-            cls.__get_fields_cache = set(get_fields_map_for_model(cls._meta).keys())
-        return cls.__get_fields_cache
-
     def __getattribute__(self, item):
-        if (
-            not item.startswith("_")
-            and hasattr(self, "_strict_mode")
-            and self._strict_mode.strict_mode
-            and item in self.__get_fields()
-        ):
-            descriptor = getattr(self.__class__, item)
+        if item.startswith("_"):
+            return super().__getattribute__(item)
+        return _get_attribute(self, item, super().__getattribute__)
 
-            if hasattr(descriptor, "field"):
-                field = descriptor.field
-            else:  # reverse one to one
-                field = descriptor.related.field
+    def __getstate__(self):
+        return _drop_related_managers(super().__getstate__())
 
-            cls_name = self.__class__.__name__
-            field_name = item
+    class Meta:
+        abstract = True
 
-            if isinstance(descriptor, models.query_utils.DeferredAttribute):
-                if (
-                    field_name not in self.__dict__
-                    and not descriptor._check_parent_chain(self)
-                ):
-                    raise RelatedAttributeNeedsExplicitFetch(
-                        cls_name,
-                        field_name,
-                    )
-                return super().__getattribute__(item)
-
-            if hasattr(descriptor, "is_cached"):
-                if self._strict_mode.strict_mode:
-                    if not descriptor.is_cached(self):
-                        raise RelatedObjectNeedsExplicitFetch(
-                            cls_name,
-                            field_name,
-                        )
-                    ret = super().__getattribute__(item)
-
-                    if hasattr(ret, "_strict_mode"):
-                        ret._strict_mode = self._strict_mode.clone(
-                            parent_cls_name=cls_name,
-                            parent_field_name=field_name,
-                            is_child=True,
-                        )
-                    return ret
-            elif field.many_to_one or field.many_to_many:
-                ret = super().__getattribute__(item)
 
-                if hasattr(ret, "_strict_mode"):
-                    ret._strict_mode = self._strict_mode.clone(
-                        parent_cls_name=cls_name,
-                        parent_field_name=field_name,
-                        is_child=True,
-                    )
-                return ret
-        return super().__getattribute__(item)
+def add_strict_mode_to_model(model):
+    """
+    Give `model` the instance behaviour of `StrictModeModelMixin` by wrapping
+    its own methods, instead of adding the mixin to its bases
+    """
+    model_init = model.__init__
+    model_getattribute = model.__getattribute__
+    model_getstate = model.__getstate__
 
-    class Meta:
-        abstract = True
+    def __init__(self, *args, **kwargs):
+        model_init(self, *args, **kwargs)
+        self._strict_mode = StrictModeContainer()
+
+    def __getattribute__(self, item):
+        if item.startswith("_"):
+            return model_getattribute(self, item)
+        return _get_attribute(self, item, model_getattribute.__get__(self))
+
+    def __getstate__(self):
+        return _drop_related_managers(model_getstate(self))
+
+    model.__init__ = __init__
+    model.__getattribute__ = __getattribute__
+    model.__getstate__ = __getstate__
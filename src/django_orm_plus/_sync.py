@@ -0,0 +1,169 @@
+import uuid
+from contextlib import contextmanager, suppress
+
+from django.db import DatabaseError, connections, models
+from django.db.models import DO_NOTHING
+from django.db.models.deletion import Collector, get_candidate_relations_to_delete
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
+
+from ._batch_size import _get_max_query_params
+from ._relation_cache import get_relation_cache, invalidate_cached_objects
+
+
+# above this many seen rows, they are written to a temporary table to
+# anti-join against instead of being sent as query parameters
+TEMP_TABLE_THRESHOLD = 10000
+
+
+@contextmanager
+def _seen_pks_table(connection, pk_field, pks):
+    qn = connection.ops.quote_name
+    table = qn(f"django_orm_plus_sync_{uuid.uuid4().hex}")
+    pks = list(pks)
+    batch_size = min(
+        _get_max_query_params(connection),
+        connection.ops.bulk_batch_size([pk_field], pks),
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {table} "
+            f"(pk {pk_field.rel_db_type(connection)} PRIMARY KEY)"
+        )
+        try:
+            for i in range(0, len(pks), batch_size):
+                pks_batch = pks[i : i + batch_size]  # noqa
+                values_sql = connection.ops.bulk_insert_sql(
+                    [pk_field], [["%s"]] * len(pks_batch)
+                )
+                cursor.execute(f"INSERT INTO {table} (pk) {values_sql}", pks_batch)
+            yield table
+        except BaseException:
+            # the DROP fails in a transaction that the error aborted, eg. on
+            # PostgreSQL, whose rollback drops the table anyway
+            with suppress(DatabaseError):
+                cursor.execute(f"DROP TABLE {table}")
+            raise
+        cursor.execute(f"DROP TABLE {table}")
+
+
+def _get_soft_delete(model, field_name):
+    """
+    :return: (filter for rows that aren't deleted, update that deletes them,
+        update that restores them)
+    """
+    field = model._meta.get_field(field_name)
+
+    if isinstance(field, models.BooleanField):
+        return {field.name: False}, {field.name: True}, {field.name: False}
+    if isinstance(field, models.DateTimeField):
+        return (
+            {f"{field.name}__isnull": True},
+            {field.name: timezone.now()},
+            {field.name: None},
+        )
+    if isinstance(field, models.DateField):
+        return (
+            {f"{field.name}__isnull": True},
+            {field.name: timezone.localdate()},
+            {field.name: None},
+        )
+    raise ValueError("soft_delete_field must be a boolean, date or datetime field")
+
+
+def _fast_delete(missing):
+    """
+    Delete the rows, and the rows that cascade from them, with a DELETE per
+    table that selects them with the anti-join, instead of loading them first
+
+    :return: The number of deleted rows, or None if they need to be collected
+        by Django, eg. for signal receivers or on_delete handlers
+    """
+    model = missing.model
+    using = missing.db
+    collector = Collector(using=using)
+    if collector.can_fast_delete(missing):
+        return missing._raw_delete(using)
+    if (
+        model._meta.parents
+        or pre_delete.has_listeners(model)
+        or post_delete.has_listeners(model)
+        # eg. generic relations
+        or any(hasattr(f, "bulk_related_objects") for f in model._meta.private_fields)
+    ):
+        return None
+
+    cascades = []
+    for related in get_candidate_relations_to_delete(model._meta):
+        field = related.field
+        if field.remote_field.on_delete is DO_NOTHING:
+            continue
+        related_qs = related.related_model._base_manager.using(using).filter(
+            **{f"{field.name}__in": missing}
+        )
+        if not collector.can_fast_delete(related_qs, from_field=field):
+            return None
+        cascades.append(related_qs)
+
+    for related_qs in cascades:
+        related_qs._raw_delete(using)
+    return missing._raw_delete(using)
+
+
+def _write(rows, values=None):
+    """
+    Update `rows` with `values`, or delete them
+
+    :return: The number of rows that were written
+    """
+    model = rows.model
+    pks = None
+    if get_relation_cache(model) is not None:
+        pks = list(rows.values_list("pk", flat=True))
+
+    if values is not None:
+        num_rows = rows.update(**values)
+    else:
+        num_rows = _fast_delete(rows)
+        if num_rows is None:
+            _, num_deleted_by_model = rows.delete()
+            num_rows = num_deleted_by_model.get(model._meta.label, 0)
+
+    if pks:
+        invalidate_cached_objects(model, pks, rows.db)
+    return num_rows
+
+
+def delete_missing(qs, seen_pks, sync_scope=None, soft_delete_field=None):
+    """
+    Delete, or soft delete, the rows in scope that weren't seen with a single
+    anti-join
+
+    :param seen_pks: Primary keys of the rows that were updated, created or
+        left unchanged
+    :param sync_scope: Q object limiting the rows that are synced
+    :param soft_delete_field: Boolean field to set, or date field to set to
+        now, instead of deleting. Seen rows that were soft deleted are restored
+    :return: The number of deleted rows
+    """
+    scope = qs.filter(sync_scope) if sync_scope is not None else qs.all()
+    soft_delete = None
+    if soft_delete_field is not None:
+        not_deleted, soft_delete, restore = _get_soft_delete(
+            qs.model, soft_delete_field
+        )
+        scope = scope.filter(**not_deleted)
+
+    def sync(seen):
+        if soft_delete is not None:
+            _write(qs.filter(pk__in=seen).exclude(**not_deleted), restore)
+        return _write(scope.exclude(pk__in=seen), soft_delete)
+
+    if len(seen_pks) <= TEMP_TABLE_THRESHOLD:
+        return sync(seen_pks)
+
+    connection = connections[qs.db]
+    with _seen_pks_table(connection, qs.model._meta.pk, seen_pks) as table:
+        return sync(RawSQL(f"SELECT pk FROM {table}", []))
@@ -0,0 +1,212 @@
+from django.db import NotSupportedError, connections
+
+
+UPDATE_ENGINE_AUTO = "auto"
+UPDATE_ENGINE_VALUES = "values"
+UPDATE_ENGINE_BULK_UPDATE = "bulk_update"
+
+MYSQL_VALUES_TABLE = "django_orm_plus_update_values"
+
+
+def _postgresql_sql(connection, table, pk_column, columns, num_rows):
+    """
+    UPDATE t SET f = v.f FROM (VALUES (%s::type, ...), ...) AS v (pk, f)
+    WHERE t.pk = v.pk
+    """
+    qn = connection.ops.quote_name
+    casts = [f"%s::{field.cast_db_type(connection)}" for field, _ in columns]
+    values = ", ".join(["({})".format(", ".join(casts))] * num_rows)
+    aliases = ", ".join(qn(alias) for _, alias in columns)
+    assignments = ", ".join(
+        f"{qn(field.column)} = v.{qn(alias)}" for field, alias in columns[1:]
+    )
+    return (
+        f"UPDATE {qn(table)} SET {assignments} "
+        f"FROM (VALUES {values}) AS v ({aliases}) "
+        f"WHERE {qn(table)}.{qn(pk_column)} = v.{qn(columns[0][1])}"
+    )
+
+
+def _sqlite_sql(connection, table, pk_column, columns, num_rows):
+    """
+    UPDATE t SET f = v.column2 FROM (VALUES (%s, ...), ...) AS v
+    WHERE t.pk = v.column1
+
+    The statement starts with UPDATE, as the sqlite3 module only reports the
+    rows matched by statements starting with a DML keyword
+    """
+    qn = connection.ops.quote_name
+    values = ", ".join(["({})".format(", ".join(["%s"] * len(columns)))] * num_rows)
+    assignments = ", ".join(
+        f"{qn(field.column)} = v.column{i}"
+        for i, (field, _) in enumerate(columns[1:], start=2)
+    )
+    return (
+        f"UPDATE {qn(table)} SET {assignments} "
+        f"FROM (VALUES {values}) AS v "
+        f"WHERE {qn(table)}.{qn(pk_column)} = v.column1"
+    )
+
+
+def _get_column_type(field, connection):
+    if field.primary_key:
+        # without eg. AUTO_INCREMENT
+        return field.rel_db_type(connection)
+    return field.db_type(connection)
+
+
+def _mysql_update(cursor, connection, table, pk_column, columns, batches):
+    """
+    CREATE TEMPORARY TABLE v (pk type, f type); then per batch
+    INSERT INTO v VALUES (%s, ...), ...; UPDATE t INNER JOIN v ON t.pk = v.pk
+    SET t.f = v.f; DELETE FROM v
+
+    MySQL has no typed VALUES lists, so the values go through a table with the
+    column types of the fields
+
+    :return: The number of rows matched, as Django's MySQL backend sets
+        `CLIENT.FOUND_ROWS`
+    """
+    qn = connection.ops.quote_name
+    values_table = qn(MYSQL_VALUES_TABLE)
+    definitions = ", ".join(
+        f"{qn(alias)} {_get_column_type(field, connection)}" for field, alias in columns
+    )
+    assignments = ", ".join(
+        f"{qn(table)}.{qn(field.column)} = v.{qn(alias)}"
+        for field, alias in columns[1:]
+    )
+    update_sql = (
+        f"UPDATE {qn(table)} INNER JOIN {values_table} AS v "
+        f"ON {qn(table)}.{qn(pk_column)} = v.{qn(columns[0][1])} "
+        f"SET {assignments}"
+    )
+
+    row = "({})".format(", ".join(["%s"] * len(columns)))
+
+    num_matched = 0
+    cursor.execute(f"CREATE TEMPORARY TABLE {values_table} ({definitions})")
+    try:
+        for num_rows, params in batches:
+            values = ", ".join([row] * num_rows)
+            cursor.execute(f"INSERT INTO {values_table} VALUES {values}", params)
+            cursor.execute(update_sql)
+            num_matched += cursor.rowcount
+            cursor.execute(f"DELETE FROM {values_table}")
+    finally:
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {values_table}")
+    return num_matched
+
+
+_SQL_BUILDERS = {
+    "postgresql": _postgresql_sql,
+    "sqlite": _sqlite_sql,
+}
+
+
+def supports_values_update(connection):
+    if connection.vendor == "sqlite":
+        # UPDATE ... FROM was added in SQLite 3.33
+        return connection.Database.sqlite_version_info >= (3, 33)
+    return connection.vendor in _SQL_BUILDERS or connection.vendor == "mysql"
+
+
+def _can_update_with_values(qs, objs, fields):
+    meta = qs.model._meta
+    return all(
+        field.model._meta.concrete_model is meta.concrete_model
+        and not field.primary_key
+        for field in fields
+    ) and not any(
+        hasattr(getattr(obj, field.attname), "resolve_expression")
+        for obj in objs
+        for field in fields
+    )
+
+
+def _iter_batch_params(objs, columns, batch_size, connection):
+    """
+    :return: The number of rows and the values of `columns` of each batch
+    """
+    for i in range(0, len(objs), batch_size):
+        rows = objs[i : i + batch_size]  # noqa
+        yield len(rows), [
+            field.get_db_prep_save(getattr(obj, field.attname), connection)
+            for obj in rows
+            for field, _ in columns
+        ]
+
+
+def update_with_values(qs, objs, fields, batch_size=None):
+    """
+    Update `fields` of `objs` by joining the table against the new values,
+    so that the statement grows with the number of values only
+
+    :return: The number of rows matched
+    """
+    connection = connections[qs.db]
+    meta = qs.model._meta
+    # alias the columns since the pk and other columns may share a name
+    columns = [(meta.pk, "pk")] + [(field, f"v{i}") for i, field in enumerate(fields)]
+    max_batch_size = max(
+        connection.ops.bulk_batch_size([field for field, _ in columns], objs), 1
+    )
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    batches = _iter_batch_params(objs, columns, batch_size, connection)
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            return _mysql_update(
+                cursor, connection, meta.db_table, meta.pk.column, columns, batches
+            )
+
+        build_sql = _SQL_BUILDERS[connection.vendor]
+        num_matched = 0
+        for num_rows, params in batches:
+            cursor.execute(
+                build_sql(connection, meta.db_table, meta.pk.column, columns, num_rows),
+                params,
+            )
+            num_matched += cursor.rowcount
+        return num_matched
+
+
+def update_with_bulk_update(qs, objs, fields, batch_size=None):
+    """
+    :return: The number of rows matched, or None before Django 4.0
+    """
+    return qs.bulk_update(
+        objs, fields=[field.name for field in fields], batch_size=batch_size
+    )
+
+
+def get_update_function(qs, objs, fields, engine, supports_values=None):
+    """
+    :param engine: "values" to join against the new values, "bulk_update" for
+        Django's `bulk_update`, or "auto" to use "values" where it's supported
+    :param supports_values: Whether the database supports "values", if known
+    :return: A function updating `fields` of `objs` that returns the number of
+        rows matched, or None if it isn't known
+    """
+    connection = connections[qs.db]
+    if supports_values is None:
+        supports_values = supports_values_update(connection)
+
+    if engine == UPDATE_ENGINE_BULK_UPDATE:
+        return update_with_bulk_update
+    if engine == UPDATE_ENGINE_VALUES:
+        if not supports_values:
+            raise NotSupportedError(
+                f"The values update engine is not supported on {connection.vendor}"
+            )
+        if not _can_update_with_values(qs, objs, fields):
+            raise ValueError(
+                "The values update engine can't update primary keys, fields of "
+                "parent models or expressions"
+            )
+        return update_with_values
+    if engine == UPDATE_ENGINE_AUTO:
+        if supports_values and _can_update_with_values(qs, objs, fields):
+            return update_with_values
+        return update_with_bulk_update
+    raise ValueError(f"Unknown update engine: {engine}")
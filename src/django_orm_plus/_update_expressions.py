@@ -0,0 +1,41 @@
+from django.db.models import Expression, Value
+
+
+class Incoming(Expression):
+    """
+    The value of a field on the object being upserted, for use in the
+    `update_expressions` of `bulk_update_or_create`, eg.
+    `{"views": F("views") + Incoming("views")}`
+    """
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r})"
+
+    def resolve_expression(self, *args, **kwargs):
+        raise ValueError("Incoming() can only be used in update_expressions")
+
+
+def bind_incoming(expression, obj):
+    """
+    :return: A copy of `expression` with `Incoming` replaced by the values
+        of `obj`
+    """
+    if isinstance(expression, Incoming):
+        field = obj._meta.get_field(expression.name)
+        return Value(getattr(obj, field.attname), output_field=field)
+    if not hasattr(expression, "get_source_expressions"):
+        return expression
+
+    source_expressions = expression.get_source_expressions()
+    if not source_expressions:
+        return expression
+
+    expression = expression.copy()
+    expression.set_source_expressions(
+        [bind_incoming(source, obj) for source in source_expressions]
+    )
+    return expression
@@ -9,3 +9,47 @@ def get_fields_map_for_model(model_meta):
 
 def cmp(x, y):
     return (x > y) - (x < y)
+
+
+def hook_prefetch_queryset(cls, hook):
+    """
+    Wraps the `get_prefetch_queryset` of a related manager class, once when
+    the class is created, with `hook(manager, get_prefetch_queryset, instances,
+    queryset)`. The hook always gets a queryset, and `get_prefetch_queryset`
+    takes (instances, queryset) on every Django version
+
+    Django 5 replaced it with `get_prefetch_querysets`, which takes a list
+    """
+    method = cls.__dict__.get("get_prefetch_querysets")
+    if method is not None:
+
+        def get_prefetch_querysets(self, instances, querysets=None):
+            if querysets and len(querysets) != 1:
+                # let Django raise its error
+                return method(self, instances, querysets)
+
+            queryset = querysets[0] if querysets else super(cls, self).get_queryset()
+            return hook(
+                self,
+                lambda instances, queryset: method(self, instances, [queryset]),
+                instances,
+                queryset,
+            )
+
+        cls.get_prefetch_querysets = get_prefetch_querysets
+        return
+
+    method = cls.__dict__.get("get_prefetch_queryset")
+    if method is not None:
+
+        def get_prefetch_queryset(self, instances, queryset=None):
+            if queryset is None:
+                queryset = super(cls, self).get_queryset()
+            return hook(
+                self,
+                lambda instances, queryset: method(self, instances, queryset),
+                instances,
+                queryset,
+            )
+
+        cls.get_prefetch_queryset = get_prefetch_queryset
@@ -1,50 +1,152 @@
+import logging
+import time
+
 from django.apps import AppConfig
+from django.core.signals import setting_changed
 
 from ._config import config
+from ._key_cache import reset_key_caches
+from ._relation_cache import connect_invalidation_receivers, reset_relation_caches
 
 
-def auto_add_mixin_to_model(model):
-    from .mixins import ORMPlusManager, ORMPlusModelMixin, ORMPlusQuerySet
+logger = logging.getLogger("django_orm_plus")
 
-    if not config.auto_add_model_mixin:
-        return
+# patched manager class for each distinct manager class, so that models
+# sharing a manager class also share the generated classes
+_patched_manager_classes = {}
+
+
+def _get_patched_manager_class(manager_class):
+    from .mixins import ORMPlusManager, ORMPlusQuerySet
 
-    if not issubclass(model, ORMPlusModelMixin):
+    patched_manager_class = _patched_manager_classes.get(manager_class)
+    if patched_manager_class is None:
         queryset_class = type(
             ORMPlusQuerySet.__name__,
-            (ORMPlusQuerySet, model._default_manager._queryset_class)
-            + model._default_manager._queryset_class.__bases__,
+            (ORMPlusQuerySet, manager_class._queryset_class)
+            + manager_class._queryset_class.__bases__,
             {},
         )
-        manager = type(
+        patched_manager_class = _patched_manager_classes[manager_class] = type(
             ORMPlusManager.__name__,
-            (ORMPlusManager, model._default_manager.__class__)
-            + model._default_manager.__class__.__bases__,
+            (ORMPlusManager, manager_class) + manager_class.__bases__,
             {
                 "_queryset_class": queryset_class,
             },
-        )()
+        )
+    return patched_manager_class
+
+
+def _matches_any_label(model, labels):
+    meta = model._meta
+    return any(
+        label in (meta.app_label, meta.label, meta.label_lower) for label in labels
+    )
+
 
-        manager.name = "django_orm_plus_manager"
-        managers_to_name_map = {v: k for k, v in model._meta.managers_map.items()}
-        if not model._meta.default_manager_name:
-            # explicitly set it so we can make sure `default_manager` is
-            # consistent across model states, which is important so no
-            # migrations are created
-            model._meta.default_manager_name = managers_to_name_map[
-                model._meta.default_manager
-            ]
+def should_patch_model(model):
+    include = config.auto_add_model_mixin_include
+    if include is not None and not _matches_any_label(model, include):
+        return False
+    return not _matches_any_label(model, config.auto_add_model_mixin_exclude)
 
-        manager.contribute_to_class(model, manager.name)
-        setattr(model, "objects", getattr(model, manager.name))
-        model.__bases__ = (ORMPlusModelMixin,) + model.__bases__
+
+def _has_mixin(model):
+    from .mixins import ORMPlusModelMixin
+
+    # subclasses of patched models inherit their patched methods
+    return issubclass(model, ORMPlusModelMixin) or getattr(
+        model, "_django_orm_plus_patched", False
+    )
+
+
+def auto_add_mixin_to_model(model):
+    """
+    Give the model the manager and instance behaviour of `ORMPlusModelMixin`
+
+    Its bases are left as is, as assigning `__bases__` makes Python rebuild
+    the method resolution order of the model and all its subclasses, and
+    changes what `isinstance` and migrations see
+
+    :return: True if the model was patched
+    """
+    from ._strict_mode import add_strict_mode_to_model
+
+    if not config.auto_add_model_mixin:
+        return False
+
+    if _has_mixin(model) or not should_patch_model(model):
+        return False
+
+    manager = _get_patched_manager_class(model._default_manager.__class__)()
+
+    manager.name = "django_orm_plus_manager"
+    managers_to_name_map = {v: k for k, v in model._meta.managers_map.items()}
+    if not model._meta.default_manager_name:
+        # explicitly set it so we can make sure `default_manager` is
+        # consistent across model states, which is important so no
+        # migrations are created
+        model._meta.default_manager_name = managers_to_name_map[
+            model._meta.default_manager
+        ]
+
+    manager.contribute_to_class(model, manager.name)
+    setattr(model, "objects", getattr(model, manager.name))
+    add_strict_mode_to_model(model)
+    model._django_orm_plus_patched = True
+    return True
+
+
+class PatchReport:
+    def __init__(self, num_models, num_patched, num_manager_classes, duration):
+        self.num_models = num_models
+        self.num_patched = num_patched
+        self.num_manager_classes = num_manager_classes
+        self.duration = duration
+
+    def __str__(self):
+        return (
+            f"Added ORMPlusModelMixin to {self.num_patched} of {self.num_models} "
+            f"models with {self.num_manager_classes} manager classes "
+            f"in {self.duration * 1000:.1f}ms"
+        )
+
+
+def auto_add_mixin_to_models(models):
+    """
+    :return: A `PatchReport` of what patching the models cost
+    """
+    start = time.perf_counter()
+    num_manager_classes = len(_patched_manager_classes)
+
+    num_patched = 0
+    for model in models:
+        if auto_add_mixin_to_model(model):
+            num_patched += 1
+
+    return PatchReport(
+        len(models),
+        num_patched,
+        len(_patched_manager_classes) - num_manager_classes,
+        time.perf_counter() - start,
+    )
 
 
 class DjangoORMPlusAppConfig(AppConfig):
     name = "django_orm_plus"
+    patch_report = None
 
     def ready(self):
         from django.apps import apps
 
-        for model in apps.get_models():
-            auto_add_mixin_to_model(model)
+        if config.auto_add_model_mixin:
+            self.patch_report = auto_add_mixin_to_models(apps.get_models())
+            logger.info("%s", self.patch_report)
+
+        connect_invalidation_receivers()
+        setting_changed.connect(
+            reset_relation_caches, dispatch_uid="django_orm_plus_setting_changed"
+        )
+        setting_changed.connect(
+            reset_key_caches, dispatch_uid="django_orm_plus_reset_key_caches"
+        )
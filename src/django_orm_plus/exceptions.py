@@ -19,5 +19,11 @@ class QueryModifiedAfterFetch(StrictModeException):
         )
 
 
+class QueryBudgetExceeded(StrictModeException):
+    def __init__(self, message, statements):
+        super().__init__(message)
+        self.statements = statements
+
+
 class InvalidLookupError(ValueError):
     pass
@@ -0,0 +1,28 @@
+import random
+
+from ._config import config
+from ._detection import detection_scope, get_sink
+
+
+class SampledDetectionMiddleware:
+    """
+    Turns on non-raising strict mode for a sample of requests and reports the
+    lazy loads it counted per view to the configured sink
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = config.sampled_detection_rate
+        if not sample_rate or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        with detection_scope() as collector:
+            response = self.get_response(request)
+
+        if collector.counts:
+            resolver_match = getattr(request, "resolver_match", None)
+            view_name = resolver_match.view_name if resolver_match else request.path
+            get_sink()(view_name, collector.counts, sample_rate)
+        return response
@@ -1,31 +1,241 @@
 from django.db import models
 
+from ._bulk import DUPLICATES_LAST_WINS
 from ._bulk import bulk_update_or_create as bulk_update_or_create_
-from ._fetch_related import fetch_related
+from ._bulk_get import bulk_get_or_create as bulk_get_or_create_
+from ._bulk_get import in_bulk_by as in_bulk_by_
+from ._bulk_m2m import bulk_sync_m2m as bulk_sync_m2m_
+from ._bulk_values import bulk_update_or_create_values as bulk_update_or_create_values_
+from ._fetch_plan import build_fetch_plan
+from ._fetch_recorder import fetch_recorder  # noqa: F401
+from ._fetch_related import build_qs, fetch_related
+from ._instrumentation import (
+    instrument_fetch_related,
+    should_instrument_fetch_related,
+)
+from ._identity_map import (
+    evaluation_identity_map,
+    get_active_identity_map,
+    get_prefetch_queryset_skipping_loaded,
+    get_prefetch_to_attrs,
+)
+from ._identity_map import identity_map_scope  # noqa: F401
+from ._key_cache import invalidate_key_cache
+from ._query_budget import query_budget
+from ._relation_cache import prefetch_cached_relations
+from ._update_engines import UPDATE_ENGINE_AUTO
+from ._update_expressions import Incoming  # noqa: F401
+from ._util import hook_prefetch_queryset
 from ._strict_mode import StrictModeManager, StrictModeModelMixin, StrictModeQuerySet
 
 
 class ORMPlusQuerySet(StrictModeQuerySet):
-    def fetch_related(self, *fields):
-        return fetch_related(self, fields)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._identity_map = False
+        self._cached_relations = ()
+        self._query_budget = None
+        self._fetch_related_lookups = ()
+
+    def _clone(self):
+        qs = super()._clone()
+        qs._identity_map = self._identity_map
+        qs._cached_relations = self._cached_relations
+        qs._query_budget = self._query_budget
+        qs._fetch_related_lookups = self._fetch_related_lookups
+        return qs
+
+    def _fetch_all(self):
+        if self._result_cache is None and should_instrument_fetch_related(self):
+            with instrument_fetch_related(self):
+                return self._fetch_all_within_budget()
+        return self._fetch_all_within_budget()
+
+    def _fetch_all_within_budget(self):
+        if self._result_cache is not None or self._query_budget is None:
+            return self._fetch_all_with_relations()
+
+        with query_budget(using=self.db, **self._query_budget):
+            self._fetch_all_with_relations()
+
+    def _fetch_all_with_relations(self):
+        if self._result_cache is not None:
+            return super()._fetch_all()
+
+        if not self._identity_map:
+            super()._fetch_all()
+            self._prefetch_cached_relations()
+            return
+
+        with evaluation_identity_map() as identity_map:
+            super()._fetch_all()
+            self._prefetch_cached_relations()
+        self._result_cache = identity_map.canonicalize(
+            self._result_cache, get_prefetch_to_attrs(self._prefetch_related_lookups)
+        )
+
+    def _prefetch_related_objects(self):
+        # register the rows loaded so far, so that the prefetches can skip them
+        identity_map = get_active_identity_map()
+        if self._identity_map and identity_map is not None:
+            self._result_cache = identity_map.canonicalize(self._result_cache)
+        super()._prefetch_related_objects()
+
+    def update(self, **kwargs):
+        # updates send no signals, so they can't invalidate single keys
+        invalidate_key_cache(self.model, self.db)
+        return super().update(**kwargs)
+
+    def _prefetch_cached_relations(self):
+        if self._cached_relations:
+            prefetch_cached_relations(
+                self._result_cache, self._cached_relations, self.db, self._strict_mode
+            )
+
+    def fetch_from_relation_cache(self, *lookups):
+        qs = self._chain()
+        qs._cached_relations += lookups
+        return qs
+
+    def fetch_related(self, *fields, identity_map=False, to_attr_suffix=None):
+        qs = fetch_related(self, fields, to_attr_suffix)._chain()
+        qs._fetch_related_lookups += fields
+        if identity_map:
+            qs._identity_map = True
+        return qs
+
+    def within_budget(
+        self,
+        max_queries=None,
+        max_rows=None,
+        max_duplicates=None,
+        raise_exception=True,
+    ):
+        """
+        Evaluate the queryset, along with its prefetches, within a query budget,
+        see `query_budget`
+        """
+        qs = self._chain()
+        qs._query_budget = dict(
+            max_queries=max_queries,
+            max_rows=max_rows,
+            max_duplicates=max_duplicates,
+            raise_exception=raise_exception,
+        )
+        return qs
+
+    def fetch_related_for(self, declaration):
+        plan = build_fetch_plan(self.model, declaration)
+        qs = build_qs(self, plan.lookups, plan.only)._chain()
+        qs._fetch_related_lookups += tuple(lookup.lookup for lookup in plan.lookups)
+        return qs
 
     def bulk_update_or_create(
-        self, objs, lookup_fields, update_fields, batch_size=None
+        self,
+        objs,
+        lookup_fields,
+        update_fields,
+        batch_size=None,
+        update_engine=UPDATE_ENGINE_AUTO,
+        delete_missing=False,
+        sync_scope=None,
+        soft_delete_field=None,
+        on_duplicate=DUPLICATES_LAST_WINS,
+        report=False,
+        children=None,
+        update_expressions=None,
+        partition_by=None,
+        max_workers=None,
     ):
         if objs:
             assert self.model == objs[0]._meta.model
 
         return bulk_update_or_create_(
-            self, objs, lookup_fields, update_fields, batch_size
+            self,
+            objs,
+            lookup_fields,
+            update_fields,
+            batch_size,
+            update_engine,
+            delete_missing,
+            sync_scope,
+            soft_delete_field,
+            on_duplicate,
+            report,
+            children,
+            update_expressions,
+            partition_by,
+            max_workers,
         )
 
     bulk_update_or_create.alters_data = True
 
+    def bulk_update_or_create_values(
+        self,
+        rows,
+        fields,
+        lookup_fields,
+        update_fields,
+        batch_size=None,
+        update_engine=UPDATE_ENGINE_AUTO,
+        return_records=False,
+        delete_missing=False,
+        sync_scope=None,
+        soft_delete_field=None,
+        on_duplicate=DUPLICATES_LAST_WINS,
+        report=False,
+    ):
+        return bulk_update_or_create_values_(
+            self,
+            rows,
+            fields,
+            lookup_fields,
+            update_fields,
+            batch_size,
+            update_engine,
+            return_records,
+            delete_missing,
+            sync_scope,
+            soft_delete_field,
+            on_duplicate,
+            report,
+        )
+
+    bulk_update_or_create_values.alters_data = True
+
+    def bulk_sync_m2m(
+        self, field_name, memberships, batch_size=None, through_defaults=None
+    ):
+        return bulk_sync_m2m_(
+            self, field_name, memberships, batch_size, through_defaults
+        )
+
+    bulk_sync_m2m.alters_data = True
+
+    def bulk_get_or_create(self, objs, lookup_fields, batch_size=None):
+        return bulk_get_or_create_(self, objs, lookup_fields, batch_size)
+
+    bulk_get_or_create.alters_data = True
+
+    def in_bulk_by(self, lookup_fields, keys, batch_size=None):
+        return in_bulk_by_(self, lookup_fields, keys, batch_size)
+
 
 class ORMPlusManager(
     models.manager.BaseManager.from_queryset(ORMPlusQuerySet), StrictModeManager
 ):
-    pass
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        hook_prefetch_queryset(cls, _skip_loaded_objects)
+
+
+def _skip_loaded_objects(manager, get_prefetch_queryset, instances, queryset):
+    identity_map = get_active_identity_map()
+    if identity_map is None:
+        return get_prefetch_queryset(instances, queryset)
+    return get_prefetch_queryset_skipping_loaded(
+        manager, get_prefetch_queryset, identity_map, instances, queryset
+    )
 
 
 class ORMPlusModelMixin(StrictModeModelMixin):
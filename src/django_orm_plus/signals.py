@@ -0,0 +1,16 @@
+from django.dispatch import Signal
+
+
+# Sent after each batch of `bulk_update_or_create` with `num_objects`,
+# `num_created`, `num_updated`, and per phase ("lookup", "create", "update",
+# "refetch") `timings` in seconds and `num_queries`
+bulk_update_or_create_batch = Signal()
+
+# Sent after a `fetch_related` queryset is evaluated with its `lookups`,
+# `duration` in seconds, `num_queries`, `num_rows` and `prefetches`, a list of
+# dicts with the `lookup`, `num_queries` and `num_rows` of each prefetch run
+fetch_related_executed = Signal()
+
+# Sent for every strict mode violation with its `kind`, `relation`
+# (eg. "Pizza.toppings") and whether it is `raised` or only recorded
+strict_mode_violation = Signal()
@@ -0,0 +1,19 @@
+# flake8: noqa
+# Generated by Django 3.2.25 on 2026-10-18 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="topping",
+            name="deleted_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
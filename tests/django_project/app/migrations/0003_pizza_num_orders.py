@@ -0,0 +1,19 @@
+# flake8: noqa
+# Generated by Django 3.2.25 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0002_topping_deleted_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pizza",
+            name="num_orders",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# flake8: noqa
+# Generated by Django 3.2.25 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_pizza_num_orders"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="avatar",
+            field=models.FileField(blank=True, upload_to=""),
+        ),
+    ]
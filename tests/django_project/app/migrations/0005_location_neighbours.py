@@ -0,0 +1,21 @@
+# flake8: noqa
+# Generated by Django 3.2.25 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_user_avatar"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="neighbours",
+            field=models.ManyToManyField(
+                blank=True, related_name="_app_location_neighbours_+", to="app.Location"
+            ),
+        ),
+    ]
@@ -18,19 +18,23 @@ class Profile(BaseModel):
 
 class User(BaseModel, ORMPlusModelMixin, AbstractUser):
     profile = models.OneToOneField(Profile, null=True, on_delete=models.PROTECT)
+    avatar = models.FileField(blank=True)
 
 
 class Topping(BaseModel, ORMPlusModelMixin):
     name = models.CharField(max_length=30)
+    deleted_at = models.DateTimeField(null=True)
 
 
 class Pizza(BaseModel, ORMPlusModelMixin):
     name = models.CharField(max_length=50)
+    num_orders = models.IntegerField(default=0)
     toppings = models.ManyToManyField(Topping)
 
 
 class Location(BaseModel, ORMPlusModelMixin):
     city = models.CharField(max_length=128)
+    neighbours = models.ManyToManyField("self", blank=True)
 
 
 class Restaurant(BaseModel, ORMPlusModelMixin):
@@ -2,10 +2,11 @@ from contextlib import contextmanager
 
 import pytest
 from django.db.migrations.state import ModelState
-from django.db.models import Model, QuerySet
+from django.db.models import CASCADE, ForeignKey, Model, QuerySet
 from django.db.models.manager import BaseManager, Manager
 from django.test import override_settings
-from django_orm_plus.apps import auto_add_mixin_to_model
+from django_orm_plus.apps import auto_add_mixin_to_model, auto_add_mixin_to_models
+from django_orm_plus.exceptions import RelatedObjectNeedsExplicitFetch
 from django_orm_plus.mixins import ORMPlusModelMixin, ORMPlusQuerySet
 
 
@@ -13,8 +14,8 @@ pytestmark = pytest.mark.django_db
 
 
 @contextmanager
-def auto_patch(val):
-    with override_settings(DJANGO_ORM_PLUS={"AUTO_ADD_MODEL_MIXIN": val}):
+def auto_patch(val, **kwargs):
+    with override_settings(DJANGO_ORM_PLUS={"AUTO_ADD_MODEL_MIXIN": val, **kwargs}):
         yield
 
 
@@ -67,7 +68,6 @@ class TestAutoPatch:
         assert hasattr(model.objects, "_strict_mode")
         assert isinstance(model.objects.all(), ORMPlusQuerySet)
         assert hasattr(model(), "_strict_mode")
-        assert model.__bases__[0] is ORMPlusModelMixin
 
     def test_does_not_patch_by_default(self, DummyModel):
         auto_add_mixin_to_model(DummyModel)
@@ -127,7 +127,88 @@ class TestAutoPatch:
         self._assert_model_is_patched(MyModel)
 
         patch_state = ModelState.from_model(MyModel)
-        # We modify __bases__ with the mixin
-        # but we don't really care since it doesn't cause a migration
-        patch_state.bases = patch_state.bases[:-1]
         assert patch_state == no_patch_state
+
+    def test_bases_are_unchanged(self, DummyModel):
+        bases = DummyModel.__bases__
+
+        with auto_patch(True):
+            auto_add_mixin_to_model(DummyModel)
+
+        assert DummyModel.__bases__ == bases
+        assert ORMPlusModelMixin not in DummyModel.__mro__
+
+    def test_patched_models_are_strict(self):
+        class Owner(Model):
+            class Meta:
+                app_label = "test"
+
+        class Pet(Model):
+            owner = ForeignKey(Owner, on_delete=CASCADE)
+
+            class Meta:
+                app_label = "test"
+
+        with auto_patch(True):
+            auto_add_mixin_to_model(Pet)
+
+        pet = Pet(owner_id=1)
+        pet._strict_mode.enable_strict_mode()
+        with pytest.raises(RelatedObjectNeedsExplicitFetch, match="Pet.owner"):
+            pet.owner
+        assert "_related_managers" not in pet.__getstate__()
+
+    def test_subclasses_of_patched_models_are_not_patched_again(self, DummyModel):
+        class MyModel(DummyModel):
+            class Meta:
+                app_label = "test"
+
+        with auto_patch(True):
+            auto_add_mixin_to_model(DummyModel)
+            assert not auto_add_mixin_to_model(MyModel)
+
+        assert hasattr(MyModel(), "_strict_mode")
+
+    def test_reuses_classes_for_the_same_manager_class(
+        self, DummyModelWithCustomManager, CustomManager
+    ):
+        class OtherModel(Model):
+            objects = CustomManager()
+
+            class Meta:
+                app_label = "other"
+
+        with auto_patch(True):
+            auto_add_mixin_to_model(DummyModelWithCustomManager)
+            auto_add_mixin_to_model(OtherModel)
+
+        self._assert_model_is_patched(OtherModel)
+        assert OtherModel.objects is not DummyModelWithCustomManager.objects
+        assert type(OtherModel.objects) is type(DummyModelWithCustomManager.objects)
+
+    @pytest.mark.parametrize("exclude", ["test", "test.DummyModel", "test.dummymodel"])
+    def test_excluded_models_are_not_patched(self, DummyModel, exclude):
+        with auto_patch(True, AUTO_ADD_MODEL_MIXIN_EXCLUDE=[exclude]):
+            assert not auto_add_mixin_to_model(DummyModel)
+
+        self._assert_model_not_patched(DummyModel)
+
+    def test_only_included_models_are_patched(
+        self, DummyModel, DummyModelWithCustomManager
+    ):
+        with auto_patch(True, AUTO_ADD_MODEL_MIXIN_INCLUDE=["test.DummyModel"]):
+            auto_add_mixin_to_model(DummyModel)
+            auto_add_mixin_to_model(DummyModelWithCustomManager)
+
+        self._assert_model_is_patched(DummyModel)
+        self._assert_model_not_patched(DummyModelWithCustomManager)
+
+    def test_patch_report(self, DummyModel, DummyModelWithCustomManager):
+        with auto_patch(True, AUTO_ADD_MODEL_MIXIN_EXCLUDE=["test.DummyModel"]):
+            report = auto_add_mixin_to_models([DummyModel, DummyModelWithCustomManager])
+
+        assert report.num_models == 2
+        assert report.num_patched == 1
+        assert report.num_manager_classes == 1
+        assert report.duration > 0
+        assert str(report).startswith("Added ORMPlusModelMixin to 1 of 2 models")
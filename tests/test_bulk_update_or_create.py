@@ -1,9 +1,35 @@
+from datetime import datetime, timezone
+
 import pytest
 from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_init
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django_orm_plus import (
+    _batch_size,
+    _bulk,
+    _bulk_m2m,
+    _bulk_plan,
+    _key_cache,
+    _sync,
+    _update_engines,
+)
+from django_orm_plus.mixins import Incoming
 
-from app.models import Location, Pizza, Restaurant
+from app.models import (
+    Location,
+    Pizza,
+    Profile,
+    Restaurant,
+    Topping,
+    User,
+    UserFavorite,
+)
 
-from .factories import UserFavoriteFactory
+from .factories import RestaurantFactory, UserFactory, UserFavoriteFactory
 
 
 pytestmark = pytest.mark.django_db
@@ -148,3 +174,1297 @@ class TestBulkUpdateOrCreate:
                 lookup_fields=lookup_fields,
                 update_fields=update_fields,
             )
+
+
+class TestUpdateEngines:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        for i in range(0, 3):
+            UserFavoriteFactory()
+
+    def _update_locations(self, update_engine):
+        restaurants = list(Restaurant.objects.order_by("pk"))
+        locations = [Location.objects.create(city=f"city-{i}") for i in range(3)]
+
+        with CaptureQueriesContext(connection) as context:
+            updated, created = Restaurant.objects.bulk_update_or_create(
+                [
+                    Restaurant(id=restaurant.id, location_id=location.id)
+                    for restaurant, location in zip(restaurants, locations)
+                ],
+                lookup_fields=["id"],
+                update_fields=["location_id"],
+                update_engine=update_engine,
+            )
+
+        assert len(updated) == 3
+        assert [
+            restaurant.location_id for restaurant in Restaurant.objects.order_by("pk")
+        ] == [location.id for location in locations]
+        for restaurant, updated_restaurant in zip(restaurants, updated):
+            updated_restaurant.refresh_from_db()
+            assert updated_restaurant.updated_at > restaurant.updated_at
+        return [query["sql"] for query in context.captured_queries]
+
+    @pytest.mark.parametrize("update_engine", ["auto", "values"])
+    def test_values_update(self, update_engine):
+        _, update_sql = self._update_locations(update_engine)
+
+        assert update_sql.startswith('UPDATE "app_restaurant"')
+        assert "FROM (VALUES" in update_sql
+        assert "CASE" not in update_sql
+
+    def test_bulk_update(self):
+        _, update_sql = self._update_locations("bulk_update")
+
+        assert "CASE" in update_sql
+
+    def test_values_update_sets_null(self):
+        users = [
+            User.objects.create(username=f"user-{i}", profile=Profile.objects.create())
+            for i in range(2)
+        ]
+
+        User.objects.bulk_update_or_create(
+            [User(username=user.username, profile=None) for user in users],
+            lookup_fields=["username"],
+            update_fields=["profile"],
+            update_engine="values",
+        )
+
+        assert not User.objects.filter(profile__isnull=False).exists()
+
+    def test_mysql_values_table(self):
+        class RecordingCursor:
+            rowcount = 1
+
+            def __init__(self):
+                self.statements = []
+
+            def execute(self, sql, params=None):
+                self.statements.append((sql, params))
+
+        cursor = RecordingCursor()
+        columns = [
+            (Pizza._meta.pk, "pk"),
+            (Pizza._meta.get_field("num_orders"), "v0"),
+        ]
+        num_matched = _update_engines._mysql_update(
+            cursor,
+            connection,
+            "app_pizza",
+            "id",
+            columns,
+            [(2, [1, 10, 2, 20]), (1, [3, 30])],
+        )
+
+        sqls = [sql for sql, _ in cursor.statements]
+        assert sqls[0] == (
+            'CREATE TEMPORARY TABLE "django_orm_plus_update_values" '
+            '("pk" bigint, "v0" integer)'
+        )
+        assert sqls[1] == (
+            'INSERT INTO "django_orm_plus_update_values" VALUES (%s, %s), (%s, %s)'
+        )
+        assert cursor.statements[1][1] == [1, 10, 2, 20]
+        assert sqls[2].startswith('UPDATE "app_pizza" INNER JOIN')
+        assert sqls[3] == 'DELETE FROM "django_orm_plus_update_values"'
+        assert sqls[4].endswith("VALUES (%s, %s)")
+        assert sqls[-1] == (
+            'DROP TEMPORARY TABLE IF EXISTS "django_orm_plus_update_values"'
+        )
+        # the rows matched by each UPDATE
+        assert num_matched == 2
+
+    def test_unknown_update_engine(self):
+        restaurant = Restaurant.objects.first()
+        location = Location.objects.create(city="Toronto")
+
+        with pytest.raises(ValueError, match="Unknown update engine"):
+            Restaurant.objects.bulk_update_or_create(
+                [Restaurant(id=restaurant.id, location_id=location.id)],
+                lookup_fields=["id"],
+                update_fields=["location_id"],
+                update_engine="unknown",
+            )
+
+
+class TestDeleteMissing:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        for name in ["cheese", "basil", "olives", "ham"]:
+            Topping.objects.create(name=name)
+
+    def _sync(self, names, **kwargs):
+        return Topping.objects.bulk_update_or_create(
+            [Topping(name=name) for name in names],
+            lookup_fields=["name"],
+            update_fields=["name"],
+            delete_missing=True,
+            **kwargs,
+        )
+
+    def _names(self, **filters):
+        return set(Topping.objects.filter(**filters).values_list("name", flat=True))
+
+    def test_deletes_missing_rows(self):
+        updated, created, num_deleted = self._sync(["cheese", "basil", "mushroom"])
+
+        assert not updated
+        assert [topping.name for topping in created] == ["mushroom"]
+        assert num_deleted == 2
+        assert self._names() == {"cheese", "basil", "mushroom"}
+
+    def test_empty_input_deletes_every_row_in_scope(self):
+        assert self._sync([], sync_scope=Q(name__startswith="o")) == ([], [], 1)
+        assert self._names() == {"cheese", "basil", "ham"}
+
+    def test_sync_scope(self):
+        *_, num_deleted = self._sync(
+            ["cheese"], sync_scope=Q(name__in=["basil", "ham"])
+        )
+
+        assert num_deleted == 2
+        assert self._names() == {"cheese", "olives"}
+
+    def test_soft_delete(self):
+        *_, num_deleted = self._sync(["cheese"], soft_delete_field="deleted_at")
+        *_, num_deleted_again = self._sync(["cheese"], soft_delete_field="deleted_at")
+
+        assert num_deleted == 3
+        assert num_deleted_again == 0
+        assert self._names() == {"cheese", "basil", "olives", "ham"}
+        assert self._names(deleted_at__isnull=True) == {"cheese"}
+
+    def test_soft_deleted_rows_are_restored(self):
+        self._sync(["cheese"], soft_delete_field="deleted_at")
+        *_, num_deleted = self._sync(
+            ["cheese", "basil"], soft_delete_field="deleted_at"
+        )
+
+        assert num_deleted == 0
+        assert self._names(deleted_at__isnull=True) == {"cheese", "basil"}
+
+    def test_deletes_cascades_without_loading_rows(self):
+        pizza = Pizza.objects.create(name="Margherita")
+        pizza.toppings.set(Topping.objects.filter(name__in=["cheese", "ham"]))
+
+        with CaptureQueriesContext(connection) as context:
+            *_, num_deleted = self._sync(["cheese"])
+
+        delete_sqls = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("DELETE")
+        ]
+        assert num_deleted == 3
+        assert len(delete_sqls) == 2
+        assert all("NOT" in sql for sql in delete_sqls)
+        assert [topping.name for topping in pizza.toppings.all()] == ["cheese"]
+
+    def test_soft_delete_field_must_be_a_flag_or_date(self):
+        with pytest.raises(ValueError, match="soft_delete_field"):
+            self._sync(["cheese"], soft_delete_field="name")
+
+    def test_large_inputs_anti_join_a_temporary_table(self, monkeypatch):
+        monkeypatch.setattr(_sync, "TEMP_TABLE_THRESHOLD", 1)
+
+        with CaptureQueriesContext(connection) as context:
+            *_, num_deleted = self._sync(["cheese", "basil"])
+
+        sqls = [query["sql"] for query in context.captured_queries]
+        assert num_deleted == 2
+        assert self._names() == {"cheese", "basil"}
+        assert any(sql.startswith("CREATE TEMPORARY TABLE") for sql in sqls)
+        # the seen rows are inserted with a single statement
+        assert (
+            len([sql for sql in sqls if sql.startswith('INSERT INTO "django_orm_plus')])
+            == 1
+        )
+        assert any(sql.startswith("DROP TABLE") for sql in sqls)
+
+    def test_temporary_table_drop_does_not_hide_errors(self):
+        with pytest.raises(ValueError, match="the original error"):
+            with _sync._seen_pks_table(connection, Topping._meta.pk, [1, 2]) as table:
+                # as the DROP fails in transactions aborted by the error
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE {table}")
+                raise ValueError("the original error")
+
+
+class TestDuplicates:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        User.objects.create(username="ann", first_name="Ann")
+
+    def _upsert(self, users, **kwargs):
+        return User.objects.bulk_update_or_create(
+            [User(username=username, first_name=name) for username, name in users],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            **kwargs,
+        )
+
+    def _names(self):
+        return dict(User.objects.values_list("username", "first_name"))
+
+    def test_last_wins_by_default(self, django_assert_num_queries):
+        with django_assert_num_queries(4):
+            updated, created = self._upsert(
+                [("ann", "A"), ("bob", "B"), ("ann", "C"), ("bob", "D")]
+            )
+
+        assert len(updated) == 1
+        assert len(created) == 1
+        assert self._names() == {"ann": "C", "bob": "D"}
+
+    def test_first_wins(self):
+        self._upsert(
+            [("ann", "A"), ("bob", "B"), ("ann", "C"), ("bob", "D")],
+            on_duplicate="first_wins",
+        )
+
+        assert self._names() == {"ann": "A", "bob": "B"}
+
+    def test_duplicates_in_different_batches(self):
+        self._upsert([("bob", "A"), ("bob", "B")], batch_size=1)
+
+        assert self._names() == {"ann": "Ann", "bob": "B"}
+
+    def test_merge_function(self):
+        def merge(kept, duplicate):
+            kept.first_name += duplicate.first_name
+            return kept
+
+        self._upsert([("ann", "A"), ("ann", "B"), ("ann", "C")], on_duplicate=merge)
+
+        assert self._names() == {"ann": "ABC"}
+
+    def test_raise(self):
+        with pytest.raises(ValueError, match=r"lookup key \('ann',\)"):
+            self._upsert([("ann", "A"), ("ann", "B")], on_duplicate="raise")
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError, match="Unknown duplicate policy"):
+            self._upsert([("ann", "A")], on_duplicate="unknown")
+
+
+class TestBulkUpdateOrCreateValues:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        User.objects.create(username="ann", first_name="Ann")
+
+    @pytest.fixture
+    def num_instances(self):
+        instances = []
+
+        def receiver(sender, instance, **kwargs):
+            instances.append(instance)
+
+        post_init.connect(receiver, sender=User)
+        yield lambda: len(instances)
+        post_init.disconnect(receiver, sender=User)
+
+    def _names(self):
+        return dict(User.objects.values_list("username", "first_name"))
+
+    def test_dicts(self, django_assert_num_queries, num_instances):
+        ann = User.objects.get(username="ann")
+        num_instances_before = num_instances()
+
+        with django_assert_num_queries(4):
+            updated, created = User.objects.bulk_update_or_create_values(
+                [
+                    {"username": "ann", "first_name": "Anne"},
+                    {"username": "bob", "first_name": "Bob"},
+                ],
+                fields=["username", "first_name"],
+                lookup_fields=["username"],
+                update_fields=["first_name"],
+            )
+
+        assert num_instances() == num_instances_before
+        bob = User.objects.get(username="bob")
+        assert updated == [ann.pk]
+        assert created == [bob.pk]
+        assert self._names() == {"ann": "Anne", "bob": "Bob"}
+        assert bob.is_active
+        assert bob.date_joined is not None
+        assert User.objects.get(pk=ann.pk).updated_at > ann.updated_at
+
+    def test_tuples(self):
+        User.objects.bulk_update_or_create_values(
+            [("ann", "Anne"), ("bob", "Bob"), ("bob", "Rob")],
+            fields=["username", "first_name"],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+        )
+
+        assert self._names() == {"ann": "Anne", "bob": "Rob"}
+
+    def test_converts_values(self):
+        restaurant = RestaurantFactory()
+        location = Location.objects.create(city="Toronto")
+
+        updated, _ = Restaurant.objects.bulk_update_or_create_values(
+            [(str(restaurant.pk), str(location.pk))],
+            fields=["id", "location"],
+            lookup_fields=["id"],
+            update_fields=["location"],
+        )
+
+        assert updated == [restaurant.pk]
+        assert Restaurant.objects.get(pk=restaurant.pk).location == location
+
+    def test_unchanged_rows_are_not_updated(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert User.objects.bulk_update_or_create_values(
+                [("ann", "Ann")],
+                fields=["username", "first_name"],
+                lookup_fields=["username"],
+                update_fields=["first_name"],
+            ) == ([], [])
+
+    def test_naive_datetimes_are_compared_as_saved(self, django_assert_num_queries):
+        Topping.objects.create(
+            name="cheese", deleted_at=datetime(2020, 1, 1, tzinfo=timezone.utc)
+        )
+
+        with django_assert_num_queries(1), pytest.warns(RuntimeWarning):
+            assert Topping.objects.bulk_update_or_create_values(
+                [("cheese", "2020-01-01 00:00:00")],
+                fields=["name", "deleted_at"],
+                lookup_fields=["name"],
+                update_fields=["deleted_at"],
+            ) == ([], [])
+
+    def test_file_fields_are_rejected(self):
+        with pytest.raises(ValueError, match="use bulk_update_or_create for avatar"):
+            User.objects.bulk_update_or_create_values(
+                [("ann", "avatar.png")],
+                fields=["username", "avatar"],
+                lookup_fields=["username"],
+                update_fields=["avatar"],
+            )
+
+    @pytest.mark.parametrize("update_engine", ["auto", "bulk_update"])
+    def test_return_records(self, update_engine):
+        updated, created = User.objects.bulk_update_or_create_values(
+            [("ann", "Anne"), ("bob", "Bob")],
+            fields=["username", "first_name"],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            update_engine=update_engine,
+            return_records=True,
+        )
+
+        assert [(user.username, user.first_name) for user in updated] == [
+            ("ann", "Anne")
+        ]
+        assert [(user.username, user.first_name) for user in created] == [
+            ("bob", "Bob")
+        ]
+
+    def test_delete_missing(self):
+        User.objects.create(username="carl")
+
+        *_, num_deleted = User.objects.bulk_update_or_create_values(
+            [("bob", "Bob")],
+            fields=["username", "first_name"],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            delete_missing=True,
+            sync_scope=Q(username__startswith="c"),
+        )
+
+        assert num_deleted == 1
+        assert self._names() == {"ann": "Ann", "bob": "Bob"}
+
+    def test_fields_must_include_lookup_and_update_fields(self):
+        with pytest.raises(ValueError, match="fields must include"):
+            User.objects.bulk_update_or_create_values(
+                [("ann",)],
+                fields=["username"],
+                lookup_fields=["username"],
+                update_fields=["first_name"],
+            )
+
+    def test_rows_must_have_a_value_per_field(self):
+        with pytest.raises(ValueError, match="Expected 2 values per row, got 1"):
+            User.objects.bulk_update_or_create_values(
+                [("ann",)],
+                fields=["username", "first_name"],
+                lookup_fields=["username"],
+                update_fields=["first_name"],
+            )
+
+
+class TestAutoBatchSize:
+    def test_sizes_from_backend_limits(self):
+        batch_size = _batch_size.get_auto_batch_size(
+            User.objects.all(), ["username"], ["first_name"], []
+        )
+
+        # SQLite allows 999 parameters, and 500 ORs in the lookup
+        assert batch_size.size == 999
+        assert batch_size.lookup_size == 500
+        assert batch_size.insert_size == 999 // len(User._meta.local_concrete_fields)
+        # first_name and updated_at
+        assert batch_size.update_size == 999 // 5
+
+    def test_only_lookups_are_capped_on_postgresql(self, monkeypatch):
+        monkeypatch.setattr(connection.features, "max_query_params", None)
+        monkeypatch.setattr(connection, "vendor", "postgresql")
+        monkeypatch.setattr(
+            connection.ops, "bulk_batch_size", lambda fields, objs: len(objs)
+        )
+
+        batch_size = _batch_size.get_auto_batch_size(
+            User.objects.all(), ["username", "email"], ["first_name"], []
+        )
+
+        assert batch_size.size == 65535 // 2
+        assert batch_size.lookup_size == _batch_size.MAX_LOOKUP_SIZE
+        assert batch_size.insert_size == 65535 // len(User._meta.local_concrete_fields)
+        assert batch_size.update_size == 65535 // 5
+
+    def test_lookups_are_split_within_batches(self, monkeypatch):
+        monkeypatch.setattr(_batch_size, "MAX_LOOKUP_SIZE", 2)
+        User.objects.create(username="user0")
+
+        report = User.objects.bulk_update_or_create(
+            [User(username=f"user{i}", first_name="Name") for i in range(5)],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            batch_size="auto",
+            report=True,
+        )
+
+        assert report.batch_sizes == [5]
+        # lookups of 2, 2 and 1 keys, and refetches of the 4 created records
+        assert report.num_queries["lookup"] == 3
+        assert report.num_queries["refetch"] == 2
+        assert report.num_created == 4
+        assert report.num_updated == 1
+
+    def test_target_statement_size(self):
+        with override_settings(DJANGO_ORM_PLUS={"BULK_AUTO_BATCH_TARGET_BYTES": 100}):
+            batch_size = _batch_size.get_auto_batch_size(
+                User.objects.all(),
+                ["username"],
+                ["first_name"],
+                [("user1", "Name"), ("user2", "Name")],
+            )
+
+        assert batch_size.size == 100 // 9
+
+    def test_adapts_to_latency(self, monkeypatch):
+        # the batches take 2s, 2s, then 0.1s each
+        times = iter([0, 2, 0, 2, 0, 0.1, 0, 0.1, 0, 0.1])
+        monkeypatch.setattr(_batch_size.time, "perf_counter", lambda: next(times))
+        batch_size = _batch_size.AutoBatchSize(8, 8, 8, target_seconds=1)
+
+        batches = list(_batch_size.iter_batches(list(range(20)), batch_size))
+
+        assert [len(batch) for batch in batches] == [8, 4, 2, 4, 2]
+        assert batch_size.size == 8
+
+    def test_auto(self):
+        User.objects.create(username="user0")
+
+        with CaptureQueriesContext(connection) as context:
+            updated, created = User.objects.bulk_update_or_create(
+                [User(username=f"user{i}", first_name="Name") for i in range(600)],
+                lookup_fields=["username"],
+                update_fields=["first_name"],
+                batch_size="auto",
+            )
+
+        # a lookup and refetch for each of the 2 halves of the batch, as SQLite
+        # allows 500 ORs
+        assert (
+            sum(query["sql"].startswith("SELECT") for query in context.captured_queries)
+            == 4
+        )
+        assert len(updated) == 1
+        assert len(created) == 599
+        assert User.objects.filter(first_name="Name").count() == 600
+
+    def test_auto_values(self):
+        updated, created = User.objects.bulk_update_or_create_values(
+            [(f"user{i}", "Name") for i in range(600)],
+            fields=["username", "first_name"],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            batch_size="auto",
+        )
+
+        assert len(created) == 600
+
+
+class TestReport:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        User.objects.create(username="ann", first_name="Ann")
+        User.objects.create(username="bob", first_name="Bob")
+        User.objects.create(username="carl", first_name="Carl")
+
+    def test_report(self):
+        report = User.objects.bulk_update_or_create(
+            [
+                User(username="ann", first_name="Anne"),
+                User(username="bob", first_name="Bob"),
+                User(username="dan", first_name="Dan"),
+            ],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            batch_size=2,
+            delete_missing=True,
+            report=True,
+        )
+
+        assert [user.username for user in report.updated] == ["ann"]
+        assert [user.username for user in report.created] == ["dan"]
+        assert report.num_updated == 1
+        assert report.num_created == 1
+        assert report.num_unchanged == 1
+        assert report.num_deleted == 1
+        assert report.batch_sizes == [2, 1]
+        # the batch without creates has nothing to refetch
+        assert report.num_queries == {
+            "lookup": 2,
+            "create": 1,
+            "update": 1,
+            "refetch": 1,
+            "delete": report.num_queries["delete"],
+        }
+        assert report.num_queries["delete"] > 0
+        assert set(report.timings) == set(report.num_queries)
+        assert report.duration >= sum(report.timings.values())
+        assert str(report).startswith(
+            "Updated 1, created 1, deleted 1 and left 1 unchanged records in 2 batches"
+        )
+
+    def test_empty_report(self):
+        report = User.objects.bulk_update_or_create(
+            [], lookup_fields=["username"], update_fields=["first_name"], report=True
+        )
+
+        assert report.num_updated == report.num_created == report.num_unchanged == 0
+        assert report.num_deleted is None
+        assert report.batch_sizes == []
+
+    def test_values_report(self):
+        ann = User.objects.get(username="ann")
+
+        report = User.objects.bulk_update_or_create_values(
+            [("ann", "Anne"), ("carl", "Carl")],
+            fields=["username", "first_name"],
+            lookup_fields=["username"],
+            update_fields=["first_name"],
+            report=True,
+        )
+
+        assert report.updated == [ann.pk]
+        assert report.created == []
+        assert report.num_unchanged == 1
+        assert report.num_queries == {"lookup": 1, "update": 1, "refetch": 0}
+
+
+class TestChildren:
+    @pytest.fixture
+    def pizzas(self):
+        return [Pizza.objects.create(name=name) for name in ["Margherita", "Hawaiian"]]
+
+    def test_upserts_children_of_new_and_existing_parents(
+        self, pizzas, django_assert_num_queries
+    ):
+        Location.objects.create(city="Toronto")
+        toronto = Location(city="Toronto")
+        paris = Location(city="Paris")
+        users = [UserFactory(), UserFactory()]
+        restaurants = [
+            Restaurant(location=toronto, best_pizza=pizzas[0]),
+            Restaurant(location=paris, best_pizza=pizzas[1]),
+        ]
+        favorites = [
+            UserFavorite(user=users[0], restaurant=restaurants[0]),
+            UserFavorite(user=users[1], restaurant=restaurants[1]),
+        ]
+
+        # a lookup, create and refetch per level
+        with django_assert_num_queries(9):
+            updated, created = Location.objects.bulk_update_or_create(
+                [toronto, paris],
+                lookup_fields=["city"],
+                update_fields=["city"],
+                children={
+                    "restaurants": {
+                        "objects": restaurants,
+                        "lookup_fields": ["location"],
+                        "update_fields": ["best_pizza"],
+                        "children": {
+                            "userfavorite_set": {
+                                "objects": favorites,
+                                "lookup_fields": ["user"],
+                                "update_fields": ["restaurant"],
+                            },
+                        },
+                    },
+                },
+            )
+
+        assert [location.city for location in created] == ["Paris"]
+        assert {
+            (favorite.user_id, favorite.restaurant.location.city)
+            for favorite in UserFavorite.objects.select_related("restaurant__location")
+        } == {(users[0].pk, "Toronto"), (users[1].pk, "Paris")}
+
+    def test_uses_returned_primary_keys(
+        self, pizzas, monkeypatch, django_assert_num_queries
+    ):
+        # SQLite returns the primary key of single row inserts
+        monkeypatch.setattr(
+            connection.features, "can_return_rows_from_bulk_insert", True
+        )
+        # the plans read the feature once
+        monkeypatch.setattr(_bulk_plan, "_bulk_model_plans", {})
+        paris = Location(city="Paris")
+        restaurant = Restaurant(location=paris, best_pizza=pizzas[0])
+        favorite = UserFavorite(user=UserFactory(), restaurant=restaurant)
+
+        # a lookup and create per level
+        with django_assert_num_queries(6):
+            _, created = Location.objects.bulk_update_or_create(
+                [paris],
+                lookup_fields=["city"],
+                update_fields=["city"],
+                children={
+                    "restaurants": {
+                        "objects": [restaurant],
+                        "lookup_fields": ["location"],
+                        "update_fields": ["best_pizza"],
+                        "children": {
+                            "userfavorite_set": {
+                                "objects": [favorite],
+                                "lookup_fields": ["user"],
+                                "update_fields": ["restaurant"],
+                            },
+                        },
+                    },
+                },
+            )
+
+        assert created == [paris]
+        assert UserFavorite.objects.get(pk=favorite.pk).restaurant.location == paris
+
+    def test_report(self, pizzas):
+        location = Location.objects.create(city="Toronto")
+        Restaurant.objects.create(location=location, best_pizza=pizzas[0])
+
+        report = Location.objects.bulk_update_or_create(
+            [Location(city="Toronto")],
+            lookup_fields=["city"],
+            update_fields=["city"],
+            report=True,
+            children={
+                "restaurants": {
+                    "objects": [
+                        Restaurant(location=Location(city="Toronto"), best_pizza=pizza)
+                        for pizza in pizzas
+                    ],
+                    "lookup_fields": ["location"],
+                    "update_fields": ["best_pizza"],
+                },
+            },
+        )
+
+        assert report.num_unchanged == 1
+        restaurants_report = report.children["restaurants"]
+        assert [r.best_pizza_id for r in restaurants_report.updated] == [pizzas[1].pk]
+        assert Restaurant.objects.get().best_pizza == pizzas[1]
+
+    def test_errors_if_parent_is_not_upserted(self, pizzas):
+        with pytest.raises(ValueError, match="neither saved nor upserted"):
+            Location.objects.bulk_update_or_create(
+                [Location(city="Toronto")],
+                lookup_fields=["city"],
+                update_fields=["city"],
+                children={
+                    "restaurants": {
+                        "objects": [
+                            Restaurant(
+                                location=Location(city="Paris"), best_pizza=pizzas[0]
+                            )
+                        ],
+                        "lookup_fields": ["location"],
+                        "update_fields": ["best_pizza"],
+                    },
+                },
+            )
+
+    @pytest.mark.parametrize(
+        "children, message",
+        [
+            ({"city": {}}, "city is not a reverse foreign key of Location"),
+            (
+                {"restaurants": {"objects": [], "delete_missing": True}},
+                r"Unknown keys for restaurants: \['delete_missing'\]",
+            ),
+        ],
+    )
+    def test_invalid_children(self, children, message):
+        with pytest.raises(ValueError, match=message):
+            Location.objects.bulk_update_or_create(
+                [Location(city="Toronto")],
+                lookup_fields=["city"],
+                update_fields=["city"],
+                children=children,
+            )
+
+
+class TestBulkSyncM2M:
+    @pytest.fixture
+    def toppings(self):
+        return [Topping.objects.create(name=name) for name in ["a", "b", "c"]]
+
+    @pytest.fixture
+    def pizzas(self, toppings):
+        pizzas = [Pizza.objects.create(name=name) for name in ["x", "y", "z"]]
+        pizzas[0].toppings.set(toppings[:2])
+        pizzas[1].toppings.set(toppings[:1])
+        pizzas[2].toppings.set(toppings)
+        return pizzas
+
+    def _memberships(self, pizzas):
+        return {
+            pizza.pk: {topping.name for topping in pizza.toppings.all()}
+            for pizza in pizzas
+        }
+
+    def test_sync(self, pizzas, toppings, django_assert_num_queries):
+        with django_assert_num_queries(3):
+            num_added, num_removed = Pizza.objects.bulk_sync_m2m(
+                "toppings",
+                {
+                    pizzas[0].pk: [toppings[1].pk, toppings[2].pk],
+                    pizzas[1].pk: [toppings[0]],
+                    # not pizzas[2]
+                },
+            )
+
+        assert num_added == 1
+        assert num_removed == 1
+        assert self._memberships(pizzas) == {
+            pizzas[0].pk: {"b", "c"},
+            pizzas[1].pk: {"a"},
+            pizzas[2].pk: {"a", "b", "c"},
+        }
+
+    def test_batches(self, pizzas, toppings, django_assert_num_queries):
+        # a lookup, delete and insert, then a lookup and delete
+        with django_assert_num_queries(5):
+            Pizza.objects.bulk_sync_m2m(
+                "toppings",
+                {
+                    pizzas[0].pk: [toppings[2].pk],
+                    pizzas[1].pk: [],
+                    pizzas[2].pk: [toppings[0].pk],
+                },
+                batch_size=2,
+            )
+
+        assert self._memberships(pizzas) == {
+            pizzas[0].pk: {"c"},
+            pizzas[1].pk: set(),
+            pizzas[2].pk: {"a"},
+        }
+
+    def test_removals_are_split_by_the_parameter_limit(
+        self, pizzas, monkeypatch, django_assert_num_queries
+    ):
+        monkeypatch.setattr(_bulk_m2m, "_get_max_query_params", lambda connection: 2)
+
+        # a lookup, and 2 deletes of the 3 rows of pizzas[2]
+        with django_assert_num_queries(3):
+            num_added, num_removed = Pizza.objects.bulk_sync_m2m(
+                "toppings", {pizzas[2].pk: []}
+            )
+
+        assert num_added == 0
+        assert num_removed == 3
+        assert not pizzas[2].toppings.exists()
+
+    def test_errors_if_not_m2m_field(self):
+        with pytest.raises(ValueError, match="name is not a many-to-many field"):
+            Pizza.objects.bulk_sync_m2m("name", {})
+
+    def test_errors_if_symmetrical(self):
+        with pytest.raises(ValueError, match="neighbours of Location is symmetrical"):
+            Location.objects.bulk_sync_m2m("neighbours", {})
+
+
+class TestUpdateExpressions:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        Pizza.objects.create(name="Margherita", num_orders=5)
+
+    def _upsert(self, num_orders_by_name, update_expressions):
+        return Pizza.objects.bulk_update_or_create(
+            [
+                Pizza(name=name, num_orders=num_orders)
+                for name, num_orders in num_orders_by_name.items()
+            ],
+            lookup_fields=["name"],
+            update_fields=[],
+            update_expressions=update_expressions,
+        )
+
+    def test_counter(self):
+        updated, created = self._upsert(
+            {"Margherita": 2, "Hawaiian": 3},
+            {"num_orders": F("num_orders") + Incoming("num_orders")},
+        )
+
+        assert [(pizza.name, pizza.num_orders) for pizza in updated] == [
+            ("Margherita", 7)
+        ]
+        assert [(pizza.name, pizza.num_orders) for pizza in created] == [
+            ("Hawaiian", 3)
+        ]
+        assert dict(Pizza.objects.values_list("name", "num_orders")) == {
+            "Margherita": 7,
+            "Hawaiian": 3,
+        }
+
+    @pytest.mark.parametrize("incoming, expected", [(3, 5), (8, 8)])
+    def test_greatest(self, incoming, expected):
+        self._upsert(
+            {"Margherita": incoming},
+            {"num_orders": Greatest("num_orders", Incoming("num_orders"))},
+        )
+
+        assert Pizza.objects.get().num_orders == expected
+
+    def test_duplicates_raise(self):
+        with pytest.raises(ValueError, match="pass an on_duplicate function"):
+            Pizza.objects.bulk_update_or_create(
+                [Pizza(name="Margherita", num_orders=1)] * 2,
+                lookup_fields=["name"],
+                update_fields=[],
+                update_expressions={
+                    "num_orders": F("num_orders") + Incoming("num_orders")
+                },
+            )
+
+        assert Pizza.objects.get().num_orders == 5
+
+    def test_duplicates_are_folded(self):
+        def merge(kept, duplicate):
+            return Pizza(
+                name=kept.name, num_orders=kept.num_orders + duplicate.num_orders
+            )
+
+        Pizza.objects.bulk_update_or_create(
+            [
+                Pizza(name="Margherita", num_orders=1),
+                Pizza(name="Margherita", num_orders=2),
+            ],
+            lookup_fields=["name"],
+            update_fields=[],
+            update_expressions={"num_orders": F("num_orders") + Incoming("num_orders")},
+            on_duplicate=merge,
+        )
+
+        assert Pizza.objects.get().num_orders == 8
+
+    def test_field_in_update_fields_and_expressions(self):
+        with pytest.raises(ValueError, match="both update_fields and update_exp"):
+            Pizza.objects.bulk_update_or_create(
+                [Pizza(name="Margherita", num_orders=1)],
+                lookup_fields=["name"],
+                update_fields=["num_orders"],
+                update_expressions={"num_orders": Incoming("num_orders")},
+            )
+
+    def test_incoming_outside_of_update_expressions(self):
+        with pytest.raises(ValueError, match="only be used in update_expressions"):
+            Pizza.objects.update(num_orders=Incoming("num_orders"))
+
+
+class CityRouter:
+    def db_for_write(self, model, instance=None, **hints):
+        if model is Location and instance is not None:
+            return "other" if instance.city.startswith("P") else "default"
+        return None
+
+
+@pytest.mark.django_db(databases=["default", "other"])
+class TestPartitionBy:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        Location.objects.create(city="Toronto")
+        Location.objects.using("other").create(city="Paris")
+
+    def _cities(self, db):
+        return set(Location.objects.using(db).values_list("city", flat=True))
+
+    def _upsert(self, cities, **kwargs):
+        return Location.objects.bulk_update_or_create(
+            [Location(city=city) for city in cities],
+            lookup_fields=["city"],
+            update_fields=["city"],
+            **kwargs,
+        )
+
+    def test_router(self):
+        with override_settings(DATABASE_ROUTERS=[CityRouter()]):
+            updated, created = self._upsert(
+                ["Toronto", "Paris", "Prague", "Lima"], partition_by="router"
+            )
+
+        assert not updated
+        assert {location.city for location in created} == {"Prague", "Lima"}
+        assert self._cities("default") == {"Toronto", "Lima"}
+        assert self._cities("other") == {"Paris", "Prague"}
+
+    def test_function(self):
+        updated, created, num_deleted = self._upsert(
+            ["Lima", "Prague"],
+            partition_by=lambda location: "other",
+            delete_missing=True,
+        )
+
+        assert {location.city for location in created} == {"Lima", "Prague"}
+        assert num_deleted == 1
+        assert self._cities("default") == {"Toronto"}
+        assert self._cities("other") == {"Lima", "Prague"}
+
+    def test_report(self):
+        with override_settings(DATABASE_ROUTERS=[CityRouter()]):
+            report = self._upsert(
+                ["Toronto", "Paris", "Prague"], partition_by="router", report=True
+            )
+
+        assert set(report.partitions) == {"default", "other"}
+        assert report.num_unchanged == 2
+        assert report.num_created == 1
+        assert report.partitions["other"].num_created == 1
+        assert report.num_queries["lookup"] == 2
+
+    def test_workers_are_not_used_in_transactions(self, monkeypatch):
+        def executor(**kwargs):
+            raise AssertionError("threads can't see the caller's transaction")
+
+        monkeypatch.setattr(_bulk, "ThreadPoolExecutor", executor)
+
+        # the test runs in a transaction on both databases
+        updated, created = self._upsert(
+            ["Toronto", "Lima"],
+            partition_by=lambda location: "other" if location.city == "Lima" else None,
+            max_workers=2,
+        )
+
+        assert [location.city for location in created] == ["Lima"]
+        assert self._cities("other") == {"Paris", "Lima"}
+
+    def test_children_are_not_supported(self):
+        with pytest.raises(ValueError, match="children can't be upserted"):
+            self._upsert(
+                ["Toronto"],
+                partition_by="router",
+                children={"restaurants": {"objects": []}},
+            )
+
+
+@pytest.mark.django_db(databases=["default", "other"], transaction=True)
+def test_partition_by_with_workers():
+    updated, created = Location.objects.bulk_update_or_create(
+        [Location(city=city) for city in ["Toronto", "Paris"]],
+        lookup_fields=["city"],
+        update_fields=["city"],
+        partition_by=lambda location: "other" if location.city == "Paris" else None,
+        max_workers=2,
+    )
+
+    assert {location.city for location in created} == {"Toronto", "Paris"}
+    assert Location.objects.get().city == "Toronto"
+    assert Location.objects.using("other").get().city == "Paris"
+
+
+class TestBulkModelPlan:
+    def test_is_reused(self):
+        plan = _bulk_plan.get_bulk_model_plan(
+            Restaurant, "default", ["location"], ["best_pizza"]
+        )
+
+        assert plan is _bulk_plan.get_bulk_model_plan(
+            Restaurant, "default", ("location",), ("best_pizza",)
+        )
+        assert plan is not _bulk_plan.get_bulk_model_plan(
+            Restaurant, "other", ["location"], ["best_pizza"]
+        )
+
+    def test_plan(self):
+        plan = _bulk_plan.get_bulk_model_plan(
+            Restaurant, "default", ["location"], ["best_pizza"]
+        )
+
+        assert plan.lookup_fields == ["location_id"]
+        assert plan.update_fields == ["best_pizza_id"]
+        assert plan.auto_now_fields == ["updated_at"]
+        assert plan.auto_now_add_fields == ["created_at"]
+        assert [field.name for field in plan.update_model_fields] == [
+            "best_pizza",
+            "updated_at",
+        ]
+        assert plan.converters["location_id"]("1") == 1
+        assert plan.supports_values_update
+        # Django 3.2 doesn't return the rows of SQLite inserts
+        assert not plan.can_return_rows_from_bulk_insert
+
+    def test_validates_fields_once(self, monkeypatch):
+        def upsert():
+            Restaurant.objects.bulk_update_or_create(
+                [],
+                lookup_fields=["location"],
+                update_fields=[],
+                update_expressions={"best_pizza": Incoming("best_pizza")},
+                delete_missing=True,
+            )
+
+        upsert()
+        monkeypatch.setattr(_bulk_plan, "get_validated_fields", pytest.fail)
+
+        upsert()
+
+
+class TestBulkGetOrCreate:
+    @pytest.fixture
+    def restaurants(self):
+        return RestaurantFactory.create_batch(2)
+
+    def test_get_or_create(self, restaurants, django_assert_num_queries):
+        location = Location.objects.create(city="Toronto")
+        pizza = restaurants[0].best_pizza
+        new = Restaurant(location_id=location.id, best_pizza_id=pizza.id)
+        existing = Restaurant(
+            location_id=restaurants[0].location_id,
+            best_pizza_id=restaurants[0].best_pizza_id,
+        )
+
+        with django_assert_num_queries(3):
+            records = Restaurant.objects.bulk_get_or_create(
+                [
+                    existing,
+                    new,
+                    Restaurant(location_id=location.id, best_pizza_id=pizza.id),
+                ],
+                lookup_fields=["location", "best_pizza"],
+            )
+
+        assert len(records) == 2
+        assert records[location.id, pizza.id].pk is not None
+        assert (
+            records[restaurants[0].location_id, restaurants[0].best_pizza_id].pk
+            == restaurants[0].pk
+        )
+        assert Restaurant.objects.count() == 3
+
+    def test_get_only(self, restaurants, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            records = Restaurant.objects.bulk_get_or_create(
+                [
+                    Restaurant(location_id=r.location_id, best_pizza_id=r.best_pizza_id)
+                    for r in restaurants
+                ],
+                lookup_fields=["location", "best_pizza"],
+            )
+
+        assert {record.pk for record in records.values()} == {r.pk for r in restaurants}
+
+
+class TestInBulkBy:
+    def test_composite_keys(self, django_assert_num_queries):
+        restaurants = RestaurantFactory.create_batch(3)
+        keys = [(r.location_id, r.best_pizza_id) for r in restaurants]
+
+        with django_assert_num_queries(2):
+            records = Restaurant.objects.in_bulk_by(
+                ["location", "best_pizza"],
+                keys + [(str(keys[0][0]), keys[0][1]), (0, 0)],
+                batch_size=2,
+            )
+
+        assert records == {key: r for key, r in zip(keys, restaurants)}
+
+    def test_single_field(self):
+        user = UserFactory()
+
+        with CaptureQueriesContext(connection) as context:
+            records = User.objects.in_bulk_by(
+                ["username"], [(user.username,), ("unknown",)]
+            )
+
+        assert records == {(user.username,): user}
+        assert '"username" IN (' in context.captured_queries[0]["sql"]
+
+    def test_null_values(self):
+        user = UserFactory(profile=None)
+
+        assert User.objects.in_bulk_by(["profile"], [(None,), (-1,)]) == {(None,): user}
+
+    def test_wrong_key_length(self):
+        with pytest.raises(ValueError, match="Expected 2 values per key, got 1"):
+            Restaurant.objects.in_bulk_by(["location", "best_pizza"], [(1,)])
+
+
+class TestKeyCache:
+    @pytest.fixture(autouse=True)
+    def key_cache(self):
+        with override_settings(
+            DJANGO_ORM_PLUS={"BULK_KEY_CACHES": {"app.Restaurant": {}}}
+        ):
+            yield
+
+    @pytest.fixture
+    def restaurants(self):
+        return RestaurantFactory.create_batch(3)
+
+    @pytest.fixture
+    def upsert(self, restaurants, django_capture_on_commit_callbacks):
+        def upsert(best_pizza=None, **kwargs):
+            with django_capture_on_commit_callbacks(execute=True):
+                return Restaurant.objects.bulk_update_or_create(
+                    [
+                        Restaurant(
+                            location_id=restaurant.location_id,
+                            best_pizza_id=(best_pizza or restaurant.best_pizza).pk,
+                        )
+                        for restaurant in restaurants
+                    ],
+                    lookup_fields=["location"],
+                    update_fields=["best_pizza"],
+                    report=True,
+                    **kwargs,
+                )
+
+        return upsert
+
+    def test_skips_lookup_of_unchanged_records(self, upsert, django_assert_num_queries):
+        upsert()
+
+        with django_assert_num_queries(0):
+            report = upsert()
+
+        assert report.num_unchanged == 3
+
+    def test_updates_changed_records_by_pk(
+        self, restaurants, upsert, django_assert_num_queries
+    ):
+        pizza = Pizza.objects.create(name="Margherita")
+        upsert()
+
+        with django_assert_num_queries(1):
+            report = upsert(best_pizza=pizza)
+
+        assert {obj.pk for obj in report.updated} == {r.pk for r in restaurants}
+        assert set(Restaurant.objects.values_list("best_pizza_id", flat=True)) == {
+            pizza.pk
+        }
+
+        with django_assert_num_queries(0):
+            assert upsert(best_pizza=pizza).num_unchanged == 3
+
+    def test_records_do_not_depend_on_the_cache(self, restaurants, upsert):
+        pizza = Pizza.objects.create(name="Margherita")
+        upsert()
+        objs = [
+            Restaurant(location_id=r.location_id, best_pizza_id=pizza.pk)
+            for r in restaurants
+        ]
+
+        updated, _ = Restaurant.objects.bulk_update_or_create(
+            objs, ["location"], ["best_pizza"]
+        )
+
+        assert [obj.pk for obj in objs] == [None, None, None]
+        assert [(r.pk, r.created_at, r.best_pizza_id) for r in updated] == [
+            (r.pk, r.created_at, pizza.pk) for r in restaurants
+        ]
+
+    def test_deleted_records_are_looked_up(
+        self, restaurants, upsert, django_assert_num_queries
+    ):
+        pizza = Pizza.objects.create(name="Margherita")
+        upsert()
+        # as if deleted by another process, without signals
+        restaurants[0].pizzas.clear()
+        Restaurant.objects.filter(pk=restaurants[0].pk)._raw_delete("default")
+
+        # the update by pk misses a row, so every key is looked up
+        with django_assert_num_queries(4):
+            report = upsert(best_pizza=pizza)
+
+        assert {r.pk for r in report.updated} == {r.pk for r in restaurants[1:]}
+        assert [r.location_id for r in report.created] == [restaurants[0].location_id]
+        assert set(Restaurant.objects.values_list("best_pizza_id", flat=True)) == {
+            pizza.pk
+        }
+
+    def test_deletes_invalidate(self, upsert):
+        upsert()
+        Restaurant.objects.all().delete()
+
+        report = upsert()
+
+        assert report.num_created == 3
+        assert Restaurant.objects.count() == 3
+
+    def test_saves_and_updates_invalidate(self, restaurants, upsert):
+        pizza = Pizza.objects.create(name="Margherita")
+        upsert()
+        restaurant = Restaurant.objects.get(pk=restaurants[0].pk)
+        restaurant.best_pizza = pizza
+        restaurant.save()
+        Restaurant.objects.filter(pk=restaurants[1].pk).update(best_pizza=pizza)
+
+        report = upsert()
+
+        assert {r.pk for r in report.updated} == {r.pk for r in restaurants[:2]}
+
+    def test_requires_a_ttl(self):
+        with override_settings(
+            DJANGO_ORM_PLUS={"BULK_KEY_CACHES": {"app.Restaurant": {"ttl": None}}}
+        ):
+            with pytest.raises(ValueError, match="needs a finite ttl"):
+                _key_cache.get_key_cache(Restaurant)
+
+    def test_rolled_back_writes_are_not_cached(
+        self, restaurants, django_assert_num_queries
+    ):
+        objs = [
+            Restaurant(location_id=r.location_id, best_pizza_id=r.best_pizza_id)
+            for r in restaurants
+        ]
+        Restaurant.objects.bulk_update_or_create(objs, ["location"], ["best_pizza"])
+
+        with django_assert_num_queries(1):
+            Restaurant.objects.bulk_update_or_create(objs, ["location"], ["best_pizza"])
+
+    def test_delete_missing_invalidates(self, upsert, django_assert_num_queries):
+        upsert(delete_missing=True)
+
+        # the lookup, and loading the missing rows for the delete receivers that
+        # invalidate the key cache
+        with django_assert_num_queries(2):
+            upsert(delete_missing=True)
+
+    def test_max_size(self, upsert, django_assert_num_queries):
+        with override_settings(
+            DJANGO_ORM_PLUS={"BULK_KEY_CACHES": {"app.Restaurant": {"max_size": 2}}}
+        ):
+            upsert()
+
+            with django_assert_num_queries(1):
+                assert upsert().num_unchanged == 3
@@ -0,0 +1,159 @@
+import pytest
+from django_orm_plus._fetch_plan import build_fetch_plan
+from django_orm_plus._fetch_related import AutoFetch
+from django_orm_plus.exceptions import RelatedAttributeNeedsExplicitFetch
+
+from app.models import Location, Pizza, Restaurant, Topping, User
+
+from .factories import UserFavoriteFactory
+
+
+pytestmark = pytest.mark.django_db
+
+
+class Field:
+    def __init__(self, source=None):
+        self.source = source
+
+
+class ListSerializer(Field):
+    def __init__(self, child, source=None):
+        super().__init__(source)
+        self.child = child
+
+
+class ToppingSerializer:
+    class Meta:
+        model = Topping
+        fields = ["name"]
+
+
+class PizzaSerializer:
+    _declared_fields = {
+        "toppings": ListSerializer(ToppingSerializer()),
+        "display_name": Field(source="*"),
+    }
+
+    class Meta:
+        model = Pizza
+        fields = ["name", "toppings", "display_name"]
+
+
+class RestaurantSerializer:
+    _declared_fields = {
+        "city": Field(source="location.city"),
+        "pizzas": ListSerializer(PizzaSerializer()),
+    }
+
+    class Meta:
+        model = Restaurant
+        fields = ["best_pizza", "city", "pizzas"]
+
+
+class TestBuildFetchPlan:
+    def test_dict_declaration(self):
+        plan = build_fetch_plan(
+            Restaurant,
+            {"location": {"city": None}, "pizzas": ["name"], "best_pizza": None},
+        )
+
+        assert list(plan.lookups) == [AutoFetch("location"), AutoFetch("pizzas")]
+        assert plan.only == {
+            "": {"id", "location", "best_pizza"},
+            "location": {"id", "city"},
+            "pizzas": {"id", "name"},
+        }
+
+    def test_reverse_relation_loads_remote_foreign_key(self):
+        plan = build_fetch_plan(Location, {"city": True, "restaurants": {}})
+
+        assert list(plan.lookups) == [AutoFetch("restaurants")]
+        assert plan.only == {"": {"id", "city"}, "restaurants": {"id", "location"}}
+
+    def test_ignores_non_model_fields(self):
+        plan = build_fetch_plan(Topping, ["name", "__str__"])
+
+        assert not list(plan.lookups)
+        assert plan.only == {"": {"id", "name"}}
+
+    def test_serializer_declaration(self):
+        plan = build_fetch_plan(Restaurant, RestaurantSerializer)
+
+        assert list(plan.lookups) == [
+            AutoFetch("location"),
+            AutoFetch("pizzas"),
+            AutoFetch("pizzas__toppings"),
+        ]
+        assert plan.only == {
+            "": {"id", "best_pizza", "location"},
+            "location": {"id", "city"},
+            "pizzas": {"id", "name"},
+            "pizzas__toppings": {"id", "name"},
+        }
+
+    def test_serializer_with_all_fields(self):
+        class LocationSerializer:
+            class Meta:
+                model = Location
+                fields = "__all__"
+                exclude = ["created_at", "neighbours"]
+
+        plan = build_fetch_plan(Location, LocationSerializer)
+
+        assert plan.only == {"": {"id", "updated_at", "city"}}
+
+    def test_plan_is_cached_per_serializer(self):
+        assert build_fetch_plan(Restaurant, RestaurantSerializer) is build_fetch_plan(
+            Restaurant, RestaurantSerializer
+        )
+        assert build_fetch_plan(Topping, ["name"]) is not build_fetch_plan(
+            Topping, ["name"]
+        )
+
+
+class TestFetchRelatedFor:
+    @pytest.fixture(autouse=True)
+    def create_base_objects(self):
+        for i in range(0, 2):
+            UserFavoriteFactory()
+
+    def test_serializer_fields_can_be_accessed(self, django_assert_num_queries):
+        with django_assert_num_queries(3):
+            restaurants = list(
+                Restaurant.objects.fetch_related_for(RestaurantSerializer).strict()
+            )
+
+        with django_assert_num_queries(0):
+            for restaurant in restaurants:
+                assert restaurant.best_pizza_id
+                assert restaurant.location.city
+                for pizza in restaurant.pizzas.all():
+                    assert pizza.name
+                    assert all(topping.name for topping in pizza.toppings.all())
+
+    def test_fields_outside_the_plan_are_deferred(self):
+        restaurant = Restaurant.objects.fetch_related_for(RestaurantSerializer)[0]
+
+        assert "created_at" not in restaurant.__dict__
+        assert "created_at" not in restaurant.pizzas.all()[0].__dict__
+
+    def test_strict_mode_errors_for_fields_outside_the_plan(self):
+        restaurant = Restaurant.objects.fetch_related_for(
+            RestaurantSerializer
+        ).strict()[0]
+
+        with pytest.raises(
+            RelatedAttributeNeedsExplicitFetch, match="Pizza.created_at"
+        ):
+            restaurant.pizzas.all()[0].created_at
+
+    def test_reverse_one_to_one(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            users = list(
+                User.objects.fetch_related_for(
+                    {"username": None, "userfavorite": {"restaurant": None}}
+                ).strict()
+            )
+
+        with django_assert_num_queries(0):
+            assert all(user.userfavorite.restaurant_id for user in users)
@@ -149,6 +149,19 @@ class TestFetchRelated:
             expected_prefetches=["toppings"],
         )
 
+    def test_prefetch__to_attr(self):
+        qs = fetch_related(
+            Restaurant.objects.all(), ["pizzas__toppings"], to_attr_suffix="_list"
+        )
+        self._assert_matches_and_runs(qs, ["pizzas"])
+
+        restaurant = qs[0]
+        assert restaurant._prefetched_objects_cache == {}
+        assert restaurant.pizzas_list == list(restaurant.pizzas.all())
+        assert restaurant.pizzas_list[0].toppings_list == list(
+            restaurant.pizzas_list[0].toppings.all()
+        )
+
     class TestWithStrictMode:
         def test_it_calls_both_without_error(self):
             assert (
@@ -171,3 +184,33 @@ class TestFetchRelated:
             )
             assert restaurants[0].best_pizza is not None
             assert restaurants[0].best_pizza.toppings.all()[0] is not None
+
+        def test_it_does_not_error_for_nested_prefetches(self):
+            restaurants = Restaurant.objects.fetch_related("pizzas__toppings").strict()
+
+            for restaurant in restaurants:
+                for pizza in restaurant.pizzas.all():
+                    assert pizza.toppings.all()[0] is not None
+
+        def test_it_errors_when_prefetched_object_relation_is_not_fetched(self):
+            restaurants = Restaurant.objects.fetch_related("pizzas").strict()
+
+            with pytest.raises(RelatedObjectNeedsExplicitFetch, match="Pizza.toppings"):
+                restaurants[0].pizzas.all()[0].toppings.all()[0]
+
+        def test_to_attr(self, django_assert_num_queries):
+            restaurants = Restaurant.objects.fetch_related(
+                "pizzas__toppings", to_attr_suffix="_list"
+            ).strict()
+
+            with django_assert_num_queries(3):
+                for restaurant in restaurants:
+                    for pizza in restaurant.pizzas_list:
+                        assert pizza.toppings_list[0] is not None
+
+            with pytest.raises(RelatedObjectNeedsExplicitFetch, match="Pizza.toppings"):
+                restaurants[0].pizzas_list[0].toppings.all()[0]
+            with pytest.raises(
+                RelatedObjectNeedsExplicitFetch, match="Restaurant.pizzas"
+            ):
+                restaurants[0].pizzas.all()[0]
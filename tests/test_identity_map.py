@@ -0,0 +1,172 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_orm_plus._identity_map import IdentityMap
+from django_orm_plus.exceptions import RelatedObjectNeedsExplicitFetch
+from django_orm_plus.mixins import identity_map_scope
+
+from app.models import Location, Pizza, Restaurant
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def pizza():
+    location = Location.objects.create(city="Toronto")
+    pizza = Pizza.objects.create(name="Margherita")
+
+    for _ in range(0, 2):
+        restaurant = Restaurant.objects.create(location=location, best_pizza=pizza)
+        restaurant.pizzas.set([pizza])
+    return pizza
+
+
+def test_duplicates_are_not_shared_by_default(pizza):
+    pizza = Pizza.objects.fetch_related(
+        "restaurants__location", "championed_by__location"
+    )[0]
+
+    restaurants = pizza.restaurants.all()
+    assert restaurants[0].location is not restaurants[1].location
+    assert restaurants[0] is not pizza.championed_by.all()[0]
+
+
+def test_objects_reached_through_several_paths_are_shared(
+    pizza, django_assert_num_queries
+):
+    with django_assert_num_queries(3):
+        pizza = Pizza.objects.fetch_related(
+            "restaurants__location", "championed_by__location", identity_map=True
+        )[0]
+
+    with django_assert_num_queries(0):
+        restaurants = list(pizza.restaurants.all())
+        championed_by = list(pizza.championed_by.all())
+
+        assert restaurants[0].location is restaurants[1].location
+        assert championed_by[0].location is restaurants[0].location
+        assert {id(r) for r in restaurants} == {id(r) for r in championed_by}
+        assert restaurants[0].best_pizza_id == pizza.id
+
+
+def test_objects_in_to_attr_lists_are_shared(pizza, django_assert_num_queries):
+    with django_assert_num_queries(3):
+        pizza = (
+            Pizza.objects.fetch_related(
+                "restaurants__location",
+                "championed_by__location",
+                identity_map=True,
+                to_attr_suffix="_list",
+            )
+            .strict()
+            .get()
+        )
+
+    restaurants = pizza.restaurants_list
+    championed_by = pizza.championed_by_list
+    assert restaurants[0].location is restaurants[1].location
+    assert championed_by[0].location.city == "Toronto"
+    assert {id(r) for r in restaurants} == {id(r) for r in championed_by}
+
+
+def test_works_with_strict_mode(pizza):
+    pizza = (
+        Pizza.objects.fetch_related(
+            "restaurants__location", "championed_by__location", identity_map=True
+        )
+        .strict()
+        .get()
+    )
+
+    assert pizza.championed_by.all()[0].location.city == "Toronto"
+    assert pizza.restaurants.all()[0].location.city == "Toronto"
+
+
+def test_scope_is_one_evaluation_without_identity_map_scope(pizza):
+    first = list(Restaurant.objects.fetch_related("location", identity_map=True))
+    second = list(Restaurant.objects.fetch_related("location", identity_map=True))
+
+    assert first[0] is not second[0]
+    assert first[0].location is first[1].location
+
+
+def test_identity_map_scope_shares_objects_across_evaluations(pizza):
+    with identity_map_scope() as identity_map:
+        first = list(Restaurant.objects.fetch_related("location", identity_map=True))
+        second = list(Restaurant.objects.fetch_related("location", identity_map=True))
+
+    assert first == second
+    assert all(a is b for a, b in zip(first, second))
+    assert len(identity_map) == 3
+
+
+def test_deferred_fields_are_filled_in_by_later_queries(
+    pizza, django_assert_num_queries
+):
+    with identity_map_scope():
+        deferred = list(Restaurant.objects.only("id").fetch_related(identity_map=True))
+        restaurants = list(
+            Restaurant.objects.fetch_related("location", identity_map=True).strict()
+        )
+
+    assert restaurants == deferred
+    assert all(a is b for a, b in zip(restaurants, deferred))
+    with django_assert_num_queries(0):
+        assert restaurants[0].location.city == "Toronto"
+        assert restaurants[0].best_pizza_id == pizza.pk
+    # the strict mode of the later query is kept
+    with pytest.raises(RelatedObjectNeedsExplicitFetch):
+        restaurants[0].best_pizza
+
+
+def test_prefetch_skips_already_loaded_objects(pizza):
+    with identity_map_scope():
+        restaurants = list(
+            Restaurant.objects.fetch_related("location", identity_map=True)
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            pizza = Pizza.objects.fetch_related(
+                "championed_by__location", identity_map=True
+            )[0]
+
+    assert len(ctx.captured_queries) == 2
+    assert "NOT" in ctx.captured_queries[1]["sql"]
+    assert sorted(pizza.championed_by.all(), key=lambda r: r.pk) == restaurants
+    assert pizza.championed_by.all()[0] is restaurants[0]
+    assert pizza.championed_by.all()[0].best_pizza is pizza
+
+
+def test_prefetch_skips_objects_loaded_by_the_same_evaluation(pizza):
+    with CaptureQueriesContext(connection) as ctx:
+        restaurants = list(
+            Restaurant.objects.fetch_related(
+                "best_pizza__championed_by", identity_map=True
+            )
+        )
+
+    assert len(ctx.captured_queries) == 2
+    assert "NOT" in ctx.captured_queries[1]["sql"]
+    assert restaurants[0].best_pizza is restaurants[1].best_pizza
+    assert list(restaurants[0].best_pizza.championed_by.all()) == restaurants
+    assert restaurants[0].best_pizza.championed_by.all()[0] is restaurants[0]
+
+
+def test_prefetch_does_not_skip_objects_missing_select_related(pizza):
+    with identity_map_scope():
+        list(Restaurant.objects.fetch_related(identity_map=True))
+
+        with CaptureQueriesContext(connection) as ctx:
+            pizza = Pizza.objects.fetch_related(
+                "championed_by__location", identity_map=True
+            )[0]
+
+    assert "NOT" not in ctx.captured_queries[1]["sql"]
+    assert pizza.championed_by.all()[0].location.city == "Toronto"
+
+
+def test_canonicalize_leaves_unsaved_objects_alone():
+    objs = [Location(city="a"), Location(city="a")]
+
+    assert IdentityMap().canonicalize(objs) == objs
@@ -0,0 +1,133 @@
+import logging
+
+import pytest
+from django.db import connection
+from django_orm_plus.exceptions import QueryBudgetExceeded
+from django_orm_plus.mixins import query_budget
+
+from app.models import Restaurant
+
+from .factories import RestaurantFactory
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def create_base_objects():
+    for i in range(0, 2):
+        RestaurantFactory()
+
+
+def test_within_budget():
+    with query_budget(max_queries=3, max_rows=30) as budget:
+        list(Restaurant.objects.fetch_related("pizzas__toppings", "location"))
+
+    assert len(budget.statements) == 3
+    # 2 restaurants, 6 pizzas and 18 toppings
+    assert budget.num_rows == 2 + 6 + 18
+
+
+def test_max_queries_exceeded():
+    with pytest.raises(QueryBudgetExceeded, match=r"3 queries \(max 2\)") as exc:
+        with query_budget(max_queries=2):
+            list(Restaurant.objects.fetch_related("pizzas__toppings"))
+
+    assert [statement.source for statement in exc.value.statements] == [
+        "Restaurant queryset",
+        "prefetch pizzas",
+        "prefetch pizzas__toppings",
+    ]
+    assert "test_query_budget.py" in exc.value.statements[0].call_site
+
+
+def test_max_rows_exceeded():
+    with pytest.raises(QueryBudgetExceeded, match=r"8 rows \(max 5\)"):
+        with query_budget(max_rows=5):
+            list(Restaurant.objects.fetch_related("pizzas"))
+
+
+def test_lazy_loads_are_attributed():
+    with pytest.raises(QueryBudgetExceeded) as exc:
+        with query_budget(max_queries=1):
+            for restaurant in Restaurant.objects.all():
+                restaurant.location
+                list(restaurant.pizzas.all())
+
+    assert [statement.source for statement in exc.value.statements] == [
+        "Restaurant queryset",
+        "lazy load Restaurant.location",
+        "lazy load Restaurant -> Pizza",
+        "lazy load Restaurant.location",
+        "lazy load Restaurant -> Pizza",
+    ]
+
+
+def test_deferred_fields_are_attributed():
+    with pytest.raises(QueryBudgetExceeded) as exc:
+        with query_budget(max_queries=1):
+            for restaurant in Restaurant.objects.only("id"):
+                restaurant.created_at
+
+    assert exc.value.statements[1].source == "deferred field Restaurant.created_at"
+
+
+def test_max_duplicates_exceeded():
+    restaurant = Restaurant.objects.first()
+
+    with pytest.raises(QueryBudgetExceeded, match="2 identical queries"):
+        with query_budget(max_duplicates=1):
+            list(restaurant.pizzas.all())
+            list(restaurant.pizzas.all())
+
+
+def test_logs_instead_of_raising(caplog):
+    with caplog.at_level(logging.WARNING, logger="django_orm_plus"):
+        with query_budget(max_queries=0, raise_exception=False):
+            list(Restaurant.objects.all())
+
+    assert "Query budget exceeded: 1 queries (max 0)" in caplog.text
+
+
+def test_decorator_uses_a_fresh_budget_per_call():
+    @query_budget(max_queries=1)
+    def view():
+        return list(Restaurant.objects.all())
+
+    @query_budget(max_queries=1)
+    def over_budget_view():
+        list(Restaurant.objects.all())
+        list(Restaurant.objects.all())
+
+    view()
+    view()
+    with pytest.raises(QueryBudgetExceeded):
+        over_budget_view()
+
+
+def test_queryset_within_budget():
+    qs = Restaurant.objects.fetch_related("pizzas__toppings")
+
+    assert len(qs.within_budget(max_queries=3)) == 2
+    with pytest.raises(QueryBudgetExceeded):
+        list(qs.within_budget(max_queries=2))
+
+
+def test_queryset_within_budget_logs(caplog):
+    qs = Restaurant.objects.all()
+
+    with caplog.at_level(logging.WARNING, logger="django_orm_plus"):
+        list(qs.within_budget(max_queries=0, raise_exception=False))
+
+    assert "Query budget exceeded: 1 queries (max 0)" in caplog.text
+
+
+def test_decorates_functions_of_any_arity():
+    @query_budget(max_queries=1)
+    def view(a, b, c, d, e):
+        assert not any(
+            isinstance(wrapper, query_budget) for wrapper in connection.execute_wrappers
+        )
+        return list(Restaurant.objects.all()[: a + b + c + d + e])
+
+    assert len(view(1, 0, 0, 0, 0)) == 1
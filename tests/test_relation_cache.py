@@ -0,0 +1,193 @@
+import pytest
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_delete, post_save
+from django.test import override_settings
+from django_orm_plus._relation_cache import DjangoRelationCache, get_relation_cache
+
+from app.models import Location, Pizza, Restaurant, Topping, UserFavorite
+
+from .factories import RestaurantFactory
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def create_base_objects():
+    for i in range(0, 2):
+        RestaurantFactory()
+
+
+@pytest.fixture(params=[{"ttl": 300}, {"ttl": 300, "cache": "default"}])
+def cached_relations(request):
+    with override_settings(
+        DJANGO_ORM_PLUS={
+            "CACHED_RELATIONS": {
+                "app.Location": request.param,
+                "app.Topping": request.param,
+            }
+        }
+    ):
+        yield
+
+
+def test_does_not_cache_by_default(django_assert_num_queries):
+    with django_assert_num_queries(1):
+        list(Restaurant.objects.fetch_related("location"))
+    with django_assert_num_queries(1):
+        list(Restaurant.objects.fetch_related("location"))
+
+
+def test_django_cache_clear():
+    relation_cache = DjangoRelationCache("app.Location", "default")
+    relation_cache.set_many({("default", 1): ("Toronto",)})
+    assert relation_cache.get_many([("default", 1)]) == {("default", 1): ("Toronto",)}
+
+    relation_cache.clear()
+
+    assert relation_cache.get_many([("default", 1)]) == {}
+
+
+def test_receivers_are_only_connected_for_cached_models():
+    assert not post_save.has_listeners(Location)
+    assert not post_delete.has_listeners(Location)
+
+    with override_settings(
+        DJANGO_ORM_PLUS={"CACHED_RELATIONS": {"app.Location": {"ttl": 300}}}
+    ):
+        assert post_save.has_listeners(Location)
+        assert post_delete.has_listeners(Location)
+        assert not post_delete.has_listeners(Topping)
+
+    assert not post_delete.has_listeners(Location)
+
+
+@pytest.mark.usefixtures("cached_relations")
+class TestCachedRelations:
+    def test_uncached_models_keep_fast_deletes(self):
+        collector = Collector(using="default")
+
+        assert collector.can_fast_delete(UserFavorite.objects.all())
+
+    def test_foreign_key_is_served_from_cache(self, django_assert_num_queries):
+        with django_assert_num_queries(2):
+            restaurants = list(Restaurant.objects.fetch_related("location"))
+
+        with django_assert_num_queries(1):
+            cached_restaurants = list(Restaurant.objects.fetch_related("location"))
+
+        with django_assert_num_queries(0):
+            assert [r.location.city for r in cached_restaurants] == [
+                r.location.city for r in restaurants
+            ]
+            assert cached_restaurants[0].location is not restaurants[0].location
+
+    def test_many_to_many_is_served_from_cache(self, django_assert_num_queries):
+        with django_assert_num_queries(3):
+            pizzas = list(Pizza.objects.fetch_related("toppings"))
+
+        with django_assert_num_queries(2):
+            cached_pizzas = list(Pizza.objects.fetch_related("toppings"))
+
+        with django_assert_num_queries(0):
+            for pizza, cached_pizza in zip(pizzas, cached_pizzas):
+                assert list(cached_pizza.toppings.all()) == list(pizza.toppings.all())
+                assert len(cached_pizza.toppings.all()) == 3
+
+    def test_uncached_model_is_prefetched(self, django_assert_num_queries):
+        topping = Topping.objects.fetch_related("pizza_set")[0]
+
+        with django_assert_num_queries(0):
+            assert len(topping.pizza_set.all()) == 1
+
+    def test_nested_hop_is_served_from_cache(self, django_assert_num_queries):
+        list(Restaurant.objects.fetch_related("location", "pizzas__toppings"))
+
+        with django_assert_num_queries(3):
+            restaurants = list(
+                Restaurant.objects.fetch_related("location", "pizzas__toppings")
+            )
+
+        with django_assert_num_queries(0):
+            for restaurant in restaurants:
+                assert restaurant.location.city
+                for pizza in restaurant.pizzas.all():
+                    assert len(pizza.toppings.all()) == 3
+
+    def test_hop_with_further_lookups_is_not_cached(self):
+        qs = Restaurant.objects.fetch_related("location__restaurants")
+
+        assert qs.query.select_related == {"location": {}}
+        assert not qs._cached_relations
+        assert qs[0].location.restaurants.all()
+
+    def test_works_with_strict_mode(self):
+        list(Restaurant.objects.fetch_related("location", "pizzas__toppings"))
+        restaurants = Restaurant.objects.fetch_related(
+            "location", "pizzas__toppings"
+        ).strict()
+
+        for restaurant in restaurants:
+            assert restaurant.location.city
+            assert restaurant.location._strict_mode.strict_mode
+            for pizza in restaurant.pizzas.all():
+                assert pizza.toppings.all()[0].name
+
+    def test_save_invalidates(self, django_assert_num_queries):
+        list(Restaurant.objects.fetch_related("location"))
+        location = Location.objects.first()
+        location.city = "Paris"
+        location.save()
+
+        with django_assert_num_queries(2):
+            restaurants = list(Restaurant.objects.fetch_related("location"))
+
+        assert restaurants[0].location.city == "Paris"
+
+    def test_save_invalidates_again_on_commit(
+        self, django_assert_num_queries, django_capture_on_commit_callbacks
+    ):
+        location = Location.objects.first()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            location.city = "Paris"
+            location.save()
+            # as another connection would before the transaction commits
+            get_relation_cache(Location).set_many(
+                {
+                    ("default", location.pk): (
+                        location.pk,
+                        location.created_at,
+                        location.updated_at,
+                        "Toronto",
+                    )
+                }
+            )
+
+        with django_assert_num_queries(2):
+            restaurants = list(Restaurant.objects.fetch_related("location"))
+
+        assert "Paris" in {restaurant.location.city for restaurant in restaurants}
+
+    def test_delete_invalidates(self, django_assert_num_queries):
+        list(Pizza.objects.fetch_related("toppings"))
+        Topping.objects.first().delete()
+
+        with django_assert_num_queries(2):
+            pizzas = list(Pizza.objects.fetch_related("toppings"))
+
+        assert sum(len(pizza.toppings.all()) for pizza in pizzas) == 23
+
+    def test_bulk_update_or_create_invalidates(self, django_assert_num_queries):
+        list(Restaurant.objects.fetch_related("location"))
+        location = Location.objects.first()
+
+        Location.objects.bulk_update_or_create(
+            [Location(id=location.id, city="Paris")],
+            lookup_fields=["id"],
+            update_fields=["city"],
+        )
+
+        with django_assert_num_queries(2):
+            restaurants = Restaurant.objects.fetch_related("location")
+            assert restaurants.get(location=location).location.city == "Paris"
@@ -0,0 +1,125 @@
+import socket
+from unittest import mock
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django_orm_plus._detection import StatsdSink
+from django_orm_plus.exceptions import RelatedObjectNeedsExplicitFetch
+from django_orm_plus.middleware import SampledDetectionMiddleware
+
+from app.models import Restaurant, Topping
+
+from .factories import UserFavoriteFactory
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def create_base_objects():
+    for i in range(0, 2):
+        UserFavoriteFactory()
+
+
+def view(request):
+    for restaurant in Restaurant.objects.strict():
+        assert restaurant.location.city is not None
+        for pizza in restaurant.pizzas.all():
+            assert pizza.name is not None
+    assert Topping.objects.only("id")[0].name is not None
+    return HttpResponse()
+
+
+def detection_settings(sample_rate, sink):
+    return override_settings(
+        DJANGO_ORM_PLUS={
+            "SAMPLED_DETECTION_RATE": sample_rate,
+            "SAMPLED_DETECTION_SINK": sink,
+        }
+    )
+
+
+def call_view(sample_rate, sink):
+    request = RequestFactory().get("/restaurants/")
+    with detection_settings(sample_rate, sink):
+        return SampledDetectionMiddleware(view)(request)
+
+
+def test_sampled_request_counts_violations_without_raising():
+    sink = mock.Mock()
+
+    assert call_view(1.0, sink).status_code == 200
+
+    sink.assert_called_once_with(
+        "/restaurants/",
+        {
+            ("deferred_field", "Topping.name"): 1,
+            ("relation", "Restaurant.location"): 2,
+            ("relation", "Restaurant.pizzas"): 2,
+        },
+        1.0,
+    )
+
+
+def test_unsampled_request_is_untouched():
+    sink = mock.Mock()
+
+    with pytest.raises(RelatedObjectNeedsExplicitFetch):
+        call_view(0.0, sink)
+    sink.assert_not_called()
+
+
+def test_sample_rate_is_applied():
+    sink = mock.Mock()
+
+    with mock.patch("random.random", return_value=0.5):
+        with pytest.raises(RelatedObjectNeedsExplicitFetch):
+            call_view(0.25, sink)
+        call_view(0.75, sink)
+
+    assert sink.call_count == 1
+
+
+def test_sink_is_not_called_without_violations():
+    sink = mock.Mock()
+    request = RequestFactory().get("/")
+
+    with detection_settings(1.0, sink):
+        SampledDetectionMiddleware(lambda request: HttpResponse())(request)
+    sink.assert_not_called()
+
+
+def test_logging_sink(caplog):
+    call_view(1.0, "logging")
+
+    assert (
+        "Strict mode violations in /restaurants/: Topping.name deferred_field x1, "
+        "Restaurant.location relation x2, Restaurant.pizzas relation x2"
+    ) in caplog.text
+
+
+def test_dotted_path_sink():
+    with mock.patch("tests.test_sampled_detection.dotted_path_sink") as sink:
+        call_view(1.0, "tests.test_sampled_detection.dotted_path_sink")
+
+    assert sink.call_count == 1
+
+
+def dotted_path_sink(view_name, counts, sample_rate):
+    pass
+
+
+def test_statsd_sink():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1)
+
+    StatsdSink("127.0.0.1", receiver.getsockname()[1])(
+        "app:restaurant-list", {("relation", "Restaurant.location"): 2}, 0.1
+    )
+
+    assert receiver.recv(1024) == (
+        b"django_orm_plus.relation.app_restaurant-list.Restaurant.location:2|c|@0.1"
+    )
+    receiver.close()
@@ -0,0 +1,148 @@
+import pytest
+from django_orm_plus import mixins, signals
+from django_orm_plus._instrumentation import PhaseTimer
+from django_orm_plus.exceptions import RelatedObjectNeedsExplicitFetch
+
+from app.models import Location, Pizza, Restaurant
+
+from .factories import RestaurantFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def events():
+    events = []
+
+    def receiver(signal, sender, **kwargs):
+        events.append((signal, sender, kwargs))
+
+    for signal in (
+        signals.bulk_update_or_create_batch,
+        signals.fetch_related_executed,
+        signals.strict_mode_violation,
+    ):
+        signal.connect(receiver)
+    yield events
+    for signal in (
+        signals.bulk_update_or_create_batch,
+        signals.fetch_related_executed,
+        signals.strict_mode_violation,
+    ):
+        signal.disconnect(receiver)
+
+
+@pytest.fixture(autouse=True)
+def create_base_objects():
+    for i in range(0, 2):
+        RestaurantFactory()
+
+
+def test_bulk_update_or_create_batch(events):
+    restaurant = Restaurant.objects.first()
+    location = Location.objects.create(city="Toronto")
+    pizza = Pizza.objects.create(name="Margherita")
+
+    Restaurant.objects.bulk_update_or_create(
+        [
+            Restaurant(location_id=restaurant.location_id, best_pizza_id=pizza.id),
+            Restaurant(location_id=location.id, best_pizza_id=pizza.id),
+        ],
+        lookup_fields=["location_id"],
+        update_fields=["best_pizza_id"],
+    )
+
+    [(signal, sender, kwargs)] = events
+    assert signal is signals.bulk_update_or_create_batch
+    assert sender is Restaurant
+    assert kwargs["num_objects"] == 2
+    assert kwargs["num_created"] == 1
+    assert kwargs["num_updated"] == 1
+    assert kwargs["num_queries"] == {
+        "lookup": 1,
+        "create": 1,
+        "update": 1,
+        "refetch": 1,
+    }
+    assert set(kwargs["timings"]) == {"lookup", "create", "update", "refetch"}
+
+
+def test_fetch_related_executed(events):
+    restaurants = list(Restaurant.objects.fetch_related("pizzas__toppings", "location"))
+
+    [(signal, sender, kwargs)] = events
+    assert signal is signals.fetch_related_executed
+    assert sender is Restaurant
+    assert kwargs["lookups"] == ("pizzas__toppings", "location")
+    assert kwargs["num_queries"] == 3
+    assert kwargs["num_rows"] == 2 + 6 + 18
+    assert kwargs["duration"] > 0
+    assert kwargs["prefetches"] == [
+        {"lookup": "pizzas", "num_queries": 1, "num_rows": 6},
+        {"lookup": "pizzas__toppings", "num_queries": 1, "num_rows": 18},
+    ]
+
+    # already evaluated
+    list(restaurants)
+    assert len(events) == 1
+
+
+def test_querysets_without_fetch_related_are_not_instrumented(events):
+    list(Restaurant.objects.all())
+
+    assert not events
+
+
+def test_strict_mode_violation(events):
+    restaurant = Restaurant.objects.strict().first()
+
+    with pytest.raises(RelatedObjectNeedsExplicitFetch):
+        restaurant.location
+
+    [(signal, sender, kwargs)] = events
+    assert signal is signals.strict_mode_violation
+    assert kwargs == {
+        "kind": "relation",
+        "relation": "Restaurant.location",
+        "raised": True,
+    }
+
+
+def test_recorded_strict_mode_violation(events):
+    restaurant = Restaurant.objects.strict(record=True).first()
+
+    restaurant.location
+
+    [(signal, sender, kwargs)] = events
+    assert kwargs == {
+        "kind": "relation",
+        "relation": "Restaurant.location",
+        "raised": False,
+    }
+
+
+def test_receivers_of_other_senders_do_not_instrument(monkeypatch):
+    def receiver(signal, sender, **kwargs):
+        pass
+
+    def instrument_fetch_related(qs):
+        raise AssertionError("instrumented for a receiver of another sender")
+
+    monkeypatch.setattr(mixins, "instrument_fetch_related", instrument_fetch_related)
+    for signal in (
+        signals.bulk_update_or_create_batch,
+        signals.fetch_related_executed,
+    ):
+        signal.connect(receiver, sender=Pizza)
+    try:
+        list(Restaurant.objects.fetch_related("location"))
+
+        batch_signal = signals.bulk_update_or_create_batch
+        assert not PhaseTimer(batch_signal, Restaurant, "default").enabled
+        assert PhaseTimer(batch_signal, Pizza, "default").enabled
+    finally:
+        for signal in (
+            signals.bulk_update_or_create_batch,
+            signals.fetch_related_executed,
+        ):
+            signal.disconnect(receiver, sender=Pizza)
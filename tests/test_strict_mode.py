@@ -1,3 +1,5 @@
+import copy
+
 import pytest
 from django.db.models import Sum, Prefetch
 from django_orm_plus.exceptions import (
@@ -99,6 +101,16 @@ def test_with_strict_mode_errors_when_additional_filtering_is_done():
         restaurants[0].userfavorite_set.filter(restaurant_id=1)[0].id
 
 
+def test_with_strict_mode_does_not_error_when_prefetching_filters():
+    restaurant = Restaurant.objects.strict().prefetch_related("userfavorite_set")[0]
+    favorites = restaurant.userfavorite_set.all()
+    # as Django filters the querysets it prefetches with, which can already
+    # have been fetched, eg. for fetch_related's nested lookups
+    favorites._strict_mode.is_for_prefetch = True
+
+    assert list(favorites.filter(restaurant_id=restaurant.pk)) == list(favorites)
+
+
 def test_with_strict_mode_does_not_error__reverse_lookup_then_fk_lookup():
     restaurants = (
         Restaurant.objects.all()
@@ -261,6 +273,46 @@ def test_strict_mode_is_propagated_to_child_prefetch_querysets():
         toppings[0].pizza_set.all()[0].name
 
 
+def test_strict_mode_prefetches_the_relation_of_every_instance():
+    expected = {
+        restaurant.pk: {pizza.pk for pizza in restaurant.pizzas.all()}
+        for restaurant in Restaurant.objects.all()
+    }
+
+    restaurants = Restaurant.objects.strict().prefetch_related("pizzas")
+    assert {
+        restaurant.pk: {pizza.pk for pizza in restaurant.pizzas.all()}
+        for restaurant in restaurants
+    } == expected
+
+
+def test_strict_mode_related_managers_are_cached_per_instance():
+    restaurant = Restaurant.objects.strict().prefetch_related("pizzas")[0]
+
+    assert restaurant.pizzas is restaurant.pizzas
+    assert restaurant.pizzas._strict_mode is restaurant.pizzas._strict_mode
+    assert copy.copy(restaurant).pizzas is not restaurant.pizzas
+    assert copy.copy(restaurant).pizzas.instance is not restaurant
+
+
+def test_strict_mode_related_managers_are_invalidated_with_the_prefetch_cache():
+    restaurant = Restaurant.objects.strict().prefetch_related("pizzas")[0]
+    manager = restaurant.pizzas
+    list(manager.all())
+
+    del restaurant._prefetched_objects_cache
+    assert restaurant.pizzas is not manager
+    with pytest.raises(RelatedObjectNeedsExplicitFetch, match="Restaurant.pizzas"):
+        list(restaurant.pizzas.all())
+
+
+def test_managers_do_not_override_attribute_access():
+    manager = Restaurant.objects.strict().prefetch_related("pizzas")[0].pizzas
+
+    for cls in type(manager).__mro__[:-1]:
+        assert "__getattribute__" not in cls.__dict__
+
+
 def test_strict_mode_does_not_propagate_to_non_strict_mode_relation():
     assert not hasattr(
         User.objects.strict().all().select_related("profile")[0].profile, "_autofetch"
@@ -0,0 +1,131 @@
+import logging
+import os
+
+import django
+import pytest
+from django.test import override_settings
+from django_orm_plus import _fetch_recorder
+from django_orm_plus.exceptions import RelatedObjectNeedsExplicitFetch
+from django_orm_plus.mixins import fetch_recorder
+
+from app.models import Restaurant, Topping
+
+from .factories import UserFavoriteFactory
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def create_base_objects():
+    for i in range(0, 2):
+        UserFavoriteFactory()
+
+
+@pytest.fixture(autouse=True)
+def clear_recorder():
+    fetch_recorder.clear()
+    yield
+    fetch_recorder.clear()
+
+
+def list_restaurants():
+    return list(Restaurant.objects.fetch_related("pizzas").strict(record=True))
+
+
+def test_lazy_loads_are_allowed_and_recorded(django_assert_num_queries):
+    restaurants = list_restaurants()
+
+    with django_assert_num_queries(2 + 6):
+        for restaurant in restaurants:
+            assert restaurant.location.city is not None
+            for pizza in restaurant.pizzas.all():
+                assert list(pizza.toppings.all())
+
+    (entry,) = fetch_recorder.get_report()
+    assert entry["model"] == "app.Restaurant"
+    assert entry["call_site"].endswith("in list_restaurants")
+    assert entry["fetch_related"] == ["location", "pizzas__toppings"]
+    assert [
+        (m["lookup"], m["count"], m["num_queries"]) for m in entry["missing_fetches"]
+    ] == [("location", 2, 2), ("pizzas__toppings", 6, 6)]
+    for missing_fetch in entry["missing_fetches"]:
+        (call_site,) = missing_fetch["call_sites"]
+        assert "test_strict_mode_record.py" in call_site
+
+
+def test_nested_paths_are_merged_into_the_deepest_lookup():
+    for restaurant in Restaurant.objects.strict(record=True):
+        for pizza in restaurant.pizzas.all():
+            list(pizza.toppings.all())
+
+    (entry,) = fetch_recorder.get_report()
+    assert entry["fetch_related"] == ["pizzas__toppings"]
+    assert [m["lookup"] for m in entry["missing_fetches"]] == [
+        "pizzas",
+        "pizzas__toppings",
+    ]
+
+
+def test_deferred_fields_are_recorded():
+    toppings = Topping.objects.only("id").strict(record=True)
+    assert toppings[0].name is not None
+
+    (entry,) = fetch_recorder.get_report()
+    assert entry["fetch_related"] == []
+    assert entry["deferred_fields"] == ["name"]
+
+
+def test_fetched_relations_are_not_recorded():
+    for restaurant in Restaurant.objects.fetch_related("location").strict(record=True):
+        assert restaurant.location.city is not None
+
+    assert fetch_recorder.get_report() == []
+
+
+def test_lazy_loads_are_logged(caplog):
+    with caplog.at_level(logging.WARNING, logger="django_orm_plus"):
+        Restaurant.objects.strict(record=True)[0].location
+
+    assert "Missing fetch of location from app.Restaurant" in caplog.text
+
+
+def test_format_report():
+    Restaurant.objects.strict(record=True)[0].location
+
+    report = fetch_recorder.format_report()
+    assert report.startswith("app.Restaurant queried at")
+    assert '    suggested: .fetch_related("location")' in report
+    assert "    location: 1 lazy loads, 1 queries" in report
+
+
+def test_record_mode_from_settings():
+    with override_settings(DJANGO_ORM_PLUS={"STRICT_MODE_RECORD": True}):
+        assert Restaurant.objects.strict()[0].location is not None
+
+    assert fetch_recorder.get_report()[0]["fetch_related"] == ["location"]
+
+
+def test_strict_mode_still_raises_without_record_mode():
+    with pytest.raises(RelatedObjectNeedsExplicitFetch):
+        Restaurant.objects.strict()[0].location
+    assert fetch_recorder.get_report() == []
+
+
+def test_call_site_skips_only_django_and_this_library():
+    django_dir = os.path.dirname(django.__file__)
+
+    assert f"{django_dir}{os.sep}db{os.sep}models.py".startswith(
+        _fetch_recorder._LIBRARY_PATHS
+    )
+    assert not f"{django_dir}_filters{os.sep}filters.py".startswith(
+        _fetch_recorder._LIBRARY_PATHS
+    )
+
+
+def test_paths_are_only_tracked_in_record_mode():
+    restaurant = Restaurant.objects.fetch_related("pizzas").strict()[0]
+    assert restaurant.pizzas._strict_mode.path == ()
+
+    restaurant = Restaurant.objects.fetch_related("pizzas").strict(record=True)[0]
+    assert restaurant.pizzas._strict_mode.path == ("pizzas",)